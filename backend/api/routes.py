@@ -1,19 +1,29 @@
 from itsdangerous import URLSafeSerializer
 import os
-from fastapi import APIRouter, File, UploadFile, HTTPException, Request, Response
-from services.lipsync_detector import LipSyncDetector
-from api.schemas import AnalysisResult, JobResponse
-from utils.storage import upload_to_storage
+from fastapi import APIRouter, File, Form, UploadFile, HTTPException, Request, Response, Query
+from fastapi.responses import JSONResponse
+from api.schemas import AnalysisResult, JobResponse, JobStatusResponse, DigestLookupRequest
+from api.uploads import read_upload_token
+from utils.storage_backends import archive_file_in_background, storage_backend
+from utils.ingest import ingest_upload, UploadTooLarge, IngestedMedia, MAX_UPLOAD_BYTES, MEDIA_MAJOR_TYPES
+from utils.result_cache import result_cache, make_cache_key
+from utils.result_store import job_store
 from utils.logger import logger
 from services.media_processor import MediaProcessor
-from services.vision_detector import VisionDetector
-from services.audio_detector import _global_detector as audio_detector
-from services.temporal_detector import TemporalDetector
-from services.fusion_engine import FusionEngine
-from services.explainability import ExplainabilityEngine
+from services.registry import detector_registry
+from services.pipeline import StageGraph
+from services.frame_decoder import SharedFrameDecoder
+from services.audio_track import SharedAudioTrack
+from services.audio_features import compute_audio_features
+from services.chunked_video import use_chunked_mode, analyze_video_chunks
+from utils.video_sampler import use_keyframe_mode
+from workers.job_runner import job_runner, JobProgress, JobQueueFull
+import asyncio
+from concurrent.futures import Future
 import uuid
 import time
 import traceback
+from typing import Optional
 
 
 SECRET_KEY = "super-secret-key-change-this"
@@ -73,119 +83,478 @@ def credits(request: Request, response: Response):
 
 router = APIRouter()
 
-job_results_cache = {}
-
 @router.post("/analyze", response_model=AnalysisResult)
-async def analyze_media(request: Request, response: Response, mode: str = "auto", file: UploadFile = File(...)):
+async def analyze_media(
+    request: Request,
+    response: Response,
+    mode: str = "auto",
+    async_mode: bool = Query(False, alias="async"),
+    file: Optional[UploadFile] = File(None),
+    upload_token: Optional[str] = Form(None),
+):
+  if file is None and not upload_token:
+    raise HTTPException(status_code=400, detail="Send the media as file, or an upload_token from /direct-uploads")
+  
+  if file is None:
+    # Charged inside, once the token and the stored object check out
+    return await analyze_direct_upload(upload_token, async_mode, request, response, mode)
+  
   if mode != "user":
     tokenRes = credits(request, response)
     logger.info(f"Credits after consumption: {tokenRes['credits_left']}")
   
+  # Stream the upload to disk: constant memory, hashed and sniffed as it arrives
+  try:
+      ingested = await ingest_upload(file)
+  except UploadTooLarge as e:
+      raise HTTPException(status_code=413, detail=str(e))
+  
+  return await analyze_ingested(ingested, async_mode, response)
+
+async def analyze_ingested(ingested: IngestedMedia, async_mode: bool, response: Response):
+  """Cache lookup, background archival and job submission for media already on local disk"""
   try:
-      content = await file.read()
+      content_type = ingested.content_type
+      
+      # Identical uploads are answered from the content-addressed cache without running any detector
+      cache_key = result_cache_key(ingested.sha256, content_type)
+      cached = serve_cached_result(cache_key)
+      if cached is not None:
+          ingested.cleanup()
+          job_id = cached["job_id"]
+          if async_mode:
+              return accepted(response, JobResponse(
+                  job_id=job_id,
+                  status="done",
+                  message="Result served from cache"
+              ))
+          return AnalysisResult(**cached)
       
       job_id = str(uuid.uuid4())
-      file_extension = file.filename.split('.')[-1] if '.' in file.filename else 'bin'
-      storage_path = f"{job_id}.{file_extension}"
+      storage_path = f"{job_id}.{ingested.extension}"
       
-      media_url = upload_to_storage(content, storage_path, file.content_type)
+      # Analysis works from the ingested local file; storage upload is archival and runs alongside.
+      # The job gets a placeholder future, filled once the upload starts
+      archive = Future()
       
+      progress = JobProgress(job_id, job_store)
       try:
-          result = process_media_sync(job_id, media_url, file.content_type)
-          job_results_cache[job_id] = result
-          return AnalysisResult(**result)
-      except Exception as e:
-          logger.error(f"Processing error: {str(e)}")
-          logger.error(traceback.format_exc())
-          job_results_cache[job_id] = {
-              "status": "error",
-              "error": str(e)
-          }
-          # Re-raise to be caught by outer exception handler or return error structure
-          raise e
+          future = job_runner.submit(
+              run_analysis_job, job_id, None, content_type, progress, cache_key, ingested, archive
+          )
+      except JobQueueFull as e:
+          # Nothing was archived for a job that never existed
+          job_store.delete(job_id)
+          ingested.cleanup()
+          raise HTTPException(status_code=503, detail=str(e))
+      
+      relay_future(archive_file_in_background(ingested.path, storage_path, content_type), archive)
+      return await respond_to_job(job_id, future, async_mode, response)
   
+  except HTTPException:
+      raise
   except Exception as e:
       logger.error(f"Error creating analysis job: {str(e)}")
       raise HTTPException(status_code=500, detail=str(e))
 
-def process_media_sync(job_id: str, media_url: str, content_type: str):
-    start_time = time.time()
+def relay_future(source: Future, target: Future):
+    """Settles target with source's outcome once source is done"""
+    def relay(done: Future):
+        if done.cancelled():
+            target.cancel()
+        elif done.exception() is not None:
+            target.set_exception(done.exception())
+        else:
+            target.set_result(done.result())
+    source.add_done_callback(relay)
+
+def result_cache_key(sha256: str, content_type: str) -> Optional[str]:
+    """None while detectors are still warming up: results are neither served from nor written to the cache"""
+    fingerprint = detector_registry.fingerprint()
+    if fingerprint is None:
+        return None
+    return make_cache_key(sha256, MediaProcessor.determine_type(content_type), fingerprint)
+
+def serve_cached_result(cache_key: Optional[str]):
+    """A cached result re-issued under a fresh job id (so /results works for it), or None on a miss"""
+    if cache_key is None:
+        return None
+    cached = result_cache.get(cache_key)
+    if cached is None:
+        return None
+    return reissue_cached_result(cached)
+
+def reissue_cached_result(cached: dict):
+    job_id = str(uuid.uuid4())
+    cached.update({"job_id": job_id, "cached": True})
+    job_store[job_id] = cached
+    logger.info(f"Result cache hit for job {job_id}")
+    return cached
+
+@router.post("/analyze/lookup", response_model=AnalysisResult)
+async def lookup_analysis(request: Request, response: Response, body: DigestLookupRequest, mode: str = "auto"):
+    """
+    Hash-first negotiation: the client sends the SHA-256 of the file before uploading it.
+    A hit returns the earlier analysis and the upload is skipped; a miss is a 404 and
+    costs nothing.
+    """
+    if detector_registry.fingerprint() is None:
+        raise HTTPException(status_code=503, detail="Detectors are warming up, retry shortly")
+    
+    cached = None
+    for content_type in lookup_content_types(body.content_type):
+        cached = result_cache.get(result_cache_key(body.sha256.lower(), content_type))
+        if cached is not None:
+            break
+    if cached is None:
+        raise HTTPException(status_code=404, detail="No analysis for this content, upload it")
+    
+    # Charged before the result is re-issued, so a 429 leaves no job behind
+    if mode != "user":
+        tokenRes = credits(request, response)
+        logger.info(f"Credits after consumption: {tokenRes['credits_left']}")
+    
+    return AnalysisResult(**reissue_cached_result(cached))
+
+def lookup_content_types(declared: str) -> list:
+    """
+    Content types an upload declared this way may have been cached under. Ingest keeps
+    the declared media kind (resolve_content_type), but sniffs one when the client
+    declared none, so a generic declaration could match any kind.
+    """
+    if (declared or "").split("/", 1)[0] in MEDIA_MAJOR_TYPES:
+        return [declared]
+    return [f"{major}/*" for major in MEDIA_MAJOR_TYPES]
+
+async def analyze_direct_upload(upload_token: str, async_mode: bool, request: Request, response: Response,
+                                mode: str = "auto"):
+    """Second step of a direct upload: the media is already in storage and the API never sees the bytes"""
+    claims = read_upload_token(upload_token)
+    if not claims:
+        raise HTTPException(status_code=403, detail="Invalid or expired upload token")
+    
+    job_id = claims["job_id"]
+    # Reserved atomically, so concurrent submits of one token can't both start the job
+    if not job_store.add(job_id, {"job_id": job_id, "status": "queued"}):
+        raise HTTPException(status_code=409, detail=f"Job {job_id} was already submitted")
     
     try:
-        logger.info(f"Processing media for job {job_id}")
+        stored = await storage_backend.stat(claims["key"])
+        if stored is None:
+            raise HTTPException(status_code=404, detail="Upload not found in storage, upload it before requesting analysis")
+        if stored["size"] > MAX_UPLOAD_BYTES:
+            # Presigned PUTs can't enforce the limit, so it is enforced here
+            await storage_backend.delete(stored["url"])
+            raise HTTPException(status_code=413, detail=f"Upload exceeds the {MAX_UPLOAD_BYTES} byte limit")
         
-        processor = MediaProcessor()
-        logger.info(f"Content-Type: {content_type}")
-        media_data = processor.process(media_url, content_type)
-        logger.info(f"Detected media type: {media_data['type']}")
+        # A bad token, a missing upload or an oversized one costs no credit
+        if mode != "user":
+            tokenRes = credits(request, response)
+            logger.info(f"Credits after consumption: {tokenRes['credits_left']}")
+        
+        progress = JobProgress(job_id, job_store)
+        try:
+            future = job_runner.submit(run_analysis_job, job_id, stored["url"], claims["content_type"], progress)
+        except JobQueueFull as e:
+            raise HTTPException(status_code=503, detail=str(e))
+    except BaseException:
+        # Free the reservation so the token can be submitted again
+        job_store.delete(job_id)
+        raise
+    
+    return await respond_to_job(job_id, future, async_mode, response)
+
+def accepted(response: Response, job: JobResponse) -> JSONResponse:
+    """
+    202 for a job. FastAPI drops the injected response's headers when a route returns
+    its own Response, so the credits cookie set on it is copied over.
+    """
+    reply = JSONResponse(status_code=202, content=job.model_dump())
+    for cookie in response.headers.getlist("set-cookie"):
+        reply.headers.append("set-cookie", cookie)
+    return reply
+
+async def respond_to_job(job_id: str, future: Future, async_mode: bool, response: Response):
+    if async_mode:
+        # Poll /results/{job_id} for progress and the final result
+        return accepted(response, JobResponse(
+            job_id=job_id,
+            status="queued",
+            message="Media uploaded successfully"
+        ))
+    
+    result = await asyncio.wrap_future(future)
+    return AnalysisResult(**result)
+
+def run_analysis_job(job_id: str, media_url: str, content_type: str, progress: JobProgress, cache_key: str = None,
+                     ingested: IngestedMedia = None, archive: Future = None):
+    """
+    Runs on the job runner pool and records the outcome in the job cache.
+    With an ingested file the pipeline reads it directly; archive is the pending
+    storage upload, awaited only to report the final media URL.
+    """
+    progress.start()
+    try:
+        local_path = ingested.path if ingested is not None else None
+        result = process_media_sync(job_id, media_url, content_type, progress, local_path)
+        if archive is not None:
+            try:
+                result["media_url"] = public_media_url(archive.result())
+            except Exception as e:
+                # The verdict stands without the archived copy
+                logger.error(f"Archiving media for job {job_id} failed: {str(e)}")
+        job_store[job_id] = result
+        if cache_key:
+            result_cache.put(cache_key, result)
+        return result
+    except Exception as e:
+        logger.error(f"Processing error: {str(e)}")
+        logger.error(traceback.format_exc())
+        job_store[job_id] = {
+            "job_id": job_id,
+            "status": "error",
+            "error": str(e)
+        }
+        raise
+    finally:
+        if ingested is not None:
+            if archive is not None:
+                # The staged file can only go once the archival upload has read it
+                archive.add_done_callback(lambda _: ingested.cleanup())
+            else:
+                ingested.cleanup()
+
+def build_analysis_graph(job_id: str, media_data: dict, progress: JobProgress) -> StageGraph:
+    """Wires the detector branches for one job: modalities in parallel, then fusion, then explainability"""
+    media_type = media_data["type"]
+    graph = StageGraph(name=f"job-{job_id[:8]}")
+    
+    def tracked(stage_name, fn):
+        def run(inputs):
+            with progress.stage(stage_name):
+                return fn(inputs)
+        return run
+    
+    def release(subscription):
+        # Cleanup for a consuming stage the graph never starts (an earlier stage failed)
+        return subscription.close if subscription is not None else None
+    
+    def consuming(subscription, fn):
+        # Release the subscription even if the detector bails out early, so decode never stalls
+        def run(inputs):
+            try:
+                return fn(inputs)
+            finally:
+                if subscription is not None:
+                    subscription.close()
+        return run
+    
+    # --- 0. SHARED VIDEO DECODE ---
+    # One pass over the file feeds vision, temporal and lipsync at their own sampling/resolution
+    subscriptions = {}
+    audio_track = None
+    audio_stream = None
+    video_path = media_data.get("video_path") or media_data.get("local_path")
+    frame_count = media_data.get("frame_count") or 0
+    # Long videos are split into chunks that worker processes analyze in parallel, end to end
+    chunked = media_type == "video" and bool(video_path) and use_chunked_mode(frame_count, media_data.get("fps"))
+    if chunked:
+        graph.add("chunks", tracked("chunks", lambda _: analyze_video_chunks(
+            video_path, frame_count, media_data["fps"]
+        )))
+    elif media_type == "video" and video_path:
+        # Very long uploads sample vision/temporal frames from keyframes only; reached only
+        # when chunked mode is disabled or its threshold is above KEYFRAME_ONLY_MIN_SECONDS
+        decoder = SharedFrameDecoder(
+            video_path,
+            keyframe_only=use_keyframe_mode(frame_count, media_data.get("fps"))
+        )
+        
+        vision_detector = detector_registry.vision
+        subscriptions["vision"] = decoder.subscribe(
+            "vision",
+            indices=vision_detector.sample_indices(frame_count),
+            max_height=vision_detector.VIDEO_MAX_HEIGHT,
+            allow_keyframes=True
+        )
+        temporal_detector = detector_registry.temporal
+        subscriptions["temporal"] = decoder.subscribe(
+            "temporal",
+            indices=temporal_detector.sample_indices(frame_count),
+            max_height=temporal_detector.FRAME_MAX_HEIGHT,
+            allow_keyframes=True
+        )
+        lipsync_detector = detector_registry.lipsync
+        if lipsync_detector.is_ready:
+            subscriptions["lipsync"] = decoder.subscribe(
+                "lipsync",
+                max_index=lipsync_detector.frame_limit(media_data.get("fps")) - 1
+            )
+        
+        graph.add("decode", lambda _: decoder.run())
+        
+        # Likewise one ffmpeg pass pipes the audio to both detectors: lipsync reads the
+        # buffered head, the audio detector streams the whole track window by window
+        audio_track = SharedAudioTrack(video_path, max_seconds=lipsync_detector.CHUNK_SECONDS)
+        audio_stream = audio_track.subscribe_stream()
+        graph.add("audio_extract", lambda _: audio_track.run())
+        # A single STFT of the buffered head gives onset flux, chroma and RMS to both detectors
+        def extract_audio_features(_):
+            try:
+                return compute_audio_features(audio_track.read(), audio_track.sample_rate)
+            except Exception as e:
+                logger.error(f"Audio feature extraction failed: {str(e)}")
+                return None
+        
+        graph.add("audio_features", extract_audio_features)
+    
+    # --- 1. VISION DETECTION ---
+    if chunked:
+        # The chunk stage already produced merged per-modality results
+        for name in ("vision", "temporal", "lipsync"):
+            graph.add(name, tracked(name, lambda inputs, name=name: inputs["chunks"][name]), deps=["chunks"])
+    elif media_type in ["image", "video"]:
+        frames = subscriptions.get("vision")
+        graph.add("vision", tracked("vision", consuming(
+            frames, lambda _: detector_registry.vision.detect(media_data, frames)
+        )), cleanup=release(frames))
+    
+    # --- 2. AUDIO DETECTION ---
+    if media_type in ["audio", "video"]:
+        # Determine path (handles extracted audio from video or raw audio files)
+        audio_path = media_data.get("audio_path") or media_data.get("video_path") or media_data.get("local_path")
+        # Audio uploads were decoded once by the media stage; hand the array over instead of the path
+        waveform = media_data.get("waveform")
+        audio_source = waveform if waveform is not None else audio_path
         
+        def analyze_audio(inputs):
+            if audio_track is not None:
+                return detector_registry.audio.analyze_audio(
+                    audio_stream, audio_track.sample_rate, inputs["audio_features"]
+                )
+            return detector_registry.audio.analyze_audio(audio_source, media_data.get("sample_rate"))
+        
+        graph.add(
+            "audio", tracked("audio", consuming(audio_stream, analyze_audio)),
+            deps=["audio_features"] if audio_track is not None else (),
+            cleanup=release(audio_stream)
+        )
+    
+    # --- 3. VIDEO SPECIFIC (TEMPORAL & LIPSYNC) ---
+    if media_type == "video" and not chunked:
+        temporal_frames = subscriptions.get("temporal")
+        graph.add("temporal", tracked("temporal", consuming(
+            temporal_frames, lambda _: detector_registry.temporal.detect(media_data, temporal_frames)
+        )), cleanup=release(temporal_frames))
+        lipsync_frames = subscriptions.get("lipsync")
+        graph.add("lipsync", tracked("lipsync", consuming(
+            lipsync_frames,
+            lambda inputs: detector_registry.lipsync.detect(media_data, lipsync_frames, inputs.get("audio_features"))
+        )), deps=["audio_features"] if audio_track is not None else (), cleanup=release(lipsync_frames))
+    
+    modality_stages = [name for name in ("vision", "audio", "temporal", "lipsync") if name in graph]
+    
+    # --- 4. FUSION (No default scores) ---
+    def fuse(results):
         modality_scores = {}
         explainability_data = {}
         
-        # --- 1. VISION DETECTION ---
-        if media_data["type"] in ["image", "video"]:
-            from utils.memory_manager import MemoryManager
-            
-            if media_data["type"] == "video":
-                MemoryManager.log_memory_usage("Starting video analysis: ")
-            
-            vision_detector = VisionDetector()
-            vision_result = vision_detector.detect(media_data)
+        if "vision" in results:
+            vision_result = results["vision"]
             modality_scores["vision"] = vision_result["score"]
             explainability_data["heatmap"] = vision_result.get("heatmap")
             explainability_data["manipulated_regions"] = vision_result.get("regions")
+            if vision_result.get("details"):
+                explainability_data["vision_details"] = vision_result["details"]
         
-        # --- 2. AUDIO DETECTION ---
-        if media_data["type"] in ["audio", "video"]:
-            # Use the global singleton imported as audio_detector
-            # Determine path (handles extracted audio from video or raw audio files)
-            audio_path = media_data.get("audio_path") or media_data.get("video_path") or media_data.get("local_path")
-            
-            audio_result = audio_detector.analyze_audio(audio_path)
-            
+        if "audio" in results:
+            audio_result = results["audio"]
             # Map score to 0-1 range
             modality_scores["audio"] = float(audio_result.get("fake_prob", 0.5))
             explainability_data["audio_metrics"] = audio_result.get("analysis_metrics", {})
-
-        # --- 3. VIDEO SPECIFIC (TEMPORAL & LIPSYNC) ---
-        if media_data["type"] == "video":
-            # A. Temporal Consistency
-            temporal_detector = TemporalDetector()
-            temporal_result = temporal_detector.detect(media_data)
+            explainability_data["audio_timeline"] = audio_result.get("timeline") or None
+        
+        if "temporal" in results:
+            temporal_result = results["temporal"]
             modality_scores["temporal"] = temporal_result["score"]
-            
             raw_timeline = temporal_result.get("timeline", [])
             explainability_data["anomalies_timeline"] = [
                 {"t": p["timestamp"], "score": p["score"]} for p in raw_timeline
             ] if raw_timeline else None
-
-            # B. LIPSYNC DETECTION (NEW) 👄
-            logger.info(f"Running LipSync analysis for job {job_id}")
-            lipsync_detector = LipSyncDetector()
-            # Pass media_data which contains the local_path
-            ls_result = lipsync_detector.detect(media_data)
-            
+        
+        if "lipsync" in results:
+            ls_result = results["lipsync"]
             modality_scores["lipsync"] = float(ls_result["score"])
             explainability_data["lipsync_details"] = ls_result.get("inconsistencies", {})
-
-        # --- 4. FUSION (No default scores) ---
+        
         if media_data.get("metadata_score") is not None and media_data.get("metadata_score") != 0.5:
             modality_scores["metadata"] = media_data.get("metadata_score")
             explainability_data["metadata_flags"] = media_data.get("metadata_flags", [])
         
         # The FusionEngine now receives only active detectors
-        fusion_engine = FusionEngine()
-        final_score, label = fusion_engine.fuse(modality_scores, media_data["type"])
-        
-        risk_level = "Low" if final_score < 0.3 else ("Medium" if final_score < 0.7 else "High")
-        
-        # --- 5. EXPLAINABILITY ---
-        explainability_engine = ExplainabilityEngine()
-        enhanced_explainability = explainability_engine.enhance(
+        final_score, label = detector_registry.fusion.fuse(modality_scores, media_type)
+        return {
+            "score": final_score,
+            "label": label,
+            "inputs": (modality_scores, explainability_data),
+        }
+    
+    graph.add("fusion", tracked("fusion", fuse), deps=modality_stages)
+    
+    # --- 5. EXPLAINABILITY ---
+    def explain(results):
+        modality_scores, explainability_data = results["fusion"]["inputs"]
+        return detector_registry.explainability.enhance(
             explainability_data,
             modality_scores,
             media_data
         )
+    
+    graph.add("explainability", tracked("explainability", explain), deps=["fusion"])
+    return graph
+
+def public_media_url(media_url: str):
+    """Path resolution for public URL"""
+    if media_url and media_url.startswith("file://"):
+        # Extract filename from file path (handles both ./temp_storage/file.mp4 and absolute paths)
+        file_path = media_url.replace("file://", "")
+        filename = os.path.basename(file_path)
+        return f"http://localhost:8000/uploads/{filename}"
+    return media_url
+
+def process_media_sync(job_id: str, media_url: str, content_type: str, progress: JobProgress = None,
+                       local_path: str = None):
+    start_time = time.time()
+    if progress is None:
+        progress = JobProgress(job_id, None)
+    
+    processor = MediaProcessor()
+    try:
+        logger.info(f"Processing media for job {job_id}")
+        
+        logger.info(f"Content-Type: {content_type}")
+        media_start = time.time()
+        with progress.stage("media"):
+            media_data = processor.process(media_url, content_type, local_path)
+        media_time_ms = int((time.time() - media_start) * 1000)
+        logger.info(f"Detected media type: {media_data['type']}")
+        progress.set_media_type(media_data["type"])
+        
+        if media_data["type"] == "video":
+            from utils.memory_manager import MemoryManager
+            MemoryManager.log_memory_usage("Starting video analysis: ")
+        
+        # Modality branches are independent until fusion, so they run concurrently
+        graph = build_analysis_graph(job_id, media_data, progress)
+        stage_results, stage_timings = graph.run()
+        stage_timings["media"] = media_time_ms
+        
+        modality_scores, _ = stage_results["fusion"]["inputs"]
+        final_score = stage_results["fusion"]["score"]
+        label = stage_results["fusion"]["label"]
+        enhanced_explainability = stage_results["explainability"]
+        
+        risk_level = "Low" if final_score < 0.3 else ("Medium" if final_score < 0.7 else "High")
         
         processing_time = int((time.time() - start_time) * 1000)
         
@@ -198,15 +567,8 @@ def process_media_sync(job_id: str, media_url: str, content_type: str):
         
         logger.info(f"Final scores for {media_data['type']}: {cleaned_scores}")
         logger.info(f"Final aggregated score: {final_score:.4f} ({label})")
+        logger.info(f"Stage wall times (ms) for job {job_id}: {stage_timings}")
         
-        # Path resolution for public URL
-        public_media_url = media_url
-        if media_url.startswith("file://"):
-            # Extract filename from file path (handles both ./temp_storage/file.mp4 and absolute paths)
-            file_path = media_url.replace("file://", "")
-            filename = os.path.basename(file_path)
-            public_media_url = f"http://localhost:8000/uploads/{filename}"
-
         return {
             "job_id": job_id,
             "label": label,
@@ -215,18 +577,23 @@ def process_media_sync(job_id: str, media_url: str, content_type: str):
             "modality_scores": cleaned_scores,
             "explainability": enhanced_explainability,
             "media_type": media_data["type"],
-            "media_url": public_media_url,
-            "processing_time_ms": processing_time
+            "media_url": public_media_url(media_url),
+            "processing_time_ms": processing_time,
+            "stage_timings_ms": stage_timings
         }
     
     except Exception as e:
         logger.error(f"Error analyzing job {job_id}: {str(e)}")
         logger.error(traceback.format_exc())
         raise
+    
+    finally:
+        # Copies fetched from storage (direct uploads); an ingested local_path is cleaned up by the caller
+        processor.cleanup()
 
 @router.get("/results/{job_id}", response_model=AnalysisResult)
 async def get_results(job_id: str):
-    result = job_results_cache.get(job_id)
+    result = job_store.get(job_id)
     
     if not result:
         raise HTTPException(status_code=404, detail="Job not found")
@@ -234,4 +601,7 @@ async def get_results(job_id: str):
     if result.get("status") == "error":
         raise HTTPException(status_code=500, detail=result.get("error"))
     
+    if result.get("status") in ("queued", "running"):
+        return JSONResponse(status_code=202, content=JobStatusResponse(**result).model_dump())
+    
     return AnalysisResult(**result)
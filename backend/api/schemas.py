@@ -6,6 +6,37 @@ class JobResponse(BaseModel):
     status: str
     message: str
 
+class DigestLookupRequest(BaseModel):
+    sha256: str = Field(..., pattern="^[0-9a-fA-F]{64}$", description="SHA-256 of the file contents, hex")
+    content_type: str
+
+class DirectUploadRequest(BaseModel):
+    filename: str
+    content_type: str
+    size: Optional[int] = Field(None, ge=0, description="Expected size in bytes, checked against the upload limit")
+
+class DirectUploadResponse(BaseModel):
+    job_id: str
+    upload_url: str
+    method: str = "PUT"
+    headers: Dict[str, str] = Field(default_factory=dict)
+    upload_token: str = Field(..., description="Pass to /analyze once the upload has finished")
+    expires_in: int
+
+class ResumableUploadResponse(BaseModel):
+    upload_id: str
+    offset: int = Field(..., description="Bytes received so far; the next chunk must start here")
+    size: Optional[int] = None
+    chunk_size: int = Field(..., description="Suggested chunk size in bytes")
+    expires_in: int
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    status: str = Field(..., description="queued, running, done or error")
+    stage: Optional[str] = None
+    progress: float = Field(0.0, ge=0.0, le=1.0)
+    stages: Dict[str, str] = Field(default_factory=dict)
+
 class ModalityScore(BaseModel):
     vision: Optional[float] = None
     audio: Optional[float] = None
@@ -18,6 +49,7 @@ class ExplainabilityData(BaseModel):
     anomalies_timeline: Optional[List[Dict[str, Any]]] = None
     manipulated_regions: Optional[List[Dict[str, Any]]] = None
     audio_inconsistencies: Optional[Dict[str, Any]] = None
+    audio_timeline: Optional[List[Dict[str, float]]] = None
     metadata_flags: Optional[List[str]] = None
     
     # Detailed per-modality metrics
@@ -36,3 +68,5 @@ class AnalysisResult(BaseModel):
     media_type: str
     media_url: Optional[str] = None
     processing_time_ms: Optional[int] = None
+    stage_timings_ms: Optional[Dict[str, int]] = None
+    cached: Optional[bool] = None
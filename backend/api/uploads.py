@@ -0,0 +1,178 @@
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+import os
+import uuid
+import time
+from fastapi import APIRouter, HTTPException, Request, Response, Query, Header
+from api.schemas import DirectUploadRequest, DirectUploadResponse, ResumableUploadResponse
+from utils.ingest import ingest_stream, UploadTooLarge, MAX_UPLOAD_BYTES, UPLOAD_CHUNK_BYTES
+from utils.resumable import (
+    resumable_uploads, UploadNotFound, OffsetMismatch, UploadBusy, UploadIncomplete
+)
+from utils.storage_backends import storage_backend
+from utils.logger import logger
+
+UPLOAD_TOKEN_SECRET = os.getenv("UPLOAD_TOKEN_SECRET", "super-secret-key-change-this")
+DIRECT_UPLOAD_EXPIRES_SECONDS = int(os.getenv("DIRECT_UPLOAD_EXPIRES_SECONDS", "900"))
+
+upload_serializer = URLSafeTimedSerializer(UPLOAD_TOKEN_SECRET, salt="direct-upload")
+
+router = APIRouter()
+
+
+def create_upload_token(job_id: str, key: str, content_type: str) -> str:
+    return upload_serializer.dumps({"job_id": job_id, "key": key, "content_type": content_type})
+
+
+def read_upload_token(token: str):
+    """Claims of a valid upload token, or None if it is forged or expired"""
+    try:
+        # The analysis may be requested a little after the upload URL itself expired
+        return upload_serializer.loads(token, max_age=DIRECT_UPLOAD_EXPIRES_SECONDS * 2)
+    except (BadSignature, SignatureExpired):
+        return None
+
+
+def _extension(filename: str) -> str:
+    return filename.rsplit(".", 1)[-1].lower() if "." in filename else "bin"
+
+
+@router.post("/direct-uploads", response_model=DirectUploadResponse)
+async def create_direct_upload(request: Request, body: DirectUploadRequest):
+    """
+    Step one of a direct upload: reserve a job id and hand out a URL the client
+    uploads the media to itself. Step two is /analyze with the upload token.
+    """
+    if body.size is not None and body.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds the {MAX_UPLOAD_BYTES} byte limit")
+
+    job_id = str(uuid.uuid4())
+    key = f"{job_id}.{_extension(body.filename)}"
+    token = create_upload_token(job_id, key, body.content_type)
+
+    target = storage_backend.presign_upload(key, body.content_type, DIRECT_UPLOAD_EXPIRES_SECONDS)
+    if target is None:
+        # Local storage, or S3 currently unreachable: the API takes the bytes itself
+        target = {
+            "url": f"{request.url_for('put_direct_upload', job_id=job_id)}?token={token}",
+            "method": "PUT",
+            "headers": {"Content-Type": body.content_type},
+        }
+
+    logger.info(f"Issued direct upload for job {job_id} ({storage_backend.name})")
+
+    return DirectUploadResponse(
+        job_id=job_id,
+        upload_url=target["url"],
+        method=target["method"],
+        headers=target["headers"],
+        upload_token=token,
+        expires_in=DIRECT_UPLOAD_EXPIRES_SECONDS,
+    )
+
+
+@router.put("/direct-uploads/{job_id}", name="put_direct_upload")
+async def put_direct_upload(job_id: str, request: Request, token: str = Query(...)):
+    """Upload target for backends without presigned URLs; streams the body to disk, then to storage"""
+    claims = read_upload_token(token)
+    if not claims or claims["job_id"] != job_id:
+        raise HTTPException(status_code=403, detail="Invalid or expired upload token")
+
+    try:
+        ingested = await ingest_stream(request.stream(), claims["key"], claims["content_type"])
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    try:
+        await storage_backend.upload(ingested.path, claims["key"], ingested.content_type)
+    finally:
+        ingested.cleanup()
+
+    return {"job_id": job_id, "size": ingested.size, "sha256": ingested.sha256}
+
+
+def _resumable_response(upload) -> ResumableUploadResponse:
+    return ResumableUploadResponse(
+        upload_id=upload.upload_id,
+        offset=upload.offset,
+        size=upload.size,
+        chunk_size=UPLOAD_CHUNK_BYTES * 8,
+        expires_in=max(0, int(upload.created_at + resumable_uploads.ttl_seconds - time.time())),
+    )
+
+
+def _get_upload(upload_id: str):
+    try:
+        return resumable_uploads.get(upload_id)
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired upload {upload_id}")
+
+
+@router.post("/resumable-uploads", response_model=ResumableUploadResponse, status_code=201)
+async def create_resumable_upload(body: DirectUploadRequest):
+    """
+    Starts a resumable upload. Send the media in pieces with PATCH, each carrying
+    an Upload-Offset header, then POST .../finalize to start the analysis.
+    """
+    try:
+        upload = resumable_uploads.create(body.filename, body.content_type, body.size)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return _resumable_response(upload)
+
+
+@router.head("/resumable-uploads/{upload_id}")
+async def head_resumable_upload(upload_id: str):
+    """Where to resume from after a dropped connection"""
+    upload = _get_upload(upload_id)
+    return Response(status_code=200, headers={"Upload-Offset": str(upload.offset), "Cache-Control": "no-store"})
+
+
+@router.get("/resumable-uploads/{upload_id}", response_model=ResumableUploadResponse)
+async def get_resumable_upload(upload_id: str):
+    return _resumable_response(_get_upload(upload_id))
+
+
+@router.patch("/resumable-uploads/{upload_id}")
+async def append_resumable_upload(upload_id: str, request: Request, upload_offset: int = Header(..., alias="Upload-Offset")):
+    """Appends the request body at Upload-Offset; anything received before a disconnect is kept"""
+    try:
+        offset = await resumable_uploads.append(upload_id, upload_offset, request.stream())
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired upload {upload_id}")
+    except OffsetMismatch as e:
+        return Response(status_code=409, headers={"Upload-Offset": str(e.expected)})
+    except UploadBusy as e:
+        raise HTTPException(status_code=423, detail=str(e))
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return Response(status_code=204, headers={"Upload-Offset": str(offset)})
+
+
+@router.post("/resumable-uploads/{upload_id}/finalize")
+async def finalize_resumable_upload(
+    upload_id: str,
+    request: Request,
+    response: Response,
+    mode: str = "auto",
+    async_mode: bool = Query(False, alias="async"),
+):
+    """Hands the assembled staging file to the analysis pipeline, same response as /analyze"""
+    # Imported here, the analysis routes depend on this module
+    from api.routes import analyze_ingested, credits
+
+    try:
+        # Credits are charged before the session is consumed, so a 429 leaves the upload
+        # in place to finalize later; nothing awaits between the check and finalize
+        resumable_uploads.check_complete(upload_id)
+        if mode != "user":
+            credits(request, response)
+        ingested = resumable_uploads.finalize(upload_id)
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired upload {upload_id}")
+    except UploadBusy as e:
+        raise HTTPException(status_code=423, detail=str(e))
+    except UploadIncomplete as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    logger.info(f"Finalized resumable upload {upload_id}: {ingested.size} bytes, sha256 {ingested.sha256[:12]}")
+    return await analyze_ingested(ingested, async_mode, response)
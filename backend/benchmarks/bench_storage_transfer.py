@@ -0,0 +1,103 @@
+"""
+Measures S3 upload/download throughput through utils/storage.py as file size
+and per-transfer concurrency grow.
+
+    python benchmarks/bench_storage_transfer.py --endpoint-url http://localhost:9000 \
+        --bucket bench --sizes 4 64 512 --concurrency 1 4 8 16
+
+Point --endpoint-url at a local S3 stand-in (MinIO, or `moto_server -p 5000`);
+with no endpoint and moto installed, an in-process moto server is started.
+Concurrency 1 is the old single-stream put_object/get_object behaviour.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.storage import make_client, make_transfer_config  # noqa: E402
+
+MB = 1024 * 1024
+
+
+def start_moto():
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError:
+        sys.exit("Pass --endpoint-url or install moto[server] for a local S3 stand-in")
+    server = ThreadedMotoServer(port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    return server, f"http://{host}:{port}"
+
+
+def make_file(path: str, size_mb: int):
+    # Random bytes so nothing along the way can compress them
+    with open(path, "wb") as f:
+        for _ in range(size_mb):
+            f.write(os.urandom(MB))
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint-url", default=os.getenv("AWS_S3_ENDPOINT_URL"))
+    parser.add_argument("--bucket", default="storage-bench")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[4, 64, 256], help="file sizes in MB")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--chunk-mb", type=int, default=8, help="multipart chunk size in MB")
+    args = parser.parse_args()
+
+    server = None
+    endpoint_url = args.endpoint_url
+    if not endpoint_url:
+        server, endpoint_url = start_moto()
+        os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+        os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+
+    client = make_client(max_pool_connections=max(args.concurrency) + 2, endpoint_url=endpoint_url)
+    try:
+        client.head_bucket(Bucket=args.bucket)
+    except Exception:
+        client.create_bucket(Bucket=args.bucket)
+
+    workdir = tempfile.mkdtemp(prefix="bench_storage_")
+    print(f"{'size_mb':>7} {'concurrency':>11} {'upload_s':>9} {'up_MB/s':>8} {'download_s':>10} {'down_MB/s':>9}")
+
+    try:
+        for size_mb in args.sizes:
+            src = os.path.join(workdir, f"src_{size_mb}.bin")
+            dest = os.path.join(workdir, f"dest_{size_mb}.bin")
+            make_file(src, size_mb)
+            key = f"bench/{size_mb}mb.bin"
+
+            for concurrency in args.concurrency:
+                if concurrency == 1:
+                    # Single stream, no multipart: the baseline
+                    config = make_transfer_config(max_concurrency=1, threshold=size_mb * MB + 1)
+                else:
+                    config = make_transfer_config(max_concurrency=concurrency, chunksize=args.chunk_mb * MB)
+
+                up = timed(lambda: client.upload_file(src, args.bucket, key, Config=config))
+                down = timed(lambda: client.download_file(args.bucket, key, dest, Config=config))
+                print(f"{size_mb:>7} {concurrency:>11} {up:>9.3f} {size_mb / up:>8.1f} {down:>10.3f} {size_mb / down:>9.1f}")
+
+                os.remove(dest)
+            client.delete_object(Bucket=args.bucket, Key=key)
+            os.remove(src)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        if server is not None:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
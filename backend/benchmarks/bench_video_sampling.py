@@ -0,0 +1,85 @@
+"""
+Compares the frame samplers in utils/video_sampler.py across clip lengths.
+
+    python benchmarks/bench_video_sampling.py --lengths 10 60 300 900 --frames 30
+
+Clips are synthesized with ffmpeg (libx264, long GOP) into a temp directory,
+so the seek-based sampler pays the same keyframe re-decode cost it does on
+real uploads.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.video_sampler import read_frames_seek, read_frames_sequential, read_keyframes  # noqa: E402
+
+
+def make_clip(path: str, seconds: int, fps: int, gop: int, size: str):
+    cmd = [
+        "ffmpeg", "-v", "error", "-y",
+        "-f", "lavfi", "-i", f"testsrc2=size={size}:rate={fps}:duration={seconds}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-g", str(gop),
+        "-pix_fmt", "yuv420p",
+        path,
+    ]
+    subprocess.run(cmd, check=True)
+
+
+def sample_indices(frame_count: int, max_frames: int):
+    sample_rate = max(1, frame_count // max_frames)
+    return list(range(0, frame_count, sample_rate))[:max_frames]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    count = sum(1 for _ in fn())
+    return time.perf_counter() - start, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 60, 300, 900], help="clip lengths in seconds")
+    parser.add_argument("--frames", type=int, default=30, help="frames sampled per clip")
+    parser.add_argument("--fps", type=int, default=25)
+    parser.add_argument("--gop", type=int, default=250, help="keyframe interval in frames")
+    parser.add_argument("--size", default="1280x720")
+    parser.add_argument("--max-height", type=int, default=360)
+    args = parser.parse_args()
+
+    if shutil.which("ffmpeg") is None:
+        sys.exit("ffmpeg is required to synthesize benchmark clips")
+
+    workdir = tempfile.mkdtemp(prefix="bench_sampling_")
+    print(f"{'length_s':>8} {'sampler':>12} {'frames':>7} {'seconds':>9} {'speedup':>8}")
+
+    try:
+        for seconds in args.lengths:
+            path = os.path.join(workdir, f"clip_{seconds}s.mp4")
+            make_clip(path, seconds, args.fps, args.gop, args.size)
+            indices = sample_indices(seconds * args.fps, args.frames)
+
+            samplers = [
+                ("seek", lambda: read_frames_seek(path, indices, args.max_height)),
+                ("sequential", lambda: read_frames_sequential(path, indices, args.max_height)),
+                ("keyframe", lambda: read_keyframes(path, args.frames, args.max_height)),
+            ]
+
+            baseline = None
+            for name, fn in samplers:
+                elapsed, count = timed(fn)
+                baseline = baseline or elapsed
+                print(f"{seconds:>8} {name:>12} {count:>7} {elapsed:>9.3f} {baseline / elapsed:>7.1f}x")
+
+            os.remove(path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
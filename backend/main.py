@@ -2,7 +2,14 @@ from fastapi import FastAPI, File, UploadFile, Request, Response, HTTPException
 from itsdangerous import URLSafeSerializer
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from api import routes
+from api import routes, uploads
+from services.registry import detector_registry
+from workers.job_runner import job_runner
+from utils.result_cache import result_cache
+from utils.vocals_cache import vocals_cache
+from services.chunked_video import shutdown_chunk_pool
+from utils.result_store import job_store
+from utils.storage_backends import storage_backend
 from utils.logger import logger
 import uvicorn
 
@@ -25,6 +32,7 @@ app.add_middleware(
 
 
 app.include_router(routes.router)
+app.include_router(uploads.router)
 
 SECRET_KEY = "super-secret-key-change-this"
 serializer = URLSafeSerializer(SECRET_KEY)
@@ -35,9 +43,11 @@ COOKIE_NAME = "credits_token"
 from fastapi.staticfiles import StaticFiles
 import os
 
-# Mount static files for local storage fallback
-os.makedirs("temp_storage", exist_ok=True)
-app.mount("/uploads", StaticFiles(directory="temp_storage"), name="uploads")
+from utils.storage_backends import LOCAL_STORAGE_DIR
+
+# Mount static files for the local storage backend
+os.makedirs(LOCAL_STORAGE_DIR, exist_ok=True)
+app.mount("/uploads", StaticFiles(directory=LOCAL_STORAGE_DIR), name="uploads")
 
 def create_token(credits: int):
     return serializer.dumps({"credits": credits})
@@ -48,6 +58,16 @@ def read_token(token: str):
     except Exception:
         return None
 
+@app.on_event("startup")
+async def warmup_detectors():
+    # Warm up in the background so /health answers while models load
+    detector_registry.warmup_in_background()
+
+@app.on_event("shutdown")
+async def stop_job_runner():
+    job_runner.shutdown()
+    shutdown_chunk_pool()
+
 @app.get("/")
 async def root():
     return {"message": "Deepfake Detection API", "status": "online"}
@@ -56,6 +76,24 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check():
+    status = detector_registry.status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content={"status": "warming_up", **status})
+    return {"status": "ready", **status}
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "storage": storage_backend.stats(),
+        "job_runner": job_runner.stats(),
+        "result_cache": result_cache.stats(),
+        "vocals_cache": vocals_cache.stats(),
+        "result_store": job_store.stats(),
+        "detectors": detector_registry.status(),
+    }
+
 @app.get("/me")
 def get_me(request: Request, response: Response, mode: str = "auto"):
     token = request.cookies.get(COOKIE_NAME)
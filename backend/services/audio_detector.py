@@ -7,7 +7,11 @@ import tempfile
 from urllib.parse import urlparse
 from transformers import Wav2Vec2ForSequenceClassification, Wav2Vec2FeatureExtractor
 import torch.nn.functional as F
+import itertools
 import warnings
+from services.audio_track import stream_pcm, sliding_windows
+from services.audio_features import AudioFeatures, compute_audio_features
+from utils.vocals_cache import vocals_cache, make_vocals_key
 
 # Suppress warnings
 warnings.filterwarnings("ignore")
@@ -15,13 +19,38 @@ warnings.filterwarnings("ignore")
 # Set longer timeout for HuggingFace downloads
 os.environ['HF_HUB_DOWNLOAD_TIMEOUT'] = '60'
 
+# Windowed scoring: the whole recording is covered, one batch of windows at a time
+AUDIO_WINDOW_SECONDS = float(os.getenv("AUDIO_WINDOW_SECONDS", "4"))
+AUDIO_WINDOW_HOP_SECONDS = float(os.getenv("AUDIO_WINDOW_HOP_SECONDS", "2"))
+# Audio per Wav2Vec2 forward pass; bounds activation memory
+AUDIO_BATCH_MAX_SECONDS = float(os.getenv("AUDIO_BATCH_MAX_SECONDS", "64"))
+# Longer recordings are scored up to this point; 0 scores everything
+AUDIO_MAX_SECONDS = float(os.getenv("AUDIO_MAX_SECONDS", "3600"))
+AUDIO_TOP_WINDOW_FRACTION = float(os.getenv("AUDIO_TOP_WINDOW_FRACTION", "0.1"))
+
+# Demucs vocal isolation: "speech" separates only the voice-active regions of the span
+# scored on vocals, "full" separates all of it, "off" skips Demucs
+DEMUCS_MODE = os.getenv("DEMUCS_MODE", "speech").lower()
+# Energy gate: frames more than AUDIO_VAD_TOP_DB below the loudest are treated as silence
+AUDIO_VAD_TOP_DB = float(os.getenv("AUDIO_VAD_TOP_DB", "35"))
+AUDIO_VAD_MIN_RMS = float(os.getenv("AUDIO_VAD_MIN_RMS", "0.003"))
+AUDIO_VAD_MIN_SECONDS = float(os.getenv("AUDIO_VAD_MIN_SECONDS", "0.3"))
+AUDIO_VAD_MERGE_SECONDS = float(os.getenv("AUDIO_VAD_MERGE_SECONDS", "0.5"))
+AUDIO_VAD_PAD_SECONDS = float(os.getenv("AUDIO_VAD_PAD_SECONDS", "0.1"))
+
 class AudioDeepfakeDetector:
     """
     Advanced Audio Deepfake Detector using:
     1. MelodyMachine fine-tuned model
     2. Spectral analysis heuristics
-    3. Optional Demucs vocal isolation (if available)
+    3. Optional Demucs vocal isolation (if available), gated on speech and cached
     """
+    MODEL_NAME = "MelodyMachine/Deepfake-audio-detection"
+    SAMPLE_RATE = 16000
+    # The spectral heuristics and Demucs look at this leading span only; it is also
+    # the span the shared audio features must cover for an audio-only job
+    HEAD_SECONDS = 10
+
     def __init__(self):
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         print(f"🔊 Audio Detector initializing on: {self.device.upper()}")
@@ -35,6 +64,9 @@ class AudioDeepfakeDetector:
         # Initialize Demucs (optional, for vocal isolation)
         self.demucs_model = None
         try:
+            if DEMUCS_MODE == "off":
+                raise RuntimeError("disabled by DEMUCS_MODE=off")
+
             # Set torch hub cache to our local directory
             demucs_cache = os.path.join(self.model_cache_dir, "demucs")
             os.makedirs(demucs_cache, exist_ok=True)
@@ -60,7 +92,7 @@ class AudioDeepfakeDetector:
 
         # Load main deepfake detection model
         try:
-            model_name = "MelodyMachine/Deepfake-audio-detection"
+            model_name = self.MODEL_NAME
             print(f"📂 Loading Audio Model: {model_name}")
             
             self.feature_extractor = Wav2Vec2FeatureExtractor.from_pretrained(
@@ -79,39 +111,111 @@ class AudioDeepfakeDetector:
             self.model = None
             self.feature_extractor = None
 
-    def analyze_audio(self, file_path: str) -> dict:
-        """Analyze audio file for deepfake detection."""
+    def warmup(self):
+        """Run one second of silence through Demucs and the Wav2Vec2 model"""
+        silence = np.zeros(16000, dtype=np.float32)
+        if self.demucs_model is not None:
+            try:
+                self._isolate_vocals(silence, 16000)
+            except Exception as e:
+                print(f"⚠️ Demucs warmup failed: {e}")
+        if self.model is not None and self.feature_extractor is not None:
+            inputs = self.feature_extractor(silence, sampling_rate=16000, return_tensors="pt", padding=True)
+            inputs = {k: v.to(self.device) for k, v in inputs.items()}
+            with torch.no_grad():
+                self.model(**inputs)
+
+    def iter_blocks(self, source, sr: int = None):
+        """
+        16 kHz mono float32 blocks from a waveform array (at sr), a media file path
+        (streamed through ffmpeg) or a SharedAudioTrack stream, up to AUDIO_MAX_SECONDS.
+        """
+        limit = int(AUDIO_MAX_SECONDS * self.SAMPLE_RATE) if AUDIO_MAX_SECONDS else None
+
+        if isinstance(source, np.ndarray):
+            y = source
+            if y.ndim > 1:
+                y = np.mean(y, axis=0)
+            if sr is not None and sr != self.SAMPLE_RATE:
+                y = librosa.resample(y, orig_sr=sr, target_sr=self.SAMPLE_RATE)
+            # Already in memory: one block, sliced rather than copied
+            yield np.asarray(y[:limit], dtype=np.float32)
+            return
+
+        if isinstance(source, str):
+            yield from stream_pcm(source, self.SAMPLE_RATE, max_seconds=AUDIO_MAX_SECONDS or None)
+            return
+
+        seen = 0
+        for _, block in source:
+            if limit is not None and seen + len(block) >= limit:
+                yield block[:limit - seen]
+                return
+            seen += len(block)
+            yield block
+
+    def _split_head(self, blocks):
+        """First HEAD_SECONDS as one array, plus an iterator that replays the whole stream"""
+        wanted = self.SAMPLE_RATE * self.HEAD_SECONDS
+        parts = []
+        have = 0
+        while have < wanted:
+            block = next(blocks, None)
+            if block is None:
+                break
+            parts.append(block)
+            have += len(block)
+
+        if not parts:
+            return np.zeros(0, dtype=np.float32), iter(())
+        head = parts[0][:wanted] if len(parts) == 1 else np.concatenate(parts)[:wanted]
+        return head, itertools.chain(parts, blocks)
+
+    def analyze_audio(self, source, sr: int = None, features: AudioFeatures = None) -> dict:
+        """
+        Analyze audio for deepfake detection. source is a waveform array at sr (default 16 kHz),
+        a media file path or a SharedAudioTrack stream. The model scores the whole recording in
+        overlapping windows; the heuristics and Demucs look at the first HEAD_SECONDS.
+        features are the job's shared STFT features; computed from the head when not given.
+        """
         try:
             # Load audio
-            y, sr = librosa.load(file_path, sr=16000, duration=10)
+            head, blocks = self._split_head(self.iter_blocks(source, sr))
+            if len(head) == 0:
+                raise ValueError("No audio track")
+            sr = self.SAMPLE_RATE
+            vocals = None
+            isolation = "No"
+            
+            # One STFT of the original audio feeds the heuristics and the speech gate
+            if features is None:
+                features = compute_audio_features(head, sr)
             
             # Optional: Use Demucs to isolate vocals
             if self.demucs_model is not None:
                 try:
-                    y = self._isolate_vocals(y, sr)
-                    print("✓ Vocals isolated using Demucs")
+                    vocals, isolation = self._vocals_for(head, sr, features)
+                    if vocals is not None:
+                        print(f"✓ Vocals isolated using Demucs ({isolation})")
                 except Exception as e:
                     print(f"⚠️ Vocal isolation failed: {e}. Using original audio.")
+                    isolation = "Failed"
             
             # LAYER 1: Spectral Flux Analysis
-            onset_env = librosa.onset.onset_strength(y=y, sr=sr)
+            onset_env = features.onset_strength(self.HEAD_SECONDS)
             flux_mean = np.mean(onset_env)
             flux_risk = 1.0 if flux_mean < 1.2 else 0.0
 
             # LAYER 2: Tonal Consistency Analysis
-            chroma = librosa.feature.chroma_cens(y=y, sr=sr)
+            chroma = features.chroma_cens(self.HEAD_SECONDS)
             chroma_std = np.std(chroma)
             tonal_risk = 1.0 if chroma_std < 0.25 else 0.0
 
-            # LAYER 3: Deep Learning Model
+            # LAYER 3: Deep Learning Model, window by window over the whole recording
+            timeline = []
             if self.model is not None and self.feature_extractor is not None:
-                inputs = self.feature_extractor(y, sampling_rate=16000, return_tensors="pt", padding=True)
-                inputs = {k: v.to(self.device) for k, v in inputs.items()}
-                
-                with torch.no_grad():
-                    logits = self.model(**inputs).logits
-                    probs = F.softmax(logits, dim=-1)
-                    ai_fake_score = probs[0][1].item()  # Class 1 = Fake
+                timeline = self._score_windows(blocks, vocals)
+                ai_fake_score = self._aggregate([point["score"] for point in timeline])
 
                 # Combine model + heuristics (70% model, 30% heuristics)
                 heuristic_score = (flux_risk + tonal_risk) / 2.0
@@ -126,11 +230,15 @@ class AudioDeepfakeDetector:
                 "label": "FAKE" if final_score > 0.5 else "REAL",
                 "fake_prob": float(final_score),
                 "confidence_percent": round(float(max(final_score, 1-final_score)) * 100, 2),
+                "timeline": timeline,
                 "analysis_metrics": {
                     "rhythm_fluidity": "Natural" if flux_mean > 1.2 else "Stiff/AI",
                     "tonal_consistency": "High (Suspect)" if chroma_std < 0.25 else "Normal",
                     "raw_ai_score": round(ai_fake_score, 3),
-                    "vocal_isolation": "Yes" if self.demucs_model else "No",
+                    "windows_scored": len(timeline),
+                    "peak_window_score": round(max((p["score"] for p in timeline), default=ai_fake_score), 3),
+                    "seconds_analyzed": timeline[-1]["end"] if timeline else round(len(head) / sr, 2),
+                    "vocal_isolation": isolation,
                     "mode": "MelodyMachine+Demucs+Heuristic" if self.demucs_model else "MelodyMachine+Heuristic"
                 }
             }
@@ -138,31 +246,153 @@ class AudioDeepfakeDetector:
         except Exception as e:
             return {"error": str(e), "fake_prob": 0.5}
 
-    def _isolate_vocals(self, audio, sr):
-        """Use Demucs to isolate vocal track."""
-        import torch.nn.functional as F_torch
-        
-        # Prepare audio for Demucs (stereo required)
-        if len(audio.shape) == 1:
-            audio_stereo = np.stack([audio, audio])
-        else:
-            audio_stereo = audio
-        
-        # Convert to tensor
-        audio_tensor = torch.from_numpy(audio_stereo).float().unsqueeze(0).to(self.device)
+    def _score_windows(self, blocks, vocals=None) -> list:
+        """
+        Overlapping windows through Wav2Vec2 in batches of at most AUDIO_BATCH_MAX_SECONDS
+        of audio; only the current batch is held, so memory does not grow with length.
+        """
+        sr = self.SAMPLE_RATE
+        window = int(AUDIO_WINDOW_SECONDS * sr)
+        hop = int(AUDIO_WINDOW_HOP_SECONDS * sr)
+        batch_size = max(1, int(AUDIO_BATCH_MAX_SECONDS // AUDIO_WINDOW_SECONDS))
+
+        timeline = []
+        batch = []
+        for start, w in sliding_windows(blocks, window, hop, min_tail=sr):
+            if vocals is not None and start + len(w) <= len(vocals):
+                # Windows inside the head are scored on the isolated vocals, as the single pass was
+                w = vocals[start:start + len(w)]
+            if len(w) != window:
+                # A short tail gets its own pass; zero padding would skew its score
+                if batch:
+                    timeline += self._score_batch(batch)
+                    batch = []
+                timeline += self._score_batch([(start, w)])
+                continue
+            batch.append((start, w))
+            if len(batch) == batch_size:
+                timeline += self._score_batch(batch)
+                batch = []
+
+        if batch:
+            timeline += self._score_batch(batch)
+        return timeline
+
+    def _score_batch(self, batch) -> list:
+        sr = self.SAMPLE_RATE
+        inputs = self.feature_extractor(
+            [w for _, w in batch], sampling_rate=sr, return_tensors="pt", padding=True
+        )
+        inputs = {k: v.to(self.device) for k, v in inputs.items()}
         
-        # Run Demucs
         with torch.no_grad():
-            sources = self.demucs_model(audio_tensor)
-        
-        # Extract vocals (index 3 for htdemucs)
-        vocals = sources[0, 3].cpu().numpy()
+            probs = F.softmax(self.model(**inputs).logits, dim=-1)[:, 1].cpu().numpy()  # Class 1 = Fake
         
-        # Convert back to mono
-        if len(vocals.shape) > 1:
-            vocals = np.mean(vocals, axis=0)
-        
-        return vocals
+        return [
+            {"t": round(start / sr, 2), "end": round((start + len(w)) / sr, 2), "score": float(p)}
+            for (start, w), p in zip(batch, probs)
+        ]
+
+    @staticmethod
+    def _aggregate(scores: list) -> float:
+        """Mean of the top AUDIO_TOP_WINDOW_FRACTION of windows, so a short spliced section is not averaged away"""
+        if not scores:
+            return 0.5
+        k = max(1, int(np.ceil(len(scores) * AUDIO_TOP_WINDOW_FRACTION)))
+        return float(np.mean(sorted(scores, reverse=True)[:k]))
+
+    def _vocals_for(self, y, sr, features: AudioFeatures):
+        """
+        Vocal stem for y and how it was obtained. Cached by the content hash of y;
+        in speech mode only voice-active regions are separated and the rest stays
+        silent, as it would in a vocal stem. Returns (None, reason) when nothing needed separating.
+        """
+        vad_config = "|".join(str(v) for v in (
+            AUDIO_VAD_TOP_DB, AUDIO_VAD_MIN_RMS, AUDIO_VAD_MIN_SECONDS, AUDIO_VAD_MERGE_SECONDS, AUDIO_VAD_PAD_SECONDS
+        ))
+        key = make_vocals_key(y, sr, f"htdemucs|{DEMUCS_MODE}|{vad_config}")
+        vocals = vocals_cache.get(key)
+        if vocals is not None:
+            return vocals, "Cached"
+
+        if DEMUCS_MODE == "full":
+            vocals = self._isolate_vocals(y, sr)
+            isolation = "Full"
+        else:
+            regions = self._speech_regions(features, len(y))
+            if not regions:
+                return None, "No speech"
+            # One Demucs pass over the regions back to back: htdemucs pads every call to its
+            # ~7.8s training segment, so separating regions one by one costs a full pass each
+            separated = self._isolate_vocals(np.concatenate([y[start:end] for start, end in regions]), sr)
+            vocals = np.zeros(len(y), dtype=np.float32)
+            offset = 0
+            for start, end in regions:
+                vocals[start:end] = separated[offset:offset + end - start]
+                offset += end - start
+            isolation = f"Speech regions ({offset / sr:.1f}s)"
+
+        vocals_cache.put(key, vocals)
+        return vocals, isolation
+
+    def _speech_regions(self, features: AudioFeatures, num_samples: int) -> list:
+        """
+        Voice-activity gate on the shared RMS energy: (start, end) sample spans of the
+        first num_samples loud enough to hold speech, padded and merged
+        """
+        sr = features.sample_rate
+        rms = features.rms_energy(num_samples / sr)
+        if len(rms) == 0 or float(np.max(rms)) < AUDIO_VAD_MIN_RMS:
+            return []
+
+        pad = int(AUDIO_VAD_PAD_SECONDS * sr)
+        merge_gap = int(AUDIO_VAD_MERGE_SECONDS * sr)
+        min_len = int(AUDIO_VAD_MIN_SECONDS * sr)
+        hop = features.hop_length
+
+        # Runs of frames within AUDIO_VAD_TOP_DB of the loudest one
+        active = librosa.amplitude_to_db(rms, ref=np.max) > -AUDIO_VAD_TOP_DB
+        edges = np.flatnonzero(np.diff(np.concatenate([[0], active.astype(np.int8), [0]])))
+
+        regions = []
+        for start_frame, end_frame in zip(edges[0::2], edges[1::2]):
+            start = max(0, int(start_frame) * hop - pad)
+            end = min(num_samples, int(end_frame) * hop + pad)
+            if regions and start - regions[-1][1] <= merge_gap:
+                regions[-1][1] = end
+            else:
+                regions.append([start, end])
+        return [(start, end) for start, end in regions if end - start >= min_len]
+
+    def _isolate_vocals(self, audio, sr):
+        """Vocal stem of mono audio at sr, same length. Demucs itself runs at model.samplerate."""
+        from demucs.apply import apply_model
+
+        model_sr = self.demucs_model.samplerate
+        mix = librosa.resample(audio, orig_sr=sr, target_sr=model_sr) if sr != model_sr else audio
+
+        # htdemucs is a stereo model; it cannot take one channel
+        wav = torch.from_numpy(np.stack([mix, mix])).float()
+        # Normalized the way demucs' own separate does
+        ref = wav.mean(0)
+        mean, std = ref.mean(), ref.std() + 1e-8
+        wav = (wav - mean) / std
+
+        # apply_model splits into training-length segments; calling the model directly
+        # fails on the BagOfModels that get_model('htdemucs') returns
+        with torch.no_grad():
+            sources = apply_model(self.demucs_model, wav[None], device=self.device, split=True, overlap=0.25,
+                                  progress=False)[0]
+        sources = sources * std + mean
+
+        vocals = sources[self.demucs_model.sources.index("vocals")].mean(0).cpu().numpy()
+        if sr != model_sr:
+            vocals = librosa.resample(vocals, orig_sr=model_sr, target_sr=sr)
+
+        # Resampling can be a sample off either way
+        out = np.zeros(len(audio), dtype=np.float32)
+        out[:min(len(audio), len(vocals))] = vocals[:len(audio)]
+        return out
 
 # Initialize global instance
 _global_detector = AudioDeepfakeDetector()
@@ -176,6 +406,11 @@ class AudioDetector:
         Detect deepfakes in audio files.
         Handles local paths and URLs automatically.
         """
+        # Audio uploads arrive already decoded by the media stage
+        if media_data.get("waveform") is not None:
+            result = _global_detector.analyze_audio(media_data["waveform"], media_data.get("sample_rate"))
+            return self._format(result)
+        
         input_path = media_data.get("file_path") or media_data.get("local_path") or media_data.get("url")
         
         # Handle file:// prefix
@@ -199,33 +434,9 @@ class AudioDetector:
             if not os.path.exists(input_path):
                 return {"score": 0.5, "inconsistencies": {"error": f"File not found: {input_path}"}}
 
-            # Run analysis
+            # Run analysis; the file (audio or video) is streamed through ffmpeg
             result = _global_detector.analyze_audio(input_path)
-            fake_score = result.get("fake_prob", 0.5)
-            
-            # Format output
-            inconsistencies = {}
-            if fake_score > 0.55:
-                inconsistencies = {
-                    "detected": True,
-                    "severity": "High" if fake_score > 0.8 else "Medium",
-                    "description": "Synthetic audio artifacts detected matching Deepfake signatures.",
-                    "confidence": result.get("confidence_percent"),
-                    "details": {
-                        "fake_probability": round(fake_score, 4),
-                        "real_probability": round(1 - fake_score, 4)
-                    }
-                }
-            else:
-                inconsistencies = {
-                    "detected": False,
-                    "status": "Audio appears authentic based on spectral analysis."
-                }
-
-            return {
-                "score": fake_score,
-                "inconsistencies": inconsistencies
-            }
+            return self._format(result)
 
         except Exception as e:
             print(f"AudioDetector Error: {e}")
@@ -239,6 +450,33 @@ class AudioDetector:
                 except:
                     pass
 
+    def _format(self, result: dict) -> dict:
+        fake_score = result.get("fake_prob", 0.5)
+        
+        # Format output
+        inconsistencies = {}
+        if fake_score > 0.55:
+            inconsistencies = {
+                "detected": True,
+                "severity": "High" if fake_score > 0.8 else "Medium",
+                "description": "Synthetic audio artifacts detected matching Deepfake signatures.",
+                "confidence": result.get("confidence_percent"),
+                "details": {
+                    "fake_probability": round(fake_score, 4),
+                    "real_probability": round(1 - fake_score, 4)
+                }
+            }
+        else:
+            inconsistencies = {
+                "detected": False,
+                "status": "Audio appears authentic based on spectral analysis."
+            }
+
+        return {
+            "score": fake_score,
+            "inconsistencies": inconsistencies
+        }
+
     def _is_url(self, path: str) -> bool:
         """Check if path is a URL."""
         try:
@@ -0,0 +1,76 @@
+import numpy as np
+import librosa
+import scipy.ndimage
+import scipy.signal
+
+# librosa's defaults for onset_strength and chroma, so the shared STFT matches what they built themselves
+STFT_N_FFT = 2048
+STFT_HOP_LENGTH = 512
+CENS_QUANT_STEPS = (0.4, 0.2, 0.1, 0.05)
+CENS_SMOOTH_FRAMES = 41
+
+
+class AudioFeatures:
+    """
+    Onset flux, chroma and RMS energy of one audio span, all derived from a single
+    STFT. Detectors slice the leading part they need instead of recomputing transforms.
+    """
+
+    def __init__(self, onset_env: np.ndarray, chroma: np.ndarray, rms: np.ndarray, sample_rate: int,
+                 hop_length: int = STFT_HOP_LENGTH):
+        self.onset_env = onset_env
+        self.chroma = chroma
+        self.rms = rms
+        self.sample_rate = sample_rate
+        self.hop_length = hop_length
+
+    @property
+    def frame_rate(self) -> float:
+        return self.sample_rate / self.hop_length
+
+    @property
+    def duration(self) -> float:
+        return len(self.rms) / self.frame_rate
+
+    def _frames(self, seconds: float = None) -> int:
+        return len(self.rms) if seconds is None else max(1, int(np.ceil(seconds * self.frame_rate)))
+
+    def onset_strength(self, seconds: float = None) -> np.ndarray:
+        return self.onset_env[:self._frames(seconds)]
+
+    def chroma_cens(self, seconds: float = None) -> np.ndarray:
+        """Chroma Energy Normalized Statistics, computed from the STFT chroma the way librosa does from a CQT"""
+        chroma = librosa.util.normalize(self.chroma[:, :self._frames(seconds)], norm=1, axis=0)
+
+        quantized = np.zeros_like(chroma)
+        for step in CENS_QUANT_STEPS:
+            quantized += (chroma > step) * 0.25
+
+        window = scipy.signal.get_window("hann", CENS_SMOOTH_FRAMES + 2, fftbins=False)
+        window /= np.sum(window)
+        smoothed = scipy.ndimage.convolve(quantized, window[np.newaxis, :], mode="constant")
+        return librosa.util.normalize(smoothed, norm=2, axis=0)
+
+    def rms_energy(self, seconds: float = None) -> np.ndarray:
+        return self.rms[:self._frames(seconds)]
+
+    def rms_at(self, times: np.ndarray) -> np.ndarray:
+        """RMS energy interpolated at arbitrary timestamps, e.g. one value per video frame"""
+        frame_times = librosa.frames_to_time(np.arange(len(self.rms)), sr=self.sample_rate, hop_length=self.hop_length)
+        return np.interp(times, frame_times, self.rms)
+
+
+def compute_audio_features(y: np.ndarray, sample_rate: int):
+    """One STFT of y and every feature derived from it; None when there is no audio"""
+    if y is None or len(y) == 0:
+        return None
+
+    magnitude = np.abs(librosa.stft(y, n_fft=STFT_N_FFT, hop_length=STFT_HOP_LENGTH))
+    power = magnitude ** 2
+
+    mel = librosa.feature.melspectrogram(S=power, sr=sample_rate)
+    onset_env = librosa.onset.onset_strength(S=librosa.power_to_db(mel), sr=sample_rate)
+    chroma = librosa.feature.chroma_stft(S=power, sr=sample_rate)
+    rms = librosa.feature.rms(S=magnitude, frame_length=STFT_N_FFT)[0]
+
+    return AudioFeatures(onset_env, chroma, rms, sample_rate)
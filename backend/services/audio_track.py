@@ -0,0 +1,172 @@
+import os
+import subprocess
+import threading
+import numpy as np
+from services.frame_decoder import FrameSubscription
+from utils.logger import logger
+
+AUDIO_TRACK_SAMPLE_RATE = 16000
+AUDIO_TRACK_READ_BYTES = int(os.getenv("AUDIO_TRACK_READ_BYTES", str(64 * 1024)))
+
+
+def _ffmpeg_pcm_command(path: str, sample_rate: int, max_seconds: float = None, start_seconds: float = 0) -> list:
+    cmd = ["ffmpeg", "-v", "error", "-nostdin"]
+    if start_seconds:
+        # Input seek: ffmpeg jumps to the nearest keyframe instead of decoding up to it
+        cmd += ["-ss", str(start_seconds)]
+    cmd += [
+        "-i", path,
+        "-map", "0:a:0",
+        "-ac", "1",
+        "-ar", str(sample_rate),
+    ]
+    if max_seconds:
+        cmd += ["-t", str(max_seconds)]
+    return cmd + ["-f", "f32le", "pipe:1"]
+
+
+def stream_pcm(path: str, sample_rate: int = AUDIO_TRACK_SAMPLE_RATE, max_seconds: float = None,
+               block_bytes: int = AUDIO_TRACK_READ_BYTES, start_seconds: float = 0):
+    """
+    Yields the first audio stream of any ffmpeg-readable file as mono float32 blocks.
+    Only one block is held at a time, so memory does not grow with duration.
+    """
+    # Whole samples per read, so a block never splits a float
+    block_bytes -= block_bytes % 4
+    process = subprocess.Popen(
+        _ffmpeg_pcm_command(path, sample_rate, max_seconds, start_seconds), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    try:
+        while True:
+            chunk = process.stdout.read(block_bytes)
+            if not chunk:
+                break
+            yield np.frombuffer(chunk[:len(chunk) - len(chunk) % 4], dtype="<f4")
+    finally:
+        process.stdout.close()
+        process.kill()
+        process.wait()
+
+
+def sliding_windows(blocks, window: int, hop: int, min_tail: int = 0):
+    """
+    Cuts a stream of sample blocks into (start_sample, window) pairs, `hop` apart.
+    Holds at most one window plus one block. The trailing partial window is kept
+    if it has at least min_tail samples, or if it is the only window.
+    """
+    pending = np.zeros(0, dtype=np.float32)
+    start = 0
+    emitted = 0
+
+    for block in blocks:
+        pending = np.concatenate([pending, block]) if len(pending) else block
+        while len(pending) >= window:
+            yield start, pending[:window]
+            emitted += 1
+            pending = pending[hop:]
+            start += hop
+
+    # Whatever is left was either covered by the previous window's overlap or is a short tail
+    covered = window - hop if emitted else 0
+    if len(pending) > covered and (len(pending) >= min_tail or emitted == 0):
+        yield start, pending
+
+
+class SharedAudioTrack:
+    """
+    Decodes the audio stream of a video once and shares it between detectors.
+    ffmpeg pipes 16 kHz mono float32 PCM into a preallocated buffer, so
+    nothing is written to disk; readers block only until the span they asked for
+    has been decoded (or the stream ended) and get a view, not a copy.
+    Consumers that need the whole track subscribe to a block stream instead; the
+    head buffer stays max_seconds long however long the video is.
+    """
+
+    def __init__(self, video_path: str, max_seconds: float, sample_rate: int = AUDIO_TRACK_SAMPLE_RATE,
+                 start_seconds: float = 0):
+        self.video_path = video_path
+        self.max_seconds = max_seconds
+        self.start_seconds = start_seconds
+        self.sample_rate = sample_rate
+        self._buffer = np.zeros(int(max_seconds * sample_rate), dtype="<f4")
+        self._samples = 0
+        self._finished = False
+        self._cond = threading.Condition()
+        self._streams = []
+        self.stream_limit_seconds = None
+
+    @property
+    def samples(self) -> int:
+        return self._samples
+
+    @property
+    def has_audio(self) -> bool:
+        """Only meaningful once decoding has finished"""
+        return self.samples > 0
+
+    def subscribe_stream(self, max_seconds: float = None, queue_size: int = None) -> FrameSubscription:
+        """
+        Full-length stream of (start_sample, block) pairs. A slow consumer holds back
+        the decode through the bounded queue rather than buffering the track.
+        """
+        if queue_size is None:
+            # Room for the whole head, so readers of the head never wait on a stream consumer
+            queue_size = self._buffer.nbytes // (AUDIO_TRACK_READ_BYTES - AUDIO_TRACK_READ_BYTES % 4) + 4
+        subscription = FrameSubscription("audio-stream", queue_size=queue_size)
+        self._streams.append(subscription)
+        if max_seconds:
+            self.stream_limit_seconds = max(self.stream_limit_seconds or 0, max_seconds)
+        return subscription
+
+    def run(self) -> dict:
+        streams = list(self._streams)
+        # Without stream subscribers only the head is decoded; with them, up to their limit (if any)
+        limit = self.max_seconds
+        if streams:
+            limit = max(self.stream_limit_seconds, self.max_seconds) if self.stream_limit_seconds else None
+        capacity = len(self._buffer)
+        position = 0
+
+        try:
+            for block in stream_pcm(self.video_path, self.sample_rate, max_seconds=limit,
+                                    start_seconds=self.start_seconds):
+                if self._samples < capacity:
+                    head = block[:capacity - self._samples]
+                    self._buffer[self._samples:self._samples + len(head)] = head
+                    with self._cond:
+                        self._samples += len(head)
+                        self._cond.notify_all()
+
+                open_streams = [s for s in streams if not s.closed]
+                for subscription in open_streams:
+                    subscription.put(position, block)
+                position += len(block)
+
+                if self._samples >= capacity and not open_streams:
+                    break
+        except Exception as e:
+            logger.error(f"Audio track decode error: {str(e)}")
+        finally:
+            with self._cond:
+                self._finished = True
+                self._cond.notify_all()
+            for subscription in streams:
+                subscription.finish()
+
+        if not self.has_audio:
+            logger.info(f"No audio track decoded from {self.video_path}")
+        else:
+            logger.info(f"Audio track decoded once: {position / self.sample_rate:.1f}s at {self.sample_rate} Hz")
+        return {"samples": position, "seconds": round(position / self.sample_rate, 2)}
+
+    def read(self, seconds: float = None) -> np.ndarray:
+        """First `seconds` of audio (all of the head by default); empty when the video has no audio"""
+        wanted = len(self._buffer) if seconds is None else min(len(self._buffer), int(seconds * self.sample_rate))
+        with self._cond:
+            self._cond.wait_for(lambda: self._finished or self.samples >= wanted)
+            return self._buffer[:min(wanted, self.samples)]
+
+    def decode(self, seconds: float = None) -> np.ndarray:
+        """Runs the extraction in the calling thread; for callers outside the stage graph"""
+        self.run()
+        return self.read(seconds)
@@ -0,0 +1,284 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from utils.logger import logger
+
+# Videos at least this long are split into chunks analyzed in parallel processes (0 disables).
+# Takes precedence over KEYFRAME_ONLY_MIN_SECONDS: keyframe-only sampling only applies to videos
+# this mode does not take, i.e. with chunking disabled or set above the keyframe threshold
+LONG_VIDEO_MIN_SECONDS = float(os.getenv("LONG_VIDEO_MIN_SECONDS", "120"))
+VIDEO_CHUNK_SECONDS = float(os.getenv("VIDEO_CHUNK_SECONDS", "30"))
+# Very long videos get longer chunks rather than more of them
+VIDEO_CHUNK_MAX_CHUNKS = int(os.getenv("VIDEO_CHUNK_MAX_CHUNKS", "120"))
+# Every worker process loads its own vision/temporal/lipsync models
+VIDEO_CHUNK_WORKERS = int(os.getenv("VIDEO_CHUNK_WORKERS", str(max(1, min(4, (os.cpu_count() or 2) // 2)))))
+# Share of highest-scoring chunks averaged into a global score, so one bad segment is not averaged away
+VIDEO_CHUNK_TOP_FRACTION = float(os.getenv("VIDEO_CHUNK_TOP_FRACTION", "0.25"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def use_chunked_mode(frame_count: int, fps: float) -> bool:
+    """Whether a video is long enough to be analyzed chunk by chunk"""
+    if LONG_VIDEO_MIN_SECONDS <= 0 or not fps or not frame_count:
+        return False
+    return frame_count / fps >= LONG_VIDEO_MIN_SECONDS
+
+
+def plan_chunks(frame_count: int, fps: float) -> list:
+    """(start_frame, end_frame) spans covering the whole video"""
+    chunk_seconds = max(VIDEO_CHUNK_SECONDS, frame_count / fps / max(1, VIDEO_CHUNK_MAX_CHUNKS))
+    chunk_frames = max(1, int(round(chunk_seconds * fps)))
+    chunks = [(start, min(frame_count, start + chunk_frames)) for start in range(0, frame_count, chunk_frames)]
+
+    # A short tail is folded into the chunk before it
+    if len(chunks) > 1 and chunks[-1][1] - chunks[-1][0] < chunk_frames // 3:
+        tail = chunks.pop()
+        chunks[-1] = (chunks[-1][0], tail[1])
+    return chunks
+
+
+def _init_chunk_worker(threads: int):
+    """Runs once in each pool process: torch and OpenCV otherwise each use every core"""
+    import cv2
+    import torch
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(threads)
+
+
+def get_chunk_pool() -> ProcessPoolExecutor:
+    """
+    Process pool shared by all jobs, so each worker loads its models once.
+    Spawned rather than forked: the parent holds CUDA and decoder state that must not be inherited.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Each worker gets its share of the cores, so the workers don't oversubscribe them
+            threads = max(1, (os.cpu_count() or 1) // VIDEO_CHUNK_WORKERS)
+            _pool = ProcessPoolExecutor(
+                max_workers=VIDEO_CHUNK_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_chunk_worker,
+                initargs=(threads,)
+            )
+            logger.info(f"Started chunk pool with {VIDEO_CHUNK_WORKERS} worker processes")
+        return _pool
+
+
+def shutdown_chunk_pool():
+    """App shutdown only: cancels every job's pending chunks"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _discard_broken_pool(pool: ProcessPoolExecutor):
+    """
+    Drops a pool a worker died in, so the next job starts a fresh one. Every job saw
+    the same broken pool; only the first to get here replaces it, and nothing else
+    is cancelled (a broken pool fails its own futures, a new one is left alone).
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def analyze_chunk(video_path: str, start_frame: int, end_frame: int, fps: float) -> dict:
+    """
+    Runs in a pool process: vision, temporal and lipsync over frames [start_frame, end_frame),
+    fed by one decode of that span and one extraction of its audio.
+    """
+    # Imported here so the parent never loads the models just by importing this module
+    from services.registry import detector_registry
+    from services.frame_decoder import SharedFrameDecoder
+    from services.audio_track import SharedAudioTrack
+    from services.audio_features import compute_audio_features
+    from services.pipeline import StageGraph
+
+    frame_count = end_frame - start_frame
+    start_seconds = start_frame / fps
+    media_data = {
+        "type": "video",
+        "video_path": video_path,
+        "local_path": video_path,
+        "fps": fps,
+        "frame_count": frame_count,
+    }
+
+    vision = detector_registry.vision
+    temporal = detector_registry.temporal
+    lipsync = detector_registry.lipsync
+
+    decoder = SharedFrameDecoder(video_path, start_frame=start_frame)
+    vision_frames = decoder.subscribe(
+        "vision",
+        indices=[start_frame + i for i in vision.sample_indices(frame_count)],
+        max_height=vision.VIDEO_MAX_HEIGHT
+    )
+    temporal_frames = decoder.subscribe(
+        "temporal",
+        indices=[start_frame + i for i in temporal.sample_indices(frame_count)],
+        max_height=temporal.FRAME_MAX_HEIGHT
+    )
+    # Lipsync covers the whole chunk, not just its first CHUNK_SECONDS, so chunks
+    # stretched past VIDEO_CHUNK_SECONDS on very long videos leave no gaps
+    lipsync_frames = None
+    if lipsync.is_ready:
+        lipsync_frames = decoder.subscribe("lipsync", max_index=end_frame - 1)
+    audio_track = SharedAudioTrack(video_path, max_seconds=frame_count / fps, start_seconds=start_seconds)
+
+    def consuming(subscription, fn):
+        def run(inputs):
+            try:
+                return fn(inputs)
+            finally:
+                if subscription is not None:
+                    subscription.close()
+        return run
+
+    def extract_audio_features(_):
+        try:
+            return compute_audio_features(audio_track.read(), audio_track.sample_rate)
+        except Exception as e:
+            logger.error(f"Chunk audio feature extraction failed: {str(e)}")
+            return None
+
+    graph = StageGraph(name=f"chunk-{start_frame}")
+    graph.add("decode", lambda _: decoder.run())
+    graph.add("audio_extract", lambda _: audio_track.run())
+    graph.add("audio_features", extract_audio_features)
+    graph.add("vision", consuming(vision_frames, lambda _: vision.detect(media_data, vision_frames)),
+              cleanup=vision_frames.close)
+    graph.add("temporal", consuming(temporal_frames, lambda _: temporal.detect(media_data, temporal_frames)),
+              cleanup=temporal_frames.close)
+    graph.add("lipsync", consuming(
+        lipsync_frames, lambda inputs: lipsync.detect(media_data, lipsync_frames, inputs["audio_features"])
+    ), deps=["audio_features"], cleanup=lipsync_frames.close if lipsync_frames is not None else None)
+    results, timings = graph.run()
+
+    # Chunk-relative timestamps are shifted onto the video's timeline here
+    temporal_timeline = [
+        {**point, "timestamp": point["timestamp"] + start_seconds, "frame_index": point["frame_index"] + start_frame}
+        for point in results["temporal"].get("timeline") or []
+    ]
+    lipsync_details = results["lipsync"].get("inconsistencies", {})
+    lipsync_timeline = [
+        {**point, "t": round(point["t"] + start_seconds, 2), "end": round(point["end"] + start_seconds, 2)}
+        for point in lipsync_details.get("timeline") or []
+    ]
+
+    # Which detectors actually saw something; a 0.5 from a missing face or an
+    # unloaded model must not be merged as if it were a real score
+    signal = {
+        "vision": results["vision"].get("label") not in ("unknown", "error"),
+        "temporal": results["temporal"].get("timeline") is not None,
+        "lipsync": not any(key in lipsync_details for key in ("no_signal", "warning", "error")),
+    }
+
+    return {
+        "start": round(start_seconds, 2),
+        "end": round(end_frame / fps, 2),
+        "vision": float(results["vision"]["score"]),
+        "temporal": float(results["temporal"]["score"]),
+        "lipsync": float(results["lipsync"]["score"]),
+        "temporal_timeline": temporal_timeline,
+        "lipsync_timeline": lipsync_timeline,
+        "lipsync_offset_ms": lipsync_details.get("offset_ms"),
+        "signal": signal,
+        "timings_ms": timings,
+    }
+
+
+def merge_chunk_scores(results: list, modality: str) -> float:
+    """
+    Mean of the top VIDEO_CHUNK_TOP_FRACTION of one modality's chunk scores.
+    Chunks where that detector had no signal (e.g. no face in the span) are left out.
+    """
+    scores = [r[modality] for r in results if r["signal"][modality]]
+    if not scores:
+        return 0.5
+    k = max(1, int(np.ceil(len(scores) * VIDEO_CHUNK_TOP_FRACTION)))
+    return float(np.mean(sorted(scores, reverse=True)[:k]))
+
+
+def analyze_video_chunks(video_path: str, frame_count: int, fps: float) -> dict:
+    """
+    Fans the chunks of a long video out over the process pool and merges them into
+    per-modality results shaped like the single-pass detectors' output.
+    """
+    chunks = plan_chunks(frame_count, fps)
+    logger.info(
+        f"Chunked video analysis: {len(chunks)} chunks of ~{(chunks[0][1] - chunks[0][0]) / fps:.0f}s "
+        f"over {VIDEO_CHUNK_WORKERS} processes"
+    )
+
+    pool = get_chunk_pool()
+    futures = [pool.submit(analyze_chunk, video_path, start, end, fps) for start, end in chunks]
+
+    results = []
+    failed = 0
+    for (start, end), future in zip(chunks, futures):
+        try:
+            results.append(future.result())
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); the next job gets a fresh pool
+            _discard_broken_pool(pool)
+            raise
+        except Exception as e:
+            failed += 1
+            logger.error(f"Chunk {start}-{end} failed: {str(e)}")
+
+    if not results:
+        raise RuntimeError("Every video chunk failed")
+
+    per_chunk = [
+        {
+            "t": r["start"],
+            "end": r["end"],
+            # None where the detector had no signal in that chunk
+            **{name: round(r[name], 4) if r["signal"][name] else None for name in ("vision", "temporal", "lipsync")},
+        }
+        for r in results
+    ]
+    details = {"mode": "chunked", "chunks": len(chunks), "failed_chunks": failed}
+    vision_score = merge_chunk_scores(results, "vision")
+    temporal_score = merge_chunk_scores(results, "temporal")
+    lipsync_score = merge_chunk_scores(results, "lipsync")
+
+    # Same scalar as the single-pass detector: the median lag over chunks that found one
+    chunk_offsets = [r["lipsync_offset_ms"] for r in results]
+    found_offsets = [offset for offset in chunk_offsets if offset is not None]
+    offset_ms = int(round(np.median(found_offsets))) if found_offsets else None
+
+    return {
+        "vision": {
+            "score": vision_score,
+            "label": "fake" if vision_score > 0.5 else "real",
+            "heatmap": None,
+            "regions": [],
+            "details": {**details, "timeline": per_chunk},
+        },
+        "temporal": {
+            "score": temporal_score,
+            "timeline": [point for r in results for point in r["temporal_timeline"]],
+        },
+        "lipsync": {
+            "score": lipsync_score,
+            "inconsistencies": {
+                **details,
+                "detected": lipsync_score > 0.75,
+                "offset_ms": offset_ms,
+                "chunk_offsets_ms": chunk_offsets,
+                "timeline": [point for r in results for point in r["lipsync_timeline"]],
+            },
+        },
+    }
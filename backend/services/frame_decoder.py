@@ -0,0 +1,198 @@
+import queue
+import threading
+import cv2
+from utils.logger import logger
+from utils.video_sampler import resize_to_height, read_keyframes
+
+_END = object()
+
+
+class FrameSubscription:
+    """
+    A detector's view of the shared decode pass.
+    Frames arrive as (frame_index, frame) tuples through a bounded queue, so a
+    slow consumer applies back-pressure instead of buffering the whole video.
+    """
+
+    def __init__(self, name: str, indices=None, max_index: int = None, max_height: int = None,
+                 allow_keyframes: bool = False, queue_size: int = 32):
+        self.name = name
+        # Sparse samplers (vision, temporal) can be served from keyframes on very long videos
+        self.allow_keyframes = allow_keyframes and indices is not None
+        self.indices = sorted(set(indices)) if indices is not None else None
+        self._wanted = set(self.indices) if self.indices is not None else None
+        self.max_height = max_height
+
+        if self.indices is not None:
+            self.last_index = self.indices[-1] if self.indices else -1
+        else:
+            self.last_index = max_index if max_index is not None else float("inf")
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._closed = threading.Event()
+        self.delivered = 0
+
+    def wants(self, index: int) -> bool:
+        if self._closed.is_set() or index > self.last_index:
+            return False
+        return self._wanted is None or index in self._wanted
+
+    @property
+    def closed(self) -> bool:
+        return self._closed.is_set()
+
+    def put(self, index: int, frame):
+        # Block while the consumer catches up, but give up once it has closed
+        while not self._closed.is_set():
+            try:
+                self._queue.put((index, frame), timeout=0.1)
+                self.delivered += 1
+                return
+            except queue.Full:
+                continue
+
+    def finish(self):
+        while not self._closed.is_set():
+            try:
+                self._queue.put(_END, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def close(self):
+        """Called by the consumer when it no longer wants frames"""
+        self._closed.set()
+
+    def __iter__(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _END:
+                    return
+                yield item
+        finally:
+            self.close()
+
+    def collect(self) -> list:
+        return [frame for _, frame in self]
+
+
+class SharedFrameDecoder:
+    """
+    Walks a video file once and fans frames out to every subscribed detector,
+    each at the sampling and resolution it asked for.
+    Frames nobody wants are grab()-bed but never retrieved. In keyframe-only
+    mode, subscribers that allow it are fed from a keyframe-only decode instead
+    and the sequential walk stops as soon as the remaining subscribers are done.
+    """
+
+    def __init__(self, video_path: str, keyframe_only: bool = False, start_frame: int = 0):
+        self.video_path = video_path
+        self.keyframe_only = keyframe_only
+        # Chunk workers walk only their own span; indices stay absolute
+        self.start_frame = start_frame
+        self._subscriptions = []
+        self.frames_decoded = 0
+        self.frames_retrieved = 0
+        self.keyframes_decoded = 0
+
+    def subscribe(self, name: str, indices=None, max_index: int = None, max_height: int = None,
+                  allow_keyframes: bool = False) -> FrameSubscription:
+        subscription = FrameSubscription(
+            name,
+            indices=indices,
+            max_index=max_index,
+            max_height=max_height,
+            allow_keyframes=allow_keyframes
+        )
+        self._subscriptions.append(subscription)
+        return subscription
+
+    def run(self):
+        subscriptions = list(self._subscriptions)
+        keyframe_subs = [s for s in subscriptions if self.keyframe_only and s.allow_keyframes]
+        sequential_subs = [s for s in subscriptions if s not in keyframe_subs]
+
+        try:
+            if keyframe_subs:
+                self._run_keyframes(keyframe_subs)
+            if sequential_subs:
+                self._run_sequential(sequential_subs)
+        except Exception as e:
+            logger.error(f"Shared frame decode error: {str(e)}")
+        finally:
+            for subscription in subscriptions:
+                subscription.finish()
+
+        logger.info(
+            f"Shared decode for {[s.name for s in subscriptions]}: "
+            f"{self.frames_decoded} frames walked, {self.frames_retrieved} retrieved, "
+            f"{self.keyframes_decoded} keyframes"
+        )
+        return {
+            "frames_decoded": self.frames_decoded,
+            "frames_retrieved": self.frames_retrieved,
+            "keyframes_decoded": self.keyframes_decoded,
+        }
+
+    def _run_sequential(self, subscriptions):
+        cap = cv2.VideoCapture(self.video_path)
+        index = 0
+        if self.start_frame:
+            # A single seek to the start of the span, then the usual forward walk
+            cap.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame)
+            index = self.start_frame
+
+        try:
+            while True:
+                active = [s for s in subscriptions if not s.closed and s.last_index >= index]
+                if not active:
+                    break
+
+                if not cap.grab():
+                    break
+                self.frames_decoded += 1
+
+                wanting = [s for s in active if s.wants(index)]
+                if wanting:
+                    ret, frame = cap.retrieve()
+                    if ret:
+                        self.frames_retrieved += 1
+                        self._deliver(wanting, index, frame)
+
+                index += 1
+        finally:
+            cap.release()
+
+    def _run_keyframes(self, subscriptions):
+        # One keyframe pass at the densest sampling and largest resolution, shared by all subscribers
+        max_frames = max(len(s.indices) for s in subscriptions)
+        heights = [s.max_height for s in subscriptions]
+        max_height = None if None in heights else max(heights)
+
+        keyframes = list(read_keyframes(self.video_path, max_frames=max_frames, max_height=max_height))
+        self.keyframes_decoded = len(keyframes)
+
+        for subscription in subscriptions:
+            wanted = len(subscription.indices)
+            if wanted == 0:
+                continue
+            if len(keyframes) > wanted:
+                step = len(keyframes) / wanted
+                picked = [keyframes[int(i * step)] for i in range(wanted)]
+            else:
+                picked = keyframes
+            for index, frame in picked:
+                if subscription.closed:
+                    break
+                subscription.put(index, resize_to_height(frame, subscription.max_height))
+
+    @staticmethod
+    def _deliver(subscriptions, index, frame):
+        # Resize once per distinct target height and share it between subscribers
+        resized = {}
+        for subscription in subscriptions:
+            key = subscription.max_height
+            if key not in resized:
+                resized[key] = resize_to_height(frame, key)
+            subscription.put(index, resized[key])
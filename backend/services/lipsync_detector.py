@@ -1,20 +1,179 @@
 import os
 import cv2
 import numpy as np
-import librosa
-from moviepy import VideoFileClip
-from scipy.stats import pearsonr
-import tempfile
+import threading
 import urllib.request
 import warnings
+from services.audio_track import SharedAudioTrack
+from services.audio_features import AudioFeatures, compute_audio_features
 
 warnings.filterwarnings("ignore")
 
+# Distinguishes "no shared features were handed over" from "the video has no audio" (None)
+_NOT_SHARED = object()
+
+# Face tracking: full Haar detection only every N frames (or when tracking is lost), on a downscaled frame
+LIPSYNC_DETECT_EVERY = int(os.getenv("LIPSYNC_DETECT_EVERY", "15"))
+LIPSYNC_DETECT_WIDTH = int(os.getenv("LIPSYNC_DETECT_WIDTH", "480"))
+# Template-match score below which the tracked box is distrusted and the face re-detected
+LIPSYNC_TRACK_MIN_SCORE = float(os.getenv("LIPSYNC_TRACK_MIN_SCORE", "0.6"))
+# Mean absolute pixel change under which the face patch counts as unchanged and the box is reused
+LIPSYNC_STILL_DIFF = float(os.getenv("LIPSYNC_STILL_DIFF", "2.0"))
+
+# Sync scoring: audio/video offsets searched up to this far, timeline windows of this length
+LIPSYNC_MAX_LAG_SECONDS = float(os.getenv("LIPSYNC_MAX_LAG_SECONDS", "0.5"))
+LIPSYNC_WINDOW_SECONDS = float(os.getenv("LIPSYNC_WINDOW_SECONDS", "2"))
+LIPSYNC_WINDOW_HOP_SECONDS = float(os.getenv("LIPSYNC_WINDOW_HOP_SECONDS", "1"))
+
+
+def _window_sums(values, window: int, starts):
+    cumulative = np.concatenate([[0.0], np.cumsum(values)])
+    return cumulative[starts + window] - cumulative[starts]
+
+
+def _pearson(n, sx, sy, sxx, syy, sxy):
+    """Pearson r from running sums; 0 where either side is constant"""
+    cov = n * sxy - sx * sy
+    var = (n * sxx - sx * sx) * (n * syy - sy * sy)
+    valid = var > 1e-12
+    return np.where(valid, cov / np.sqrt(np.where(valid, var, 1.0)), 0.0)
+
+
+def lagged_sync(mouth, energy, max_lag: int, window: int, hop: int) -> dict:
+    """
+    Pearson correlation of mouth[i] with energy[i + k] for every lag k in
+    [-max_lag, max_lag], all from one FFT cross-correlation plus prefix sums,
+    then a per-window correlation at the best lag. Positive lag: audio trails video.
+    """
+    x = np.asarray(mouth, dtype=np.float64)
+    y = np.asarray(energy, dtype=np.float64)
+    n = len(x)
+    max_lag = max(0, min(max_lag, n // 2))
+    lags = np.arange(-max_lag, max_lag + 1)
+
+    # Cross sums for every lag at once; zero padding to 2n keeps the circular wrap out
+    nfft = 1 << int(np.ceil(np.log2(2 * n)))
+    cross = np.fft.irfft(np.conj(np.fft.rfft(x, nfft)) * np.fft.rfft(y, nfft), nfft)
+    sxy = cross[lags % nfft]
+
+    # Overlap of the two series at each lag, as prefix-sum bounds
+    x_start, x_end = np.maximum(0, -lags), np.minimum(n, n - lags)
+    y_start, y_end = x_start + lags, x_end + lags
+    count = (x_end - x_start).astype(np.float64)
+
+    cx, cxx = np.concatenate([[0.0], np.cumsum(x)]), np.concatenate([[0.0], np.cumsum(x * x)])
+    cy, cyy = np.concatenate([[0.0], np.cumsum(y)]), np.concatenate([[0.0], np.cumsum(y * y)])
+    correlations = _pearson(
+        count,
+        cx[x_end] - cx[x_start], cy[y_end] - cy[y_start],
+        cxx[x_end] - cxx[x_start], cyy[y_end] - cyy[y_start],
+        sxy
+    )
+
+    best = int(np.argmax(correlations))
+    best_lag = int(lags[best])
+
+    # Sliding windows over the series aligned at the best lag
+    xs = x[max(0, -best_lag):min(n, n - best_lag)]
+    ys = y[max(0, best_lag):min(n, n + best_lag)]
+    window = min(window, len(xs))
+    starts = np.arange(0, len(xs) - window + 1, max(1, hop))
+    window_corr = _pearson(
+        float(window),
+        _window_sums(xs, window, starts), _window_sums(ys, window, starts),
+        _window_sums(xs * xs, window, starts), _window_sums(ys * ys, window, starts),
+        _window_sums(xs * ys, window, starts)
+    )
+
+    return {
+        "correlation": float(correlations[best]),
+        "zero_lag_correlation": float(correlations[max_lag]),
+        "lag": best_lag,
+        # Window starts are in mouth-frame indices
+        "windows": [(int(s) + max(0, -best_lag), float(c)) for s, c in zip(starts, window_corr)],
+    }
+
+
+class FaceTracker:
+    """
+    Follows one face box across frames. Haar detection runs on a downscaled frame
+    every detect_every frames, or as soon as tracking confidence drops; in between
+    the previous face patch is template-matched in a small search window, and the
+    box is reused as is while the patch does not change. Cost follows face motion
+    rather than frame count.
+    """
+
+    def __init__(self, face_detector, detect_every: int = LIPSYNC_DETECT_EVERY,
+                 detect_width: int = LIPSYNC_DETECT_WIDTH, min_score: float = LIPSYNC_TRACK_MIN_SCORE):
+        self.face_detector = face_detector
+        self.detect_every = max(1, detect_every)
+        self.detect_width = detect_width
+        self.min_score = min_score
+        self.box = None
+        self._template = None
+        self._since_detect = 0
+        self.detections = 0
+        self.tracked = 0
+        self.reused = 0
+
+    def update(self, gray):
+        """Face box (x, y, w, h) in this frame, or None"""
+        if self.box is None or self._since_detect >= self.detect_every:
+            return self._detect(gray)
+
+        x, y, w, h = self.box
+        patch = gray[y:y + h, x:x + w]
+        if patch.shape == self._template.shape and cv2.absdiff(patch, self._template).mean() < LIPSYNC_STILL_DIFF:
+            self._since_detect += 1
+            self.reused += 1
+            return self.box
+
+        # Search the box grown by half its size on each side
+        x0, y0 = max(0, x - w // 2), max(0, y - h // 2)
+        x1, y1 = min(gray.shape[1], x + w + w // 2), min(gray.shape[0], y + h + h // 2)
+        region = gray[y0:y1, x0:x1]
+        if region.shape[0] < h or region.shape[1] < w:
+            return self._detect(gray)
+
+        _, score, _, (dx, dy) = cv2.minMaxLoc(cv2.matchTemplate(region, self._template, cv2.TM_CCOEFF_NORMED))
+        if score < self.min_score:
+            return self._detect(gray)
+
+        self.box = (x0 + dx, y0 + dy, w, h)
+        self._template = gray[y0 + dy:y0 + dy + h, x0 + dx:x0 + dx + w].copy()
+        self._since_detect += 1
+        self.tracked += 1
+        return self.box
+
+    def _detect(self, gray):
+        self._since_detect = 0
+        self.detections += 1
+
+        scale = min(1.0, self.detect_width / gray.shape[1])
+        small = gray if scale == 1.0 else cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        faces = self.face_detector.detectMultiScale(small, 1.3, 5)
+        if len(faces) == 0:
+            self.box = None
+            self._template = None
+            return None
+
+        # Largest face, mapped back to full resolution
+        x, y, w, h = (int(round(v / scale)) for v in max(faces, key=lambda f: f[2] * f[3]))
+        w, h = min(w, gray.shape[1] - x), min(h, gray.shape[0] - y)
+        self.box = (x, y, w, h)
+        self._template = gray[y:y + h, x:x + w].copy()
+        return self.box
+
 class LipSyncDetector:
+    # Only the first 30 seconds are analyzed
+    CHUNK_SECONDS = 30
+
     def __init__(self):
         print("⏳ Initializing Native OpenCV LipSync...")
         self.model_url = "https://github.com/kurnianggoro/GSOC2017/raw/master/data/lbfmodel.yaml"
         self.model_path = os.path.join(os.getcwd(), "lbfmodel.yaml")
+        # The LBF facemark is stateful; the instance is shared across concurrent jobs
+        self._lock = threading.Lock()
         
         if not os.path.exists(self.model_path):
             print("⬇️ Downloading Face Model (Standard OpenCV)...")
@@ -33,8 +192,27 @@ class LipSyncDetector:
             print(f"⚠️ Init Error: {e}")
             self.is_ready = False
 
-    def detect(self, media_data: dict) -> dict:
+    def warmup(self):
+        """Run the Haar cascade and the LBF landmark model once on a dummy frame"""
         if not self.is_ready:
+            return
+        gray = np.zeros((360, 640), dtype=np.uint8)
+        self.face_detector.detectMultiScale(gray, 1.3, 5)
+        with self._lock:
+            self.landmark_detector.fit(gray, np.array([[220, 80, 200, 200]], dtype=np.int32))
+
+    def frame_limit(self, fps: float) -> int:
+        """Number of leading frames the detector looks at"""
+        return int((fps or 30) * self.CHUNK_SECONDS)
+
+    def detect(self, media_data: dict, frames=None, audio_features: AudioFeatures = _NOT_SHARED) -> dict:
+        """
+        frames is an optional FrameSubscription from the shared decode pass and
+        audio_features the job's shared STFT features (None: no audio); without them the file is read here.
+        """
+        if not self.is_ready:
+            if frames is not None:
+                frames.close()
             return {"score": 0.5, "inconsistencies": {"warning": "Detector not ready"}}
 
         video_path = media_data.get("file_path") or media_data.get("local_path")
@@ -46,11 +224,30 @@ class LipSyncDetector:
                  video_path = video_path.lstrip("/")
         
         if not video_path or not os.path.exists(video_path):
+            if frames is not None:
+                frames.close()
             return {"score": 0.5, "inconsistencies": {"error": "Video file not found"}}
 
         try:
-            sync_score, details = self._analyze_synchronization(video_path, chunk_seconds=30)
+            sync_score, details = self._analyze_synchronization(
+                video_path,
+                chunk_seconds=self.CHUNK_SECONDS,
+                frames=frames,
+                fps=media_data.get("fps"),
+                audio_features=audio_features
+            )
             
+            # No face in the span: flagged so callers can tell "no signal" from a real 0.5
+            if details.get("frames") == 0:
+                return {
+                    "score": 0.5,
+                    "inconsistencies": {
+                        "detected": False,
+                        "no_signal": True,
+                        "status": "No face visible, lip sync not assessed."
+                    }
+                }
+
             # Convert numpy types to python native types for JSON compatibility
             s_score = float(sync_score)
             
@@ -69,7 +266,8 @@ class LipSyncDetector:
                     "description": "Mouth movements do not correlate with speech audio.",
                     "details": {
                         "sync_score": round(s_score, 3),
-                        "frames_analyzed": int(details.get("frames", 0))
+                        "frames_analyzed": int(details.get("frames", 0)),
+                        "offset_ms": details.get("offset_ms")
                     }
                 }
             else:
@@ -77,6 +275,11 @@ class LipSyncDetector:
                     "detected": False,
                     "status": "Lip movement synchronization within normal limits."
                 }
+            
+            # Per-window sync along the analyzed span; the offset is the lag the score was taken at
+            if details.get("timeline"):
+                inconsistencies["offset_ms"] = details["offset_ms"]
+                inconsistencies["timeline"] = details["timeline"]
 
             return {
                 "score": fake_prob, 
@@ -86,91 +289,107 @@ class LipSyncDetector:
             print(f"❌ Error during detection: {e}")
             return {"score": 0.5, "inconsistencies": {"error": str(e)}}
 
-    def _analyze_synchronization(self, video_path, chunk_seconds=30):
+    def _analyze_synchronization(self, video_path, chunk_seconds=30, frames=None, fps=None, audio_features=_NOT_SHARED):
         # 1. Extract 30s of Video Frames
-        mar_list, fps = self._extract_mouth_openings(video_path, chunk_seconds)
+        mar_list, fps = self._extract_mouth_openings(video_path, chunk_seconds, frames, fps)
         
-        if len(mar_list) < 15: 
+        # Spans without a face (cutaways, B-roll) say nothing about sync
+        if len(mar_list) < 15 or np.count_nonzero(mar_list) < 15:
             return 0.5, {"frames": 0}
 
         # 2. Extract 30s of Audio Energy
-        audio_energy = self._extract_audio_energy(video_path, len(mar_list), fps, chunk_seconds)
+        if audio_features is _NOT_SHARED:
+            audio_track = SharedAudioTrack(video_path, chunk_seconds)
+            audio_features = compute_audio_features(audio_track.decode(), audio_track.sample_rate)
+        audio_energy = self._extract_audio_energy(audio_features, len(mar_list), fps)
         
         if audio_energy is None: 
             return 1.0, {"warning": "No Audio"}
 
-        try:
-            corr, _ = pearsonr(mar_list, audio_energy)
-            if np.isnan(corr): corr = 0.0
-        except:
-            corr = 0.0
+        # 3. Correlation at the best audio/video offset, plus where along the clip it holds
+        sync = lagged_sync(
+            mar_list,
+            audio_energy,
+            max_lag=int(round(LIPSYNC_MAX_LAG_SECONDS * fps)),
+            window=max(2, int(round(LIPSYNC_WINDOW_SECONDS * fps))),
+            hop=max(1, int(round(LIPSYNC_WINDOW_HOP_SECONDS * fps)))
+        )
+        timeline = [
+            {
+                "t": round(start / fps, 2),
+                "end": round(min(start / fps + LIPSYNC_WINDOW_SECONDS, len(mar_list) / fps), 2),
+                "sync": round(corr, 3),
+                "score": round(float(max(0.0, min(1.0, 1.0 - max(0.0, corr)))), 3)
+            }
+            for start, corr in sync["windows"]
+        ]
             
-        return corr, {"frames": len(mar_list)}
+        return sync["correlation"], {
+            "frames": len(mar_list),
+            "offset_ms": int(round(sync["lag"] / fps * 1000)),
+            "zero_lag_sync": round(sync["zero_lag_correlation"], 3),
+            "timeline": timeline
+        }
 
-    def _extract_mouth_openings(self, video_path, chunk_seconds):
-        cap = cv2.VideoCapture(video_path)
-        fps = cap.get(cv2.CAP_PROP_FPS) or 30
-        max_frames = int(fps * chunk_seconds) # 30 seconds worth of frames
+    def _extract_mouth_openings(self, video_path, chunk_seconds, frames=None, fps=None):
+        if frames is not None:
+            # Frames come from the shared decode pass
+            fps = fps or 30
+            frame_iter = (frame for _, frame in frames)
+        else:
+            cap = cv2.VideoCapture(video_path)
+            fps = cap.get(cv2.CAP_PROP_FPS) or 30
+            frame_iter = self._read_frames(cap, int(fps * chunk_seconds)) # 30 seconds worth of frames
         
         mar_list = []
-        frame_count = 0
+        tracker = FaceTracker(self.face_detector)
         
-        while cap.isOpened() and frame_count < max_frames:
-            ret, frame = cap.read()
-            if not ret: break
-            
+        for frame in frame_iter:
             gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = self.face_detector.detectMultiScale(gray, 1.3, 5)
+            box = tracker.update(gray)
             
-            if len(faces) > 0:
-                _, landmarks = self.landmark_detector.fit(gray, faces)
-                for landmark in landmarks:
-                    lm = landmark[0]
-                    try:
-                        # Inner lip distance
-                        dist = np.linalg.norm(lm[62] - lm[66])
-                        mar_list.append(dist)
-                    except:
-                        mar_list.append(0.0)
-                    break 
+            if box is not None:
+                # LBF only sees the tracked face region (plus a margin), not the full frame
+                x, y, w, h = box
+                margin = max(w, h) // 5
+                x0, y0 = max(0, x - margin), max(0, y - margin)
+                roi = gray[y0:min(gray.shape[0], y + h + margin), x0:min(gray.shape[1], x + w + margin)]
+                face = np.array([[x - x0, y - y0, w, h]], dtype=np.int32)
+                with self._lock:
+                    _, landmarks = self.landmark_detector.fit(roi, face)
+                try:
+                    lm = landmarks[0][0]
+                    # Inner lip distance
+                    dist = np.linalg.norm(lm[62] - lm[66])
+                    mar_list.append(dist)
+                except:
+                    mar_list.append(0.0)
             else:
                 mar_list.append(0.0)
-            
-            frame_count += 1
-                
-        cap.release()
+        
+        print(
+            f"👄 LipSync face tracking: {len(mar_list)} frames, {tracker.detections} detections, "
+            f"{tracker.tracked} tracked, {tracker.reused} unchanged"
+        )
         return mar_list, fps
 
-    def _extract_audio_energy(self, video_path, num_frames, fps, chunk_seconds):
+    def _read_frames(self, cap, max_frames):
+        frame_count = 0
         try:
-            clip = VideoFileClip(video_path)
-            if not clip.audio: 
-                clip.close()
-                return None
-            
-            # Use only the first 30 seconds
-            duration = min(clip.duration, chunk_seconds)
-            subclip = clip.subclipped(0, duration) # MoviePy 2.x uses subclipped()
-            
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f:
-                temp_name = f.name
-            
-            subclip.audio.write_audiofile(temp_name, logger=None)
-            subclip.close()
-            clip.close()
-            
-            y, sr = librosa.load(temp_name, sr=16000)
-            try: os.remove(temp_name)
-            except: pass
-            
-            hop = int(sr / fps)
-            if hop < 1: hop = 1
-            rmse = librosa.feature.rms(y=y, frame_length=hop, hop_length=hop)[0]
-            
-            # Align lengths
-            if len(rmse) != num_frames:
-                rmse = cv2.resize(rmse.reshape(1,-1), (num_frames, 1)).flatten()
-                
+            while cap.isOpened() and frame_count < max_frames:
+                ret, frame = cap.read()
+                if not ret: break
+                yield frame
+                frame_count += 1
+        finally:
+            cap.release()
+
+    def _extract_audio_energy(self, audio_features, num_frames, fps):
+        if audio_features is None:
+            return None
+        try:
+            # RMS from the job's shared STFT, sampled at each video frame's timestamp
+            rmse = audio_features.rms_at(np.arange(num_frames) / fps)
             return (rmse - np.min(rmse)) / (np.max(rmse) + 1e-6)
         except Exception as e:
             print(f"Audio Error: {e}")
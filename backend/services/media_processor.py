@@ -1,31 +1,52 @@
 import cv2
 import numpy as np
-from PIL import Image
 import tempfile
 import os
-from utils.metadata import extract_metadata
+from utils.metadata import extract_metadata, probe_video
 from utils.logger import logger
 import hashlib
 
+# Same as AudioDeepfakeDetector.SAMPLE_RATE; not imported to avoid loading the audio models here
+AUDIO_SAMPLE_RATE = 16000
+# Longer audio uploads are not decoded into memory; the detector streams them from disk
+AUDIO_PRELOAD_MAX_SECONDS = float(os.getenv("AUDIO_PRELOAD_MAX_SECONDS", "600"))
+
 class MediaProcessor:
     def __init__(self):
         self.temp_dir = tempfile.gettempdir()
+        self.fetched_paths = []
+    
+    def cleanup(self):
+        """Removes files fetched from storage; call once the job no longer reads them"""
+        for path in self.fetched_paths:
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError as e:
+                logger.warning(f"Could not remove fetched file {path}: {e}")
+        self.fetched_paths = []
     
-    def process(self, media_url: str, content_type: str):
-        media_type = self._determine_type(content_type)
+    def process(self, media_url: str, content_type: str, local_path: str = None):
+        """
+        local_path is the already-ingested file; when given, the media is never
+        downloaded back from storage and every stage works from that path.
+        """
+        media_type = self.determine_type(content_type)
         
-        logger.info(f"Processing {media_type} from {media_url}")
+        logger.info(f"Processing {media_type} from {local_path or media_url}")
         
         if media_type == "image":
-            return self._process_image(media_url, content_type)
+            return self._process_image(media_url, content_type, local_path)
         elif media_type == "video":
-            return self._process_video(media_url, content_type)
+            return self._process_video(media_url, content_type, local_path)
         elif media_type == "audio":
-            return self._process_audio(media_url, content_type)
+            return self._process_audio(media_url, content_type, local_path)
         else:
             raise ValueError(f"Unsupported media type: {content_type}")
     
-    def _determine_type(self, content_type: str) -> str:
+    @staticmethod
+    def determine_type(content_type: str) -> str:
+        content_type = content_type or ""
         if content_type.startswith("image/"):
             return "image"
         elif content_type.startswith("video/"):
@@ -34,56 +55,51 @@ class MediaProcessor:
             return "audio"
         return "unknown"
     
-    def _process_image(self, media_url: str, content_type: str):
-        from utils.storage import download_from_storage
-        
-        image_data = download_from_storage(media_url)
+    def _fetch_to_temp(self, media_url: str, prefix: str, ext: str) -> str:
+        """Download from storage into a temp file; only used when no local copy was handed over"""
+        from utils.storage_backends import download_sync
+        
+        # Streamed straight to disk by the storage backend, never buffered in memory
+        temp_path = os.path.join(self.temp_dir, f"{prefix}_{hashlib.md5(media_url.encode('utf-8')).hexdigest()}{ext}")
+        self.fetched_paths.append(temp_path)
+        return download_sync(media_url, temp_path)
+    
+    def _process_image(self, media_url: str, content_type: str, local_path: str = None):
+        if local_path is None:
+            import mimetypes
+            local_path = self._fetch_to_temp(media_url, "image", mimetypes.guess_extension(content_type) or ".img")
         
-        nparr = np.frombuffer(image_data, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        image = cv2.imread(local_path, cv2.IMREAD_COLOR)
         
         if image is None:
             raise ValueError("Failed to decode image")
         
-        metadata = extract_metadata(image_data, "image")
+        metadata = extract_metadata(local_path, "image")
         metadata_score = self._analyze_metadata(metadata)
         
         return {
             "type": "image",
             "data": image,
             "shape": image.shape,
+            "local_path": local_path,
             "metadata": metadata,
             "metadata_score": metadata_score,
             "metadata_flags": self._get_metadata_flags(metadata),
             "url": media_url
         }
     
-    def _process_video(self, media_url: str, content_type: str):
-        from utils.storage import download_from_storage
-        
-        video_data = download_from_storage(media_url)
-        
-        temp_path = os.path.join(self.temp_dir, f"video_{hashlib.md5(video_data).hexdigest()}.mp4")
-        with open(temp_path, 'wb') as f:
-            f.write(video_data)
-        
-        # Release video_data from memory
-        del video_data
-        
-        cap = cv2.VideoCapture(temp_path)
+    def _process_video(self, media_url: str, content_type: str, local_path: str = None):
+        if local_path is None:
+            local_path = self._fetch_to_temp(media_url, "video", ".mp4")
         
-        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        # One header read gives the stream facts and the container metadata
+        probe = probe_video(local_path)
+        frame_count = int(probe.get("frame_count") or 0)
+        fps = probe.get("fps") or 0.0
+        width = int(probe.get("width") or 0)
+        height = int(probe.get("height") or 0)
         
-        cap.release()
-        
-        # Load metadata from file
-        with open(temp_path, 'rb') as f:
-            video_bytes = f.read()
-            metadata = extract_metadata(video_bytes, "video")
-            del video_bytes
+        metadata = extract_metadata(local_path, "video", probe=probe)
         
         metadata_score = self._analyze_metadata(metadata)
         
@@ -91,8 +107,8 @@ class MediaProcessor:
         # Detectors will read frames on-demand to save memory
         return {
             "type": "video",
-            "video_path": temp_path,
-            "local_path": temp_path,  # For compatibility
+            "video_path": local_path,
+            "local_path": local_path,  # For compatibility
             "fps": fps,
             "frame_count": frame_count,
             "width": width,
@@ -103,42 +119,50 @@ class MediaProcessor:
             "url": media_url
         }
     
-    def _process_audio(self, media_url: str, content_type: str):
-        from utils.storage import download_from_storage
+    def _process_audio(self, media_url: str, content_type: str, local_path: str = None):
         import librosa
+        import mimetypes
         
-        audio_data = download_from_storage(media_url)
+        if local_path is None:
+            ext = mimetypes.guess_extension(content_type) or ".wav"
+            local_path = self._fetch_to_temp(media_url, "audio", ext)
+        
+        with open(local_path, 'rb') as f:
+            head = f.read(512)
         
         # Check if audio_data is actually an XML error or HTML
-        if audio_data.startswith(b"<?xml") or audio_data.strip().startswith(b"<Error"):
-             logger.error(f"Invalid audio data received (looks like XML): {audio_data[:200]}")
+        if head.startswith(b"<?xml") or head.strip().startswith(b"<Error"):
+             logger.error(f"Invalid audio data received (looks like XML): {head[:200]}")
              raise ValueError("Download failed: Received XML response instead of audio file")
         
-        if audio_data.strip().lower().startswith(b"<!doctype html") or audio_data.strip().lower().startswith(b"<html"):
-             logger.error(f"Invalid audio data received (looks like HTML): {audio_data[:200]}")
+        if head.strip().lower().startswith(b"<!doctype html") or head.strip().lower().startswith(b"<html"):
+             logger.error(f"Invalid audio data received (looks like HTML): {head[:200]}")
              raise ValueError("Download failed: Received HTML response instead of audio file")
         
-        import mimetypes
-        
-        ext = mimetypes.guess_extension(content_type) or ".wav"
-        if ext == ".mp3":
-             # Force librosa to use audioread for mp3 if soundfile fails
-             pass
-
-        temp_path = os.path.join(self.temp_dir, f"audio_{hashlib.md5(audio_data).hexdigest()}{ext}")
-        with open(temp_path, 'wb') as f:
-            f.write(audio_data)
-        
-        y, sr = librosa.load(temp_path, sr=None)
+        # The only decode of the file: 16 kHz mono float32, the rate the audio detector consumes
+        sr = AUDIO_SAMPLE_RATE
+        y = None
+        try:
+            duration = librosa.get_duration(path=local_path)
+        except Exception:
+            duration = None
+        if duration is not None and duration <= AUDIO_PRELOAD_MAX_SECONDS:
+            y, _ = librosa.load(local_path, sr=sr, mono=True, dtype=np.float32)
+        elif duration is None:
+            # Unknown length could be hours; streaming keeps memory bounded either way
+            logger.info("Audio duration unknown, leaving it on disk to be streamed")
+        else:
+            logger.info(f"Audio is {duration:.0f}s long, leaving it on disk to be streamed")
         
-        metadata = extract_metadata(audio_data, "audio")
+        metadata = extract_metadata(local_path, "audio")
         metadata_score = self._analyze_metadata(metadata)
         
         return {
             "type": "audio",
             "waveform": y,
             "sample_rate": sr,
-            "audio_path": temp_path,
+            "audio_path": local_path,
+            "local_path": local_path,
             "metadata": metadata,
             "metadata_score": metadata_score,
             "metadata_flags": self._get_metadata_flags(metadata),
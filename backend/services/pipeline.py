@@ -0,0 +1,94 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from utils.logger import logger
+
+
+class Stage:
+    def __init__(self, name: str, fn, deps=(), cleanup=None):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.cleanup = cleanup
+
+
+class StageGraph:
+    """
+    Per-job DAG executor.
+    Each stage starts on a thread pool as soon as all of its dependencies have
+    finished, so independent branches (vision, audio, temporal, lipsync) overlap.
+    A stage function receives a dict with the results of its dependencies.
+    When a stage fails, stages that never started get their cleanup called instead,
+    e.g. to close a frame subscription a producer would otherwise block on.
+    """
+
+    def __init__(self, name: str = "job", max_workers: int = None):
+        self.name = name
+        self.max_workers = max_workers
+        self._stages = {}
+
+    def add(self, name: str, fn, deps=(), cleanup=None):
+        if name in self._stages:
+            raise ValueError(f"Duplicate stage: {name}")
+        self._stages[name] = Stage(name, fn, deps, cleanup)
+        return self
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._stages
+
+    def run(self):
+        """Runs every stage and returns (results, wall_times_ms), both keyed by stage name"""
+        for stage in self._stages.values():
+            missing = [d for d in stage.deps if d not in self._stages]
+            if missing:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stages: {missing}")
+
+        results = {}
+        timings = {}
+        pending = dict(self._stages)
+        running = {}
+        max_workers = self.max_workers or max(1, len(self._stages))
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{self.name}-stage") as pool:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    if all(d in results for d in stage.deps):
+                        del pending[name]
+                        inputs = {d: results[d] for d in stage.deps}
+                        running[pool.submit(self._run_stage, stage, inputs)] = name
+
+                if not running:
+                    raise RuntimeError(f"Stage graph is stuck, unresolved stages: {list(pending)}")
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        value, elapsed_ms = future.result()
+                    except Exception as e:
+                        logger.error(f"Stage '{name}' failed: {str(e)}")
+                        for other in running:
+                            if other.cancel():
+                                self._skip(self._stages[running[other]])
+                        # Before leaving the pool: it waits on stages that may be feeding these
+                        for skipped in pending.values():
+                            self._skip(skipped)
+                        raise
+                    results[name] = value
+                    timings[name] = elapsed_ms
+
+        return results, timings
+
+    @staticmethod
+    def _skip(stage: Stage):
+        if stage.cleanup is None:
+            return
+        try:
+            stage.cleanup()
+        except Exception as e:
+            logger.error(f"Cleanup of skipped stage '{stage.name}' failed: {str(e)}")
+
+    @staticmethod
+    def _run_stage(stage: Stage, inputs: dict):
+        start_time = time.time()
+        value = stage.fn(inputs)
+        return value, int((time.time() - start_time) * 1000)
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import sys
+import threading
+import time
+from utils.logger import logger
+from services.chunked_video import (
+    LONG_VIDEO_MIN_SECONDS, VIDEO_CHUNK_SECONDS, VIDEO_CHUNK_MAX_CHUNKS, VIDEO_CHUNK_TOP_FRACTION
+)
+
+
+def _build_vision():
+    from services.vision_detector import VisionDetector
+    return VisionDetector()
+
+
+def _build_audio():
+    # The audio detector is already a module-level singleton
+    from services.audio_detector import _global_detector
+    return _global_detector
+
+
+def _build_temporal():
+    from services.temporal_detector import TemporalDetector
+    return TemporalDetector()
+
+
+def _build_lipsync():
+    from services.lipsync_detector import LipSyncDetector
+    return LipSyncDetector()
+
+
+def _build_fusion():
+    from services.fusion_engine import FusionEngine
+    return FusionEngine()
+
+
+def _build_explainability():
+    from services.explainability import ExplainabilityEngine
+    return ExplainabilityEngine()
+
+
+# Module-level settings that change scores; hashed into the fingerprint with the detectors' own
+SCORING_SETTINGS = {
+    "services.audio_detector": [
+        "AUDIO_WINDOW_SECONDS", "AUDIO_WINDOW_HOP_SECONDS", "AUDIO_TOP_WINDOW_FRACTION", "AUDIO_MAX_SECONDS",
+        "DEMUCS_MODE", "AUDIO_VAD_TOP_DB", "AUDIO_VAD_MIN_RMS", "AUDIO_VAD_MIN_SECONDS",
+        "AUDIO_VAD_MERGE_SECONDS", "AUDIO_VAD_PAD_SECONDS",
+    ],
+    "services.lipsync_detector": [
+        "LIPSYNC_MAX_LAG_SECONDS", "LIPSYNC_WINDOW_SECONDS", "LIPSYNC_WINDOW_HOP_SECONDS",
+        "LIPSYNC_DETECT_EVERY", "LIPSYNC_DETECT_WIDTH", "LIPSYNC_TRACK_MIN_SCORE", "LIPSYNC_STILL_DIFF",
+    ],
+    "utils.video_sampler": ["KEYFRAME_ONLY_MIN_SECONDS"],
+}
+
+
+def _scoring_settings() -> dict:
+    """
+    Current values of SCORING_SETTINGS. Read from sys.modules: after warmup every detector
+    module is loaded, and a module that failed to import counts as absent.
+    """
+    settings = {}
+    for module_name, names in SCORING_SETTINGS.items():
+        module = sys.modules.get(module_name)
+        settings[module_name] = {name: getattr(module, name, None) for name in names}
+    return settings
+
+
+# Bump when a pipeline change alters results without touching model names or config
+PIPELINE_VERSION = "5"
+
+
+class DetectorRegistry:
+    """Builds every detector once per worker process and shares the instances across requests"""
+
+    WARMUP_ORDER = ["vision", "audio", "temporal", "lipsync", "fusion", "explainability"]
+
+    def __init__(self):
+        self._factories = {
+            "vision": _build_vision,
+            "audio": _build_audio,
+            "temporal": _build_temporal,
+            "lipsync": _build_lipsync,
+            "fusion": _build_fusion,
+            "explainability": _build_explainability,
+        }
+        self._instances = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._warmup_started = False
+        self.warmup_times_ms = {}
+        self.warmup_errors = {}
+        self._fingerprint = None
+
+    def get(self, name: str):
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        with self._lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                if name not in self._factories:
+                    raise KeyError(f"Unknown detector: {name}")
+                logger.info(f"Building {name} detector")
+                instance = self._factories[name]()
+                self._instances[name] = instance
+        return instance
+
+    @property
+    def vision(self):
+        return self.get("vision")
+
+    @property
+    def audio(self):
+        return self.get("audio")
+
+    @property
+    def temporal(self):
+        return self.get("temporal")
+
+    @property
+    def lipsync(self):
+        return self.get("lipsync")
+
+    @property
+    def fusion(self):
+        return self.get("fusion")
+
+    @property
+    def explainability(self):
+        return self.get("explainability")
+
+    def warmup(self):
+        """Build every detector and run a dummy input through it so the first request is not cold"""
+        self._warmup_started = True
+        for name in self.WARMUP_ORDER:
+            start_time = time.time()
+            try:
+                detector = self.get(name)
+                if hasattr(detector, "warmup"):
+                    detector.warmup()
+            except Exception as e:
+                logger.error(f"Warmup failed for {name} detector: {str(e)}")
+                self.warmup_errors[name] = str(e)
+            self.warmup_times_ms[name] = int((time.time() - start_time) * 1000)
+
+        self._fingerprint = self._compute_fingerprint()
+        self._ready.set()
+        logger.info(f"Detector warmup complete: {self.warmup_times_ms}")
+
+    def warmup_in_background(self):
+        thread = threading.Thread(target=self.warmup, name="detector-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    @property
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def fingerprint(self):
+        """
+        Digest of model versions and detector/fusion config, used to key cached results.
+        None until warmup has finished: it never builds a detector itself, so callers on
+        the event loop don't block on model loading.
+        """
+        return self._fingerprint
+
+    def _compute_fingerprint(self) -> str:
+        # Reads only detectors warmup already built; one that failed to build counts as absent
+        vision = self._instances.get("vision")
+        audio = self._instances.get("audio")
+        temporal = self._instances.get("temporal")
+        lipsync = self._instances.get("lipsync")
+        fusion = self._instances.get("fusion")
+        config = {
+            "pipeline": PIPELINE_VERSION,
+            "vision": [getattr(vision, "MODEL_NAME", None), getattr(vision, "MAX_VIDEO_FRAMES", None),
+                       getattr(vision, "VIDEO_MAX_HEIGHT", None)],
+            "audio": [getattr(audio, "MODEL_NAME", None), getattr(audio, "demucs_model", None) is not None],
+            "temporal": [getattr(temporal, "MAX_FRAMES", None), getattr(temporal, "FRAME_MAX_HEIGHT", None)],
+            "lipsync": [getattr(lipsync, "CHUNK_SECONDS", None), bool(getattr(lipsync, "is_ready", False))],
+            "fusion": getattr(fusion, "weights", None),
+            "chunks": [LONG_VIDEO_MIN_SECONDS, VIDEO_CHUNK_SECONDS, VIDEO_CHUNK_MAX_CHUNKS, VIDEO_CHUNK_TOP_FRACTION],
+            "settings": _scoring_settings(),
+        }
+        raw = json.dumps(config, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+    def status(self) -> dict:
+        return {
+            "ready": self.is_ready,
+            "warming_up": self._warmup_started and not self.is_ready,
+            "loaded": sorted(self._instances.keys()),
+            "warmup_times_ms": dict(self.warmup_times_ms),
+            "warmup_errors": dict(self.warmup_errors),
+        }
+
+
+# One registry per worker process
+detector_registry = DetectorRegistry()
@@ -3,8 +3,13 @@ import torch.nn as nn
 import cv2
 import numpy as np
 from utils.logger import logger
+from utils.video_sampler import read_frames_sequential, read_keyframes, use_keyframe_mode
 
 class TemporalDetector:
+    # Sample max 30 frames, downscaled to 360p
+    MAX_FRAMES = 30
+    FRAME_MAX_HEIGHT = 360
+    
     def __init__(self):
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.model = self._load_model()
@@ -22,42 +27,43 @@ class TemporalDetector:
         model.eval()
         return model
     
-    def _read_sampled_frames(self, video_path: str, frame_count: int, max_frames: int = 30):
-        """Read sampled frames from video file"""
-        frames = []
-        cap = cv2.VideoCapture(video_path)
-        
+    def sample_indices(self, frame_count: int, max_frames: int = None) -> list:
+        """Frame indices sampled from a video of frame_count frames"""
+        max_frames = max_frames or self.MAX_FRAMES
         sample_rate = max(1, frame_count // max_frames)
-        
-        for i in range(0, frame_count, sample_rate):
-            if len(frames) >= max_frames:
-                break
-            
-            cap.set(cv2.CAP_PROP_POS_FRAMES, i)
-            ret, frame = cap.read()
-            
-            if ret:
-                # Downscale to save memory
-                height, width = frame.shape[:2]
-                max_height = 360
-                if height > max_height:
-                    scale = max_height / height
-                    new_width = int(width * scale)
-                    frame = cv2.resize(frame, (new_width, max_height), interpolation=cv2.INTER_AREA)
-                
-                frames.append(frame)
-        
-        cap.release()
-        return frames
+        return list(range(0, frame_count, sample_rate))[:max_frames]
+    
+    def _read_sampled_frames(self, video_path: str, frame_count: int, max_frames: int = None, fps: float = None):
+        """Read sampled frames from video file, without seeking"""
+        max_frames = max_frames or self.MAX_FRAMES
+        
+        # Downscale to save memory
+        if use_keyframe_mode(frame_count, fps):
+            frame_iter = read_keyframes(video_path, max_frames, self.FRAME_MAX_HEIGHT)
+        else:
+            frame_iter = read_frames_sequential(
+                video_path, self.sample_indices(frame_count, max_frames), self.FRAME_MAX_HEIGHT
+            )
+        
+        return [frame for _, frame in frame_iter]
+    
+    def warmup(self):
+        """Run a dummy feature sequence through the LSTM"""
+        dummy = torch.zeros((1, 10, 2048), device=self.device)
+        with torch.no_grad():
+            self.model(dummy)
     
-    def detect(self, media_data: dict):
+    def detect(self, media_data: dict, frames=None):
+        """frames is an optional FrameSubscription from the shared decode pass"""
         if media_data["type"] != "video":
+            if frames is not None:
+                frames.close()
             return {"score": 0.5, "timeline": None}
         
         from utils.memory_manager import MemoryManager
         
         video_path = media_data.get("video_path") or media_data.get("local_path")
-        if not video_path:
+        if not video_path and frames is None:
             logger.error("No video path provided for temporal detection")
             return {"score": 0.5, "timeline": None}
         
@@ -65,8 +71,11 @@ class TemporalDetector:
             fps = media_data.get("fps", 30)
             frame_count = media_data.get("frame_count", 0)
             
-            # Read frames on-demand
-            frames = self._read_sampled_frames(video_path, frame_count)
+            if frames is not None:
+                frames = frames.collect()
+            else:
+                # Read frames on-demand
+                frames = self._read_sampled_frames(video_path, frame_count, fps=fps)
             
             if len(frames) == 0:
                 return {"score": 0.5, "timeline": None}
@@ -5,15 +5,23 @@ from PIL import Image
 import cv2
 import numpy as np
 from utils.logger import logger
+from utils.video_sampler import read_frames_sequential, read_keyframes, use_keyframe_mode
 
 # Set longer timeout for HuggingFace downloads
 os.environ['HF_HUB_DOWNLOAD_TIMEOUT'] = '60'
 
 class VisionDetector:
+    # Sampled video frames are classified in batches of VISION_BATCH_SIZE, downscaled to 720p
+    MAX_VIDEO_FRAMES = int(os.getenv("VISION_MAX_FRAMES", "24"))
+    BATCH_SIZE = int(os.getenv("VISION_BATCH_SIZE", "8"))
+    VIDEO_MAX_HEIGHT = 720
+    MODEL_NAME = "dima806/deepfake_vs_real_image_detection"
+    
     def __init__(self):
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.model = None
         self.processor = None
+        self._label_idx_cache = None
         
         try:
             cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
@@ -40,7 +48,7 @@ class VisionDetector:
             os.makedirs(model_cache_dir, exist_ok=True)
             
             # Switch to a more robust model
-            model_name = "dima806/deepfake_vs_real_image_detection"
+            model_name = self.MODEL_NAME
             logger.info(f"Loading pretrained model: {model_name}")
             
             self.model = ViTForImageClassification.from_pretrained(
@@ -62,70 +70,26 @@ class VisionDetector:
             self.model = None
             self.processor = None
     
-    def detect(self, media_data: dict):
+    def warmup(self):
+        """Run a dummy frame through the face detector and the ViT model"""
+        dummy = np.zeros((224, 224, 3), dtype=np.uint8)
+        self._detect_image(dummy)
+    
+    def detect(self, media_data: dict, frames=None):
         if media_data["type"] == "image":
             return self._detect_image(media_data["data"])
         elif media_data["type"] == "video":
-            return self._detect_video(media_data)
+            return self._detect_video(media_data, frames)
         else:
             raise ValueError(f"Unsupported media type for vision detection: {media_data['type']}")
     
     def _detect_image(self, image: np.ndarray):
         try:
-            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            pil_image = Image.fromarray(image_rgb)
-            
             if self.model is None or self.processor is None:
                 return {"score": 0.5, "label": "error", "heatmap": None, "regions": []}
             
-            # --- FACE EXTRACTION LOGIC ---
-            face_crop = self._crop_face(image_rgb)
-            
-            if face_crop is not None:
-                logger.info("Face detected! Analyzing face crop.")
-                target_image = Image.fromarray(face_crop)
-                analysis_mode = "face"
-            else:
-                logger.info("No face detected. Analyzing full image.")
-                target_image = pil_image
-                analysis_mode = "full"
-
-            inputs = self.processor(images=target_image, return_tensors="pt")
-            inputs = {k: v.to(self.device) for k, v in inputs.items()}
-            
-            with torch.no_grad():
-                outputs = self.model(**inputs)
-                logits = outputs.logits
-                probabilities = torch.softmax(logits, dim=1)
-                predicted_class = torch.argmax(logits, dim=1).item()
-            
-            # Get label mapping from model config
-            label_map = self.model.config.id2label
-            
-            # Find which index corresponds to "Fake" or "Real"
-            fake_idx = None
-            real_idx = None
-            
-            for idx, label_text in label_map.items():
-                label_lower = label_text.lower()
-                if "fake" in label_lower or "manipulated" in label_lower or "synthetic" in label_lower:
-                    fake_idx = idx
-                elif "real" in label_lower or "authentic" in label_lower or "genuine" in label_lower:
-                    real_idx = idx
-            
-            # Calculate fake probability
-            if fake_idx is not None:
-                # Direct mapping found
-                fake_prob = probabilities[0][fake_idx].item()
-                logger.info(f"Using fake_idx={fake_idx}, fake_prob={fake_prob:.4f}")
-            elif real_idx is not None:
-                # Invert real probability
-                fake_prob = 1.0 - probabilities[0][real_idx].item()
-                logger.info(f"Using real_idx={real_idx}, inverted to fake_prob={fake_prob:.4f}")
-            else:
-                # Fallback: For dima806 model, Class 0=Real, Class 1=Fake
-                fake_prob = probabilities[0][1].item()
-                logger.warning(f"No label mapping found, using Class 1 as fallback: {fake_prob:.4f}")
+            target_image, analysis_mode = self._prepare_image(image)
+            fake_prob = self._classify_batch([target_image])[0]
             
             final_label = "fake" if fake_prob > 0.5 else "real"
             
@@ -146,6 +110,76 @@ class VisionDetector:
                 "heatmap": None,
                 "regions": []
             }
+    
+    def _prepare_image(self, image: np.ndarray):
+        """Returns the PIL image the classifier should see (face crop if found) and the analysis mode"""
+        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        
+        # --- FACE EXTRACTION LOGIC ---
+        face_crop = self._crop_face(image_rgb)
+        
+        if face_crop is not None:
+            logger.debug("Face detected! Analyzing face crop.")
+            return Image.fromarray(face_crop), "face"
+        
+        logger.debug("No face detected. Analyzing full image.")
+        return Image.fromarray(image_rgb), "full"
+    
+    def _classify_batch(self, images: list) -> list:
+        """Runs one forward pass over a batch of PIL images and returns their fake probabilities"""
+        inputs = self.processor(images=images, return_tensors="pt")
+        inputs = {k: v.to(self.device) for k, v in inputs.items()}
+        
+        with torch.no_grad():
+            logits = self.model(**inputs).logits
+            probabilities = torch.softmax(logits, dim=1)
+        
+        fake_idx, real_idx = self._label_indices()
+        
+        # Calculate fake probability
+        if fake_idx is not None:
+            # Direct mapping found
+            fake_probs = probabilities[:, fake_idx]
+        elif real_idx is not None:
+            # Invert real probability
+            fake_probs = 1.0 - probabilities[:, real_idx]
+        else:
+            # Fallback: For dima806 model, Class 0=Real, Class 1=Fake
+            fake_probs = probabilities[:, 1]
+        
+        return [float(p) for p in fake_probs.cpu().tolist()]
+    
+    def _score_batch(self, images: list) -> list:
+        try:
+            return self._classify_batch(images)
+        except Exception as e:
+            logger.error(f"Vision batch inference error: {str(e)}")
+            return [0.5] * len(images)
+    
+    def _label_indices(self):
+        """Find which class indices correspond to "Fake" and "Real" in the model config"""
+        if self._label_idx_cache is not None:
+            return self._label_idx_cache
+        
+        fake_idx = None
+        real_idx = None
+        
+        for idx, label_text in self.model.config.id2label.items():
+            label_lower = label_text.lower()
+            if "fake" in label_lower or "manipulated" in label_lower or "synthetic" in label_lower:
+                fake_idx = int(idx)
+            elif "real" in label_lower or "authentic" in label_lower or "genuine" in label_lower:
+                real_idx = int(idx)
+        
+        if fake_idx is not None:
+            logger.info(f"Using fake_idx={fake_idx} for fake probability")
+        elif real_idx is not None:
+            logger.info(f"Using real_idx={real_idx}, inverted to fake probability")
+        else:
+            logger.warning("No label mapping found, using Class 1 as fallback")
+        
+        self._label_idx_cache = (fake_idx, real_idx)
+        return self._label_idx_cache
 
     def _crop_face(self, image_rgb: np.ndarray):
         """Detects and returns the largest face crop using OpenCV Haar Cascade."""
@@ -188,63 +222,77 @@ class VisionDetector:
             logger.error(f"Error in face cropping: {e}")
             return None
     
-    def _detect_video(self, media_data: dict):
-        """Detect deepfakes in video by processing frames on-demand"""
+    def sample_indices(self, frame_count: int) -> list:
+        """Frame indices sampled from a video of frame_count frames"""
+        sample_rate = max(1, frame_count // self.MAX_VIDEO_FRAMES)
+        return list(range(0, frame_count, sample_rate))[:self.MAX_VIDEO_FRAMES]
+    
+    def _read_sampled_frames(self, video_path: str, frame_count: int, fps: float = None):
+        """Yield sampled frames straight from the video file, without seeking"""
+        if use_keyframe_mode(frame_count, fps):
+            frame_iter = read_keyframes(video_path, self.MAX_VIDEO_FRAMES, self.VIDEO_MAX_HEIGHT)
+        else:
+            frame_iter = read_frames_sequential(video_path, self.sample_indices(frame_count), self.VIDEO_MAX_HEIGHT)
+        
+        for _, frame in frame_iter:
+            yield frame
+    
+    def _detect_video(self, media_data: dict, frames=None):
+        """
+        Detect deepfakes in video by processing frames on-demand.
+        frames is an optional FrameSubscription from the shared decode pass;
+        without it the detector samples the file itself.
+        """
         from utils.memory_manager import MemoryManager
         
         video_path = media_data.get("video_path") or media_data.get("local_path")
-        if not video_path:
+        if not video_path and frames is None:
             logger.error("No video path provided in media_data")
             return {"score": 0.5, "label": "unknown", "heatmap": None, "regions": []}
         
         try:
-            cap = cv2.VideoCapture(video_path)
-            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            frame_count = media_data.get("frame_count") or 0
             
             if frame_count == 0:
-                cap.release()
+                if frames is not None:
+                    frames.close()
                 return {"score": 0.5, "label": "unknown", "heatmap": None, "regions": []}
             
             scores = []
-            labels = []
+            batch = []
             
-            # Sample max 10 frames to reduce memory usage
-            sample_rate = max(1, frame_count // 10)
-            max_frames = 10
+            if frames is not None:
+                frame_iter = (frame for _, frame in frames)
+            else:
+                frame_iter = self._read_sampled_frames(video_path, frame_count, media_data.get("fps"))
             
-            logger.info(f"Processing video with {frame_count} frames (sampling every {sample_rate} frames)")
+            logger.info(
+                f"Processing video with {frame_count} frames "
+                f"(sampling {self.MAX_VIDEO_FRAMES} frames, batch size {self.BATCH_SIZE})"
+            )
             MemoryManager.log_memory_usage("Before video processing: ")
             
-            for i in range(0, frame_count, sample_rate):
-                if len(scores) >= max_frames:
-                    break
-                
-                cap.set(cv2.CAP_PROP_POS_FRAMES, i)
-                ret, frame = cap.read()
-                
-                if not ret:
-                    continue
-                
-                # Downscale frame to max 720p to save memory
-                height, width = frame.shape[:2]
-                max_height = 720
-                if height > max_height:
-                    scale = max_height / height
-                    new_width = int(width * scale)
-                    frame = cv2.resize(frame, (new_width, max_height), interpolation=cv2.INTER_AREA)
-                
-                # Process frame
-                with MemoryManager.memory_efficient_context():
-                    result = self._detect_image(frame)
-                    scores.append(result["score"])
-                    labels.append(result.get("label", "unknown"))
+            if self.model is None or self.processor is None:
+                return {"score": 0.5, "label": "error", "heatmap": None, "regions": []}
+            
+            # Garbage collection once per job instead of twice per frame
+            with MemoryManager.memory_efficient_context():
+                for frame in frame_iter:
+                    target_image, _ = self._prepare_image(frame)
+                    batch.append(target_image)
+                    del frame
+                    
+                    if len(batch) >= self.BATCH_SIZE:
+                        scores.extend(self._score_batch(batch))
+                        batch = []
                 
-                del frame
+                if batch:
+                    scores.extend(self._score_batch(batch))
+                    batch = []
             
-            cap.release()
-            MemoryManager.clear_memory()
             MemoryManager.log_memory_usage("After video processing: ")
             
+            labels = ["fake" if score > 0.5 else "real" for score in scores]
             avg_score = np.mean(scores) if scores else 0.5
             most_common_label = max(set(labels), key=labels.count) if labels else "unknown"
             
@@ -258,3 +306,7 @@ class VisionDetector:
         except Exception as e:
             logger.error(f"Video detection error: {str(e)}")
             return {"score": 0.5, "label": "error", "heatmap": None, "regions": []}
+        
+        finally:
+            if frames is not None:
+                frames.close()
@@ -0,0 +1,117 @@
+import threading
+import time
+from utils.logger import logger
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Trips after failure_threshold consecutive failures. While open, calls are refused
+    without touching the dependency and a background thread runs probe every
+    probe_interval seconds; a successful probe moves to half-open, where a single
+    trial call decides between closing again and re-opening.
+    """
+
+    def __init__(self, name: str, probe=None, failure_threshold: int = 3, probe_interval: float = 10.0):
+        self.name = name
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self._state = CLOSED
+        self._failures = 0
+        self._trial_in_flight = False
+        self._opened_at = None
+        self._lock = threading.Lock()
+        self._probe_thread = None
+        self.trips = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may go to the dependency now; refused calls should take the fallback path"""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info(f"Circuit {self.name} closed")
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == OPEN:
+                return
+            if self._state == CLOSED and self._failures < self.failure_threshold:
+                return
+            self._state = OPEN
+            self._opened_at = time.time()
+            self.trips += 1
+        logger.warning(f"Circuit {self.name} opened after {self._failures} failures")
+        self._start_probe()
+
+    def release(self):
+        """Neutral outcome for a call abandoned midway (cancelled, stream closed early): frees the half-open trial"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def _start_probe(self):
+        if self.probe is None:
+            # Without a probe, fall back to a timed half-open transition
+            timer = threading.Timer(self.probe_interval, self._half_open)
+            timer.daemon = True
+            timer.start()
+            return
+
+        if self._probe_thread is not None and self._probe_thread.is_alive():
+            return
+        self._probe_thread = threading.Thread(target=self._probe_loop, name=f"{self.name}-probe", daemon=True)
+        self._probe_thread.start()
+
+    def _probe_loop(self):
+        while self._state == OPEN:
+            time.sleep(self.probe_interval)
+            try:
+                self.probe()
+            except Exception as e:
+                logger.debug(f"Circuit {self.name} probe failed: {str(e)}")
+                continue
+            self._half_open()
+
+    def _half_open(self):
+        with self._lock:
+            if self._state == OPEN:
+                self._state = HALF_OPEN
+                self._trial_in_flight = False
+                logger.info(f"Circuit {self.name} half-open, next call is a trial")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "open_for_s": round(time.time() - self._opened_at, 1) if self._opened_at else 0,
+                "trips": self.trips,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,165 @@
+import hashlib
+import os
+import tempfile
+import uuid
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+from utils.logger import logger
+
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(2 * 1024 ** 3)))
+INGEST_DIR = os.getenv("INGEST_DIR", os.path.join(tempfile.gettempdir(), "deepfake_ingest"))
+
+# Bytes needed from the start of the file to recognise its container
+SNIFF_BYTES = 64
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class IngestedMedia:
+    """An upload that has been streamed to local disk, hashed and sniffed"""
+
+    def __init__(self, path: str, size: int, sha256: str, content_type: str, declared_content_type: str, extension: str):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.content_type = content_type
+        self.declared_content_type = declared_content_type
+        self.extension = extension
+
+    def cleanup(self):
+        try:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        except OSError as e:
+            logger.warning(f"Could not remove ingested file {self.path}: {e}")
+
+
+def sniff_content_type(head: bytes):
+    """Best-effort media type from magic numbers; None when unrecognised"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head.startswith(b"BM"):
+        return "image/bmp"
+    if head[:4] == b"RIFF":
+        kind = head[8:12]
+        if kind == b"WEBP":
+            return "image/webp"
+        if kind == b"WAVE":
+            return "audio/wav"
+        if kind == b"AVI ":
+            return "video/x-msvideo"
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand in (b"M4A ", b"M4B ", b"F4A ", b"F4B "):
+            return "audio/mp4"
+        # HEIF still images share the ISO base media container with MP4
+        if brand in (b"heic", b"heix", b"heim", b"heis", b"hevc", b"hevx"):
+            return "image/heic"
+        if brand in (b"mif1", b"msf1"):
+            return "image/heif"
+        if brand in (b"avif", b"avis"):
+            return "image/avif"
+        if brand == b"qt  ":
+            return "video/quicktime"
+        return "video/mp4"
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        return "video/webm"
+    if head.startswith(b"OggS"):
+        return "audio/ogg"
+    if head.startswith(b"fLaC"):
+        return "audio/flac"
+    if head.startswith(b"ID3") or head[:2] in (b"\xff\xfb", b"\xff\xf3", b"\xff\xf2"):
+        return "audio/mpeg"
+    return None
+
+
+MEDIA_MAJOR_TYPES = ("image", "video", "audio")
+
+
+def resolve_content_type(sniffed, declared) -> str:
+    """
+    The sniffed type refines the declared one (video/quicktime -> video/mp4) and fills
+    in for generic declarations, but never moves a file to another media kind: generic
+    ISO containers such as mp42/isom hold audio-only files as often as video.
+    """
+    if not sniffed:
+        return declared or "application/octet-stream"
+    declared_major = (declared or "").split("/", 1)[0]
+    if declared_major not in MEDIA_MAJOR_TYPES or declared_major == sniffed.split("/", 1)[0]:
+        return sniffed
+    return declared
+
+
+async def ingest_stream(chunks, filename: str, declared_content_type: str, max_bytes: int = MAX_UPLOAD_BYTES,
+                        dest_dir: str = INGEST_DIR) -> IngestedMedia:
+    """
+    Writes an async iterator of byte chunks to disk, hashing and sniffing it on the fly.
+    Peak memory is one chunk regardless of file size; raises UploadTooLarge as soon
+    as max_bytes is exceeded.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+
+    filename = filename or ""
+    extension = filename.rsplit(".", 1)[-1].lower() if "." in filename else "bin"
+    path = os.path.join(dest_dir, f"{uuid.uuid4().hex}.{extension}")
+
+    hasher = hashlib.sha256()
+    head = b""
+    size = 0
+
+    def consume(out, chunk):
+        hasher.update(chunk)
+        out.write(chunk)
+
+    try:
+        with open(path, "wb") as out:
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Upload exceeds the {max_bytes} byte limit")
+
+                if len(head) < SNIFF_BYTES:
+                    head += chunk[:SNIFF_BYTES - len(head)]
+
+                # Hashing and disk writes stay off the event loop
+                await run_in_threadpool(consume, out, chunk)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+    content_type = resolve_content_type(sniff_content_type(head), declared_content_type)
+    if declared_content_type and content_type != declared_content_type:
+        logger.info(f"Sniffed content type {content_type} (client declared {declared_content_type})")
+
+    return IngestedMedia(
+        path=path,
+        size=size,
+        sha256=hasher.hexdigest(),
+        content_type=content_type,
+        declared_content_type=declared_content_type,
+        extension=extension
+    )
+
+
+async def ingest_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES, dest_dir: str = INGEST_DIR) -> IngestedMedia:
+    """Streams a multipart upload to disk in UPLOAD_CHUNK_BYTES chunks, see ingest_stream"""
+
+    async def chunks():
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+
+    return await ingest_stream(chunks(), file.filename, file.content_type, max_bytes, dest_dir)
@@ -1,131 +1,434 @@
-from hachoir.parser import createParser
-from hachoir.metadata import extractMetadata
 from PIL import Image
 from PIL.ExifTags import TAGS
-import io
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+import os
+import struct
+import tempfile
 from utils.logger import logger
 
-def extract_metadata(data: bytes, media_type: str) -> dict:
+# Upper bound on header bytes read per file; metadata cost stays flat whatever the media size
+METADATA_MAX_HEADER_BYTES = int(os.getenv("METADATA_MAX_HEADER_BYTES", str(64 * 1024 * 1024)))
+
+MP4_EPOCH = datetime(1904, 1, 1, tzinfo=timezone.utc)
+# Boxes whose children are boxes; everything else is a leaf or skipped
+MP4_CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl", b"udta", b"ilst"}
+MP4_ENCODER_TAGS = {b"\xa9too", b"\xa9swr", b"\xa9enc"}
+
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+JPEG_MODES = {1: "L", 3: "RGB", 4: "CMYK"}
+GPS_IFD = 0x8825
+
+def extract_metadata(source, media_type: str, probe: dict = None) -> dict:
+    """
+    source is a file path (preferred) or a bytes-like buffer. Only headers are read:
+    container atoms for MP4/MOV, the APP1 segment for JPEG, the format header for audio.
+    A probe_video result can be passed in to avoid probing the file twice.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        file_size = os.path.getsize(source)
+    else:
+        file_size = len(source)
+
     metadata = {
         "creation_time": None,
         "camera_info": None,
         "software_modified": False,
         "gps_location": None,
-        "file_size": len(data),
+        "file_size": file_size,
         "compression": None
     }
-    
+
     try:
-        if media_type == "image":
-            return _extract_image_metadata(data, metadata)
-        elif media_type == "video":
-            return _extract_video_metadata(data, metadata)
-        elif media_type == "audio":
-            return _extract_audio_metadata(data, metadata)
-        else:
-            return metadata
-    
+        with _as_path(source, ".bin") as path:
+            if media_type == "image":
+                return _extract_image_metadata(path, metadata)
+            elif media_type == "video":
+                return _extract_video_metadata(path, metadata, probe)
+            elif media_type == "audio":
+                return _extract_audio_metadata(path, metadata)
+            else:
+                return metadata
+
     except Exception as e:
         logger.error(f"Metadata extraction error: {str(e)}")
         return metadata
 
-def _extract_image_metadata(data: bytes, metadata: dict) -> dict:
+@contextmanager
+def _as_path(source, suffix: str):
+    """Yields a path; buffers are spilled to a temp file, paths are used as-is"""
+    if isinstance(source, (str, os.PathLike)):
+        yield str(source)
+        return
+
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    try:
+        temp_file.write(source)
+        temp_file.close()
+        yield temp_file.name
+    finally:
+        os.unlink(temp_file.name)
+
+def probe_video(path: str) -> dict:
+    """
+    Stream facts (fps, frame_count, width, height, duration) and container tags from
+    one header read. MP4/MOV atoms are parsed directly; other containers fall back to
+    OpenCV for the stream and hachoir for the tags.
+    """
+    probe = _probe_mp4(path)
+    if probe is not None and probe.get("frame_count"):
+        return probe
+
+    import cv2
+    cap = cv2.VideoCapture(path)
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        stream = {
+            "fps": fps,
+            "frame_count": frame_count,
+            "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            "duration": frame_count / fps if fps else None,
+        }
+    finally:
+        cap.release()
+
+    tags = (probe or {}).get("tags") or _hachoir_tags(path)
+    return {"container": (probe or {}).get("container"), "tags": tags, **stream}
+
+# --- MP4 / QuickTime atoms ---
+
+def _iter_boxes(buf, start: int, end: int):
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", buf, pos)
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                return
+            size = struct.unpack_from(">Q", buf, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            return
+        yield kind, pos + header, pos + size
+        pos += size
+
+def _read_moov(path: str):
+    """Walks top-level boxes by header and seek only, returning (brand, moov bytes)"""
+    brand = None
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        pos = 0
+        while pos + 8 <= file_size:
+            f.seek(pos)
+            header = f.read(16)
+            if len(header) < 8:
+                return brand, None
+            size, kind = struct.unpack_from(">I4s", header, 0)
+            header_size = 8
+            if size == 1:
+                size = struct.unpack_from(">Q", header, 8)[0]
+                header_size = 16
+            elif size == 0:
+                size = file_size - pos
+            if size < header_size:
+                return brand, None
+
+            if pos == 0 and kind != b"ftyp" and kind not in (b"moov", b"mdat", b"free", b"wide", b"skip"):
+                # Not an ISO base media file
+                return None, None
+            if kind == b"ftyp":
+                brand = header[header_size:header_size + 4].decode("latin-1").strip()
+            elif kind == b"moov":
+                if size > METADATA_MAX_HEADER_BYTES:
+                    logger.warning(f"moov box of {size} bytes exceeds the metadata read limit")
+                    return brand, None
+                f.seek(pos)
+                return brand, f.read(size)
+            pos += size
+    return brand, None
+
+def _mp4_timestamp(seconds: int):
+    if not seconds:
+        return None
+    try:
+        return (MP4_EPOCH + timedelta(seconds=seconds)).strftime("%Y-%m-%d %H:%M:%S")
+    except OverflowError:
+        return None
+
+def _mp4_string(buf, start: int, end: int):
+    """Value of an iTunes-style ilst item (data box) or a QuickTime udta text atom"""
+    for kind, body, box_end in _iter_boxes(buf, start, end):
+        if kind == b"data":
+            # type indicator (4) + locale (4)
+            return bytes(buf[body + 8:box_end]).decode("utf-8", "replace").strip("\x00 ")
+    # QuickTime: 2-byte length + 2-byte language + text
+    if end - start >= 4:
+        length = struct.unpack_from(">H", buf, start)[0]
+        return bytes(buf[start + 4:start + 4 + length]).decode("utf-8", "replace").strip("\x00 ")
+    return None
+
+def _parse_moov(moov) -> dict:
+    buf = memoryview(moov)
+    result = {"tags": {}}
+    video = None
+
+    def walk(start, end, track):
+        nonlocal video
+        for kind, body, box_end in _iter_boxes(buf, start, end):
+            if kind == b"mvhd":
+                version = buf[body]
+                if version == 1:
+                    created, _, timescale, duration = struct.unpack_from(">QQIQ", buf, body + 4)
+                else:
+                    created, _, timescale, duration = struct.unpack_from(">IIII", buf, body + 4)
+                result["tags"]["creation_time"] = _mp4_timestamp(created)
+                if timescale:
+                    result["duration"] = duration / timescale
+            elif kind == b"trak":
+                trak = {}
+                walk(body, box_end, trak)
+                if trak.get("handler") == "vide" and video is None:
+                    video = trak
+            elif kind == b"tkhd" and track is not None:
+                offset = 88 if buf[body] == 1 else 76
+                width, height = struct.unpack_from(">II", buf, body + offset)
+                track["width"], track["height"] = width >> 16, height >> 16
+            elif kind == b"mdhd" and track is not None:
+                if buf[body] == 1:
+                    timescale, duration = struct.unpack_from(">IQ", buf, body + 20)
+                else:
+                    timescale, duration = struct.unpack_from(">II", buf, body + 12)
+                track["timescale"], track["duration"] = timescale, duration
+            elif kind == b"hdlr" and track is not None:
+                track["handler"] = bytes(buf[body + 8:body + 12]).decode("latin-1")
+            elif kind == b"stts" and track is not None:
+                entries = struct.unpack_from(">I", buf, body + 4)[0]
+                track["frame_count"] = sum(
+                    struct.unpack_from(">I", buf, body + 8 + i * 8)[0] for i in range(entries)
+                )
+            elif kind == b"meta":
+                # ISO meta is a full box (4 bytes of version/flags before its children), QuickTime's is not
+                first = body if bytes(buf[body + 4:body + 8]) == b"hdlr" else body + 4
+                walk(first, box_end, track)
+            elif kind in MP4_ENCODER_TAGS:
+                result["tags"].setdefault("encoder", _mp4_string(buf, body, box_end))
+            elif kind in MP4_CONTAINERS:
+                walk(body, box_end, track)
+
+    walk(0, len(buf), None)
+
+    if video is not None:
+        result["width"] = video.get("width")
+        result["height"] = video.get("height")
+        result["frame_count"] = video.get("frame_count", 0)
+        if video.get("timescale") and video.get("duration"):
+            seconds = video["duration"] / video["timescale"]
+            result["fps"] = result["frame_count"] / seconds if seconds else 0.0
+    return result
+
+def _probe_mp4(path: str):
+    try:
+        brand, moov = _read_moov(path)
+    except OSError:
+        return None
+    if moov is None:
+        return None
+    try:
+        probe = _parse_moov(moov)
+    except struct.error as e:
+        logger.warning(f"Malformed moov box in {path}: {str(e)}")
+        return None
+    probe["container"] = brand or "mp4"
+    return probe
+
+def _hachoir_tags(path: str) -> dict:
+    from hachoir.parser import createParser
+    from hachoir.metadata import extractMetadata
+
+    tags = {}
+    parser = createParser(path)
+    if not parser:
+        return tags
+    with parser:
+        meta = extractMetadata(parser)
+    if meta:
+        if meta.has("creation_date"):
+            tags["creation_time"] = str(meta.get("creation_date"))
+        if meta.has("producer"):
+            tags["producer"] = str(meta.get("producer"))
+        elif meta.has("encoder"):
+            tags["producer"] = str(meta.get("encoder"))
+        if meta.has("sample_rate"):
+            tags["sample_rate"] = str(meta.get("sample_rate"))
+        if meta.has("duration"):
+            tags["duration"] = str(meta.get("duration"))
+    return tags
+
+# --- JPEG ---
+
+def _read_jpeg_header(path: str):
+    """Walks JPEG segments up to the first scan; returns the APP1 Exif payload and frame size"""
+    exif = None
+    frame = None
+    with open(path, "rb") as f:
+        if f.read(2) != b"\xff\xd8":
+            return None
+        while f.tell() < METADATA_MAX_HEADER_BYTES:
+            byte = f.read(1)
+            if not byte:
+                break
+            if byte != b"\xff":
+                continue
+            marker = f.read(1)
+            while marker == b"\xff":
+                marker = f.read(1)
+            if not marker:
+                break
+            code = marker[0]
+            if code == 0x01 or 0xD0 <= code <= 0xD8:
+                continue
+            if code in (0xD9, 0xDA):
+                # End of image, or start of scan: only compressed pixels follow
+                break
+
+            length_bytes = f.read(2)
+            if len(length_bytes) < 2:
+                break
+            length = struct.unpack(">H", length_bytes)[0] - 2
+
+            if code == 0xE1 and exif is None:
+                payload = f.read(length)
+                if payload.startswith(b"Exif\x00\x00"):
+                    exif = payload
+            elif code in JPEG_SOF_MARKERS and frame is None:
+                segment = f.read(length)
+                _, height, width, components = struct.unpack_from(">BHHB", segment, 0)
+                frame = {"size": (width, height), "mode": JPEG_MODES.get(components)}
+            else:
+                f.seek(length, 1)
+    return {"exif": exif, "frame": frame}
+
+def _apply_exif(exif, metadata: dict):
+    for tag_id, value in exif.items():
+        tag = TAGS.get(tag_id, tag_id)
+
+        if tag == "DateTime":
+            metadata["creation_time"] = str(value)
+        elif tag == "Make" or tag == "Model":
+            if not metadata["camera_info"]:
+                metadata["camera_info"] = {}
+            metadata["camera_info"][tag] = str(value)
+        elif tag == "Software":
+            metadata["software_modified"] = True
+            metadata["software"] = str(value)
+
+    gps = exif.get_ifd(GPS_IFD)
+    if gps:
+        metadata["gps_location"] = str(dict(gps))
+
+def _extract_image_metadata(path: str, metadata: dict) -> dict:
     try:
-        image = Image.open(io.BytesIO(data))
-        
-        exif_data = image._getexif()
-        
-        if exif_data:
-            for tag_id, value in exif_data.items():
-                tag = TAGS.get(tag_id, tag_id)
-                
-                if tag == "DateTime":
-                    metadata["creation_time"] = str(value)
-                elif tag == "Make" or tag == "Model":
-                    if not metadata["camera_info"]:
-                        metadata["camera_info"] = {}
-                    metadata["camera_info"][tag] = str(value)
-                elif tag == "Software":
-                    metadata["software_modified"] = True
-                    metadata["software"] = str(value)
-                elif tag == "GPSInfo":
-                    metadata["gps_location"] = str(value)
-        
-        metadata["format"] = image.format
-        metadata["size"] = image.size
-        metadata["mode"] = image.mode
-    
+        jpeg = _read_jpeg_header(path)
+        if jpeg is not None:
+            # JPEG: only the APP1 segment and frame header are read, never the scan data
+            if jpeg["exif"]:
+                exif = Image.Exif()
+                exif.load(jpeg["exif"])
+                _apply_exif(exif, metadata)
+            metadata["format"] = "JPEG"
+            if jpeg["frame"]:
+                metadata["size"] = jpeg["frame"]["size"]
+                metadata["mode"] = jpeg["frame"]["mode"]
+            return metadata
+
+        # Other formats: Image.open only parses the header; pixels are never decoded here
+        with Image.open(path) as image:
+            _apply_exif(image.getexif(), metadata)
+            metadata["format"] = image.format
+            metadata["size"] = image.size
+            metadata["mode"] = image.mode
+
     except Exception as e:
         logger.error(f"Image metadata extraction error: {str(e)}")
-    
+
     return metadata
 
-def _extract_video_metadata(data: bytes, metadata: dict) -> dict:
+# --- Video / audio ---
+
+def _extract_video_metadata(path: str, metadata: dict, probe: dict = None) -> dict:
     try:
-        import tempfile
-        import os
-        
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
-        temp_file.write(data)
-        temp_file.close()
-        
-        parser = createParser(temp_file.name)
-        
-        if parser:
-            meta = extractMetadata(parser)
-            
-            if meta:
-                if meta.has("creation_date"):
-                    metadata["creation_time"] = str(meta.get("creation_date"))
-                
-                if meta.has("producer"):
-                    metadata["software_modified"] = True
-                    metadata["software"] = str(meta.get("producer"))
-                
-                if meta.has("width") and meta.has("height"):
-                    metadata["resolution"] = f"{meta.get('width')}x{meta.get('height')}"
-                
-                if meta.has("duration"):
-                    metadata["duration"] = str(meta.get("duration"))
-        
-        os.unlink(temp_file.name)
-    
+        if probe is None:
+            probe = probe_video(path)
+        tags = probe.get("tags") or {}
+
+        if tags.get("creation_time"):
+            metadata["creation_time"] = tags["creation_time"]
+
+        if tags.get("producer"):
+            metadata["software_modified"] = True
+            metadata["software"] = tags["producer"]
+
+        if tags.get("encoder"):
+            # Muxer string (e.g. Lavf), written by nearly every tool; recorded, not flagged
+            metadata["encoder"] = tags["encoder"]
+
+        if probe.get("width") and probe.get("height"):
+            metadata["resolution"] = f"{probe['width']}x{probe['height']}"
+
+        if probe.get("duration"):
+            metadata["duration"] = str(timedelta(seconds=probe["duration"]))
+
+        if probe.get("container"):
+            metadata["container"] = probe["container"]
+
     except Exception as e:
         logger.error(f"Video metadata extraction error: {str(e)}")
-    
+
     return metadata
 
-def _extract_audio_metadata(data: bytes, metadata: dict) -> dict:
+def _extract_audio_metadata(path: str, metadata: dict) -> dict:
     try:
-        import tempfile
-        import os
-        
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
-        temp_file.write(data)
-        temp_file.close()
-        
-        parser = createParser(temp_file.name)
-        
-        if parser:
-            meta = extractMetadata(parser)
-            
-            if meta:
-                if meta.has("creation_date"):
-                    metadata["creation_time"] = str(meta.get("creation_date"))
-                
-                if meta.has("producer") or meta.has("encoder"):
-                    metadata["software_modified"] = True
-                    metadata["software"] = str(meta.get("producer") or meta.get("encoder"))
-                
-                if meta.has("duration"):
-                    metadata["duration"] = str(meta.get("duration"))
-                
-                if meta.has("sample_rate"):
-                    metadata["sample_rate"] = str(meta.get("sample_rate"))
-        
-        os.unlink(temp_file.name)
-    
+        probe = _probe_mp4(path)
+        if probe is not None:
+            # m4a/aac in an MP4 container
+            tags = probe.get("tags") or {}
+            if tags.get("creation_time"):
+                metadata["creation_time"] = tags["creation_time"]
+            if tags.get("encoder"):
+                metadata["encoder"] = tags["encoder"]
+            if probe.get("duration"):
+                metadata["duration"] = str(timedelta(seconds=probe["duration"]))
+            return metadata
+
+        try:
+            import soundfile
+            # Reads the format header only
+            info = soundfile.info(path)
+            metadata["duration"] = str(timedelta(seconds=info.duration))
+            metadata["sample_rate"] = str(info.samplerate)
+            metadata["compression"] = info.subtype
+        except Exception:
+            # Formats libsndfile can't open (older builds and mp3)
+            pass
+
+        tags = _hachoir_tags(path)
+
+        if tags.get("creation_time"):
+            metadata["creation_time"] = tags["creation_time"]
+
+        if tags.get("producer"):
+            metadata["software_modified"] = True
+            metadata["software"] = tags["producer"]
+
+        for key in ("duration", "sample_rate"):
+            if key in tags and key not in metadata:
+                metadata[key] = tags[key]
+
     except Exception as e:
         logger.error(f"Audio metadata extraction error: {str(e)}")
-    
+
     return metadata
@@ -0,0 +1,45 @@
+import hashlib
+import json
+import os
+from utils.tiered_cache import TieredCache
+
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "./cache/results")
+RESULT_CACHE_MEMORY_ITEMS = int(os.getenv("RESULT_CACHE_MEMORY_ITEMS", "512"))
+RESULT_CACHE_DISK_BYTES = int(os.getenv("RESULT_CACHE_DISK_BYTES", str(512 * 1024 * 1024)))
+
+
+def make_cache_key(content_digest: str, media_kind: str, fingerprint: str) -> str:
+    """
+    Cache key for a finished analysis: the upload digest plus everything that can
+    change the result (media kind, model versions, sampling and fusion config).
+    """
+    raw = f"{fingerprint}|{media_kind}|{content_digest}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResultCache(TieredCache):
+    """
+    Content-addressed cache of finished AnalysisResult dicts.
+    Tier 1 is an in-memory LRU of max_memory_items results, tier 2 a directory of JSON files.
+    """
+
+    label = "Result cache"
+    suffix = ".json"
+
+    def __init__(self, directory: str = RESULT_CACHE_DIR, max_memory_items: int = RESULT_CACHE_MEMORY_ITEMS,
+                 max_disk_bytes: int = RESULT_CACHE_DISK_BYTES):
+        super().__init__(directory, max_memory_items, max_disk_bytes)
+
+    def _copy_out(self, result: dict) -> dict:
+        # Callers add job_id/cached to what they get back
+        return dict(result)
+
+    def _read_file(self, path: str):
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def _write_file(self, f, result: dict):
+        f.write(json.dumps(result).encode("utf-8"))
+
+
+result_cache = ResultCache()
@@ -0,0 +1,215 @@
+import json
+from abc import ABC, abstractmethod
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from utils.logger import logger
+
+RESULT_STORE = os.getenv("RESULT_STORE", "sqlite")
+RESULT_STORE_PATH = os.getenv("RESULT_STORE_PATH", "./cache/job_results.sqlite3")
+RESULT_TTL_SECONDS = int(os.getenv("RESULT_TTL_SECONDS", str(24 * 3600)))
+RESULT_STORE_MAX_ITEMS = int(os.getenv("RESULT_STORE_MAX_ITEMS", "1000000"))
+
+
+class ResultStore(ABC):
+    """
+    Job id -> job state/result, with TTL and max-size eviction.
+    Also supports store[job_id] = value and store.get(job_id) so it can stand in for a dict.
+    """
+
+    @abstractmethod
+    def get(self, job_id: str, default=None):
+        ...
+
+    @abstractmethod
+    def set(self, job_id: str, value: dict):
+        ...
+
+    @abstractmethod
+    def add(self, job_id: str, value: dict) -> bool:
+        """Stores value only if job_id has no live entry; True when it was stored. Atomic."""
+        ...
+
+    @abstractmethod
+    def delete(self, job_id: str):
+        ...
+
+    def stats(self) -> dict:
+        return {}
+
+    def __setitem__(self, job_id: str, value: dict):
+        self.set(job_id, value)
+
+    def __getitem__(self, job_id: str):
+        value = self.get(job_id)
+        if value is None:
+            raise KeyError(job_id)
+        return value
+
+
+class MemoryResultStore(ResultStore):
+    """Per-process store; entries are kept in update order so eviction pops from the front"""
+
+    def __init__(self, ttl_seconds: int = RESULT_TTL_SECONDS, max_items: int = RESULT_STORE_MAX_ITEMS):
+        self.ttl_seconds = ttl_seconds
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, job_id: str, default=None):
+        with self._lock:
+            entry = self._items.get(job_id)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._items[job_id]
+                return default
+            return value
+
+    def set(self, job_id: str, value: dict):
+        now = time.time()
+        with self._lock:
+            self._items[job_id] = (now + self.ttl_seconds, value)
+            self._items.move_to_end(job_id)
+            self._evict(now)
+
+    def add(self, job_id: str, value: dict) -> bool:
+        now = time.time()
+        with self._lock:
+            entry = self._items.get(job_id)
+            if entry is not None and entry[0] >= now:
+                return False
+            self._items[job_id] = (now + self.ttl_seconds, value)
+            self._items.move_to_end(job_id)
+            self._evict(now)
+            return True
+
+    def delete(self, job_id: str):
+        with self._lock:
+            self._items.pop(job_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"backend": "memory", "items": len(self._items)}
+
+    def _evict(self, now: float):
+        # Same TTL for every entry, so the oldest update is always first to expire
+        while self._items:
+            job_id, (expires_at, _) = next(iter(self._items.items()))
+            if expires_at >= now and len(self._items) <= self.max_items:
+                break
+            del self._items[job_id]
+
+
+class SQLiteResultStore(ResultStore):
+    """
+    SQLite-backed store shared by every worker process on the host.
+    Lookups go through the primary key index; expiry and size eviction use
+    their own indexes and only run every few hundred writes.
+    """
+
+    EVICT_EVERY = 500
+
+    def __init__(self, path: str = RESULT_STORE_PATH, ttl_seconds: int = RESULT_TTL_SECONDS,
+                 max_items: int = RESULT_STORE_MAX_ITEMS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_items = max_items
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS job_results (
+                job_id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_job_results_expires ON job_results (expires_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_job_results_updated ON job_results (updated_at)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, job_id: str, default=None):
+        row = self._conn().execute(
+            "SELECT payload FROM job_results WHERE job_id = ? AND expires_at >= ?",
+            (job_id, time.time())
+        ).fetchone()
+        if row is None:
+            return default
+        return json.loads(row[0])
+
+    def set(self, job_id: str, value: dict):
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO job_results (job_id, payload, expires_at, updated_at) VALUES (?, ?, ?, ?)",
+            (job_id, json.dumps(value), now + self.ttl_seconds, now)
+        )
+
+        with self._lock:
+            self._writes += 1
+            due = self._writes % self.EVICT_EVERY == 0
+        if due:
+            self._evict(now)
+
+    def add(self, job_id: str, value: dict) -> bool:
+        now = time.time()
+        conn = self._conn()
+        # An expired row would otherwise block the insert until the next eviction
+        conn.execute("DELETE FROM job_results WHERE job_id = ? AND expires_at < ?", (job_id, now))
+        # The primary key makes this insert-if-absent atomic across threads and processes
+        inserted = conn.execute(
+            "INSERT OR IGNORE INTO job_results (job_id, payload, expires_at, updated_at) VALUES (?, ?, ?, ?)",
+            (job_id, json.dumps(value), now + self.ttl_seconds, now)
+        ).rowcount
+        return inserted == 1
+
+    def delete(self, job_id: str):
+        self._conn().execute("DELETE FROM job_results WHERE job_id = ?", (job_id,))
+
+    def stats(self) -> dict:
+        return {"backend": "sqlite", "path": self.path}
+
+    def _evict(self, now: float):
+        try:
+            conn = self._conn()
+            expired = conn.execute("DELETE FROM job_results WHERE expires_at < ?", (now,)).rowcount
+            # Drop everything past the newest max_items rows
+            overflow = conn.execute(
+                "DELETE FROM job_results WHERE updated_at <= ("
+                "SELECT updated_at FROM job_results ORDER BY updated_at DESC LIMIT 1 OFFSET ?)",
+                (self.max_items,)
+            ).rowcount
+            if expired or overflow:
+                logger.info(f"Result store evicted {expired} expired and {overflow} overflow jobs")
+        except sqlite3.Error as e:
+            logger.error(f"Result store eviction error: {str(e)}")
+
+
+def create_result_store() -> ResultStore:
+    if RESULT_STORE == "memory":
+        return MemoryResultStore()
+    if RESULT_STORE == "sqlite":
+        return SQLiteResultStore()
+    raise ValueError(f"Unknown RESULT_STORE: {RESULT_STORE}")
+
+
+# Shared by the API routes and the Celery worker
+job_store = create_result_store()
@@ -0,0 +1,265 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from fastapi.concurrency import run_in_threadpool
+from utils.ingest import (
+    IngestedMedia, UploadTooLarge, MAX_UPLOAD_BYTES, INGEST_DIR, SNIFF_BYTES,
+    sniff_content_type, resolve_content_type
+)
+from utils.logger import logger
+
+RESUMABLE_UPLOAD_DIR = os.getenv("RESUMABLE_UPLOAD_DIR", os.path.join(INGEST_DIR, "resumable"))
+RESUMABLE_UPLOAD_TTL_SECONDS = int(os.getenv("RESUMABLE_UPLOAD_TTL_SECONDS", str(24 * 3600)))
+
+
+class UploadNotFound(Exception):
+    pass
+
+
+class OffsetMismatch(Exception):
+    def __init__(self, expected: int):
+        super().__init__(f"Upload is at offset {expected}")
+        self.expected = expected
+
+
+class UploadBusy(Exception):
+    pass
+
+
+class UploadIncomplete(Exception):
+    pass
+
+
+class ResumableUpload:
+    """
+    One upload in progress: a staging file that chunks are appended to in place,
+    plus a running sha256 so finalize never has to re-read the file.
+    """
+
+    def __init__(self, upload_id: str, filename: str, content_type: str, size, created_at: float, staging_dir: str):
+        self.upload_id = upload_id
+        self.filename = filename or ""
+        self.content_type = content_type
+        self.size = size
+        self.created_at = created_at
+        self.path = os.path.join(staging_dir, f"{upload_id}.part")
+        self.meta_path = os.path.join(staging_dir, f"{upload_id}.json")
+        self.offset = 0
+        self.head = b""
+        self.hasher = hashlib.sha256()
+        self.lock = asyncio.Lock()
+
+    @property
+    def extension(self) -> str:
+        return self.filename.rsplit(".", 1)[-1].lower() if "." in self.filename else "bin"
+
+    def expired(self, now: float, ttl: int) -> bool:
+        return self.created_at + ttl < now
+
+    def to_dict(self) -> dict:
+        return {
+            "upload_id": self.upload_id,
+            "filename": self.filename,
+            "content_type": self.content_type,
+            "size": self.size,
+            "created_at": self.created_at,
+        }
+
+    def _write(self, f, chunk: bytes):
+        f.write(chunk)
+        self.hasher.update(chunk)
+        if len(self.head) < SNIFF_BYTES:
+            self.head += chunk[:SNIFF_BYTES - len(self.head)]
+        self.offset += len(chunk)
+
+    def rehash(self):
+        """Rebuild offset, head and digest from the staging file after a restart lost them"""
+        self.hasher = hashlib.sha256()
+        self.head = b""
+        self.offset = 0
+        with open(self.path, "rb") as f:
+            while True:
+                chunk = f.read(1024 * 1024)
+                if not chunk:
+                    break
+                self.hasher.update(chunk)
+                if len(self.head) < SNIFF_BYTES:
+                    self.head += chunk[:SNIFF_BYTES - len(self.head)]
+                self.offset += len(chunk)
+
+
+class ResumableUploadManager:
+    """
+    In-process registry of resumable uploads. Session metadata is mirrored next
+    to the staging file, so an upload survives an API restart; its digest is
+    then rebuilt from the bytes already received.
+    """
+
+    def __init__(self, staging_dir: str = RESUMABLE_UPLOAD_DIR, ttl_seconds: int = RESUMABLE_UPLOAD_TTL_SECONDS,
+                 max_bytes: int = MAX_UPLOAD_BYTES):
+        self.staging_dir = staging_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._uploads = {}
+        self._disk_purged_at = 0.0
+        os.makedirs(self.staging_dir, exist_ok=True)
+        # Sessions left behind by an earlier process are only on disk
+        self._purge_expired()
+
+    def create(self, filename: str, content_type: str, size=None) -> ResumableUpload:
+        if size is not None and size > self.max_bytes:
+            raise UploadTooLarge(f"Upload exceeds the {self.max_bytes} byte limit")
+        self._purge_expired()
+
+        upload = ResumableUpload(uuid.uuid4().hex, filename, content_type, size, time.time(), self.staging_dir)
+        open(upload.path, "wb").close()
+        with open(upload.meta_path, "w") as f:
+            json.dump(upload.to_dict(), f)
+
+        self._uploads[upload.upload_id] = upload
+        logger.info(f"Created resumable upload {upload.upload_id} ({size or 'unknown'} bytes)")
+        return upload
+
+    def get(self, upload_id: str) -> ResumableUpload:
+        upload = self._uploads.get(upload_id)
+        if upload is None:
+            upload = self._restore(upload_id)
+        if upload.expired(time.time(), self.ttl_seconds):
+            self.discard(upload)
+            raise UploadNotFound(upload_id)
+        return upload
+
+    async def append(self, upload_id: str, offset: int, chunks) -> int:
+        """Appends a request body at offset, which must be where the upload currently ends"""
+        upload = self.get(upload_id)
+        if upload.lock.locked():
+            raise UploadBusy(f"Upload {upload_id} is already receiving a chunk")
+
+        async with upload.lock:
+            if offset != upload.offset:
+                raise OffsetMismatch(upload.offset)
+
+            limit = upload.size if upload.size is not None else self.max_bytes
+            with open(upload.path, "r+b") as f:
+                f.seek(upload.offset)
+                # Bytes are kept as they arrive, so a dropped connection only loses the unsent rest
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    if upload.offset + len(chunk) > limit:
+                        raise UploadTooLarge(f"Upload exceeds its {limit} byte limit")
+                    await run_in_threadpool(upload._write, f, chunk)
+                # Drop anything left past the offset by an earlier, interrupted attempt
+                f.truncate(upload.offset)
+            return upload.offset
+
+    def check_complete(self, upload_id: str) -> ResumableUpload:
+        """The upload if finalize would accept it now; raises the same errors finalize does"""
+        upload = self.get(upload_id)
+        if upload.lock.locked():
+            raise UploadBusy(f"Upload {upload_id} is still receiving a chunk")
+        if upload.size is not None and upload.offset != upload.size:
+            raise UploadIncomplete(f"Upload has {upload.offset} of {upload.size} bytes")
+        if upload.offset == 0:
+            raise UploadIncomplete("Upload is empty")
+        return upload
+
+    def finalize(self, upload_id: str) -> IngestedMedia:
+        """Turns the staging file into an IngestedMedia; a rename, unless the dirs are on different filesystems"""
+        upload = self.check_complete(upload_id)
+
+        os.makedirs(INGEST_DIR, exist_ok=True)
+        path = os.path.join(INGEST_DIR, f"{upload.upload_id}.{upload.extension}")
+        os.truncate(upload.path, upload.offset)
+        try:
+            os.replace(upload.path, path)
+        except OSError:
+            # EXDEV: RESUMABLE_UPLOAD_DIR is on another filesystem than INGEST_DIR
+            shutil.move(upload.path, path)
+        self._forget(upload)
+
+        content_type = resolve_content_type(sniff_content_type(upload.head), upload.content_type)
+        return IngestedMedia(
+            path=path,
+            size=upload.offset,
+            sha256=upload.hasher.hexdigest(),
+            content_type=content_type,
+            declared_content_type=upload.content_type,
+            extension=upload.extension
+        )
+
+    def discard(self, upload: ResumableUpload):
+        self._forget(upload)
+        if os.path.exists(upload.path):
+            os.remove(upload.path)
+
+    def _forget(self, upload: ResumableUpload):
+        self._uploads.pop(upload.upload_id, None)
+        if os.path.exists(upload.meta_path):
+            os.remove(upload.meta_path)
+
+    def _restore(self, upload_id: str) -> ResumableUpload:
+        meta_path = os.path.join(self.staging_dir, f"{upload_id}.json")
+        # Ids are hex uuids; anything else can't name a staging file
+        if not upload_id.isalnum() or not os.path.exists(meta_path):
+            raise UploadNotFound(upload_id)
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+        upload = ResumableUpload(
+            upload_id, meta["filename"], meta["content_type"], meta["size"], meta["created_at"], self.staging_dir
+        )
+        if not os.path.exists(upload.path):
+            raise UploadNotFound(upload_id)
+
+        upload.rehash()
+        self._uploads[upload_id] = upload
+        logger.info(f"Restored resumable upload {upload_id} at offset {upload.offset}")
+        return upload
+
+    def _purge_expired(self):
+        now = time.time()
+        for upload in list(self._uploads.values()):
+            if upload.expired(now, self.ttl_seconds) and not upload.lock.locked():
+                self.discard(upload)
+
+        # Sessions nobody resumed since a restart are only on disk; scanning for them is rarer
+        if now - self._disk_purged_at >= min(self.ttl_seconds, 3600):
+            self._disk_purged_at = now
+            self._purge_expired_on_disk(now)
+
+    def _purge_expired_on_disk(self, now: float):
+        purged = 0
+        for name in os.listdir(self.staging_dir):
+            upload_id, ext = os.path.splitext(name)
+            if upload_id in self._uploads or ext not in (".json", ".part"):
+                continue
+            path = os.path.join(self.staging_dir, name)
+            try:
+                if ext == ".json":
+                    with open(path) as f:
+                        created_at = json.load(f)["created_at"]
+                elif os.path.exists(os.path.join(self.staging_dir, f"{upload_id}.json")):
+                    # Judged by its metadata file
+                    continue
+                else:
+                    created_at = os.path.getmtime(path)
+                if created_at + self.ttl_seconds >= now:
+                    continue
+                os.remove(path)
+                if ext == ".json":
+                    part_path = os.path.join(self.staging_dir, f"{upload_id}.part")
+                    if os.path.exists(part_path):
+                        os.remove(part_path)
+                purged += 1
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Could not purge resumable upload file {path}: {e}")
+        if purged:
+            logger.info(f"Purged {purged} expired resumable uploads from disk")
+
+
+resumable_uploads = ResumableUploadManager()
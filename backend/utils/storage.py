@@ -1,9 +1,13 @@
+import io
 import os
+import threading
 import dotenv
 dotenv.load_dotenv()
 from urllib.parse import urlparse
 
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import BotoCoreError, ClientError
 
 from utils.logger import logger
@@ -13,30 +17,85 @@ dotenv.load_dotenv()
 
 AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
 AWS_S3_BUCKET = os.getenv("AWS_S3_BUCKET", "deepfake-media")
+# Point at a local S3 stand-in (MinIO, moto_server) for development and benchmarks
+AWS_S3_ENDPOINT_URL = os.getenv("AWS_S3_ENDPOINT_URL") or None
 AWS_S3_BASE_URL = os.getenv(
     "AWS_S3_BASE_URL",
-    f"https://{AWS_S3_BUCKET}.s3.{AWS_REGION}.amazonaws.com"
+    f"{AWS_S3_ENDPOINT_URL.rstrip('/')}/{AWS_S3_BUCKET}" if AWS_S3_ENDPOINT_URL
+    else f"https://{AWS_S3_BUCKET}.s3.{AWS_REGION}.amazonaws.com"
 )
 _client = None
+_client_lock = threading.Lock()
+
+STORAGE_CONNECT_TIMEOUT = float(os.getenv("STORAGE_CONNECT_TIMEOUT", "2"))
+STORAGE_READ_TIMEOUT = float(os.getenv("STORAGE_READ_TIMEOUT", "30"))
+STORAGE_MAX_ATTEMPTS = int(os.getenv("STORAGE_MAX_ATTEMPTS", "2"))
+
+# Threads running blocking S3 calls on behalf of the async storage backend
+STORAGE_IO_WORKERS = int(os.getenv("STORAGE_IO_WORKERS", "4"))
+
+# Multipart/ranged transfer tuning: files above the threshold are split into
+# chunks moved by up to STORAGE_MAX_CONCURRENCY threads per transfer
+STORAGE_MULTIPART_THRESHOLD = int(os.getenv("STORAGE_MULTIPART_THRESHOLD", str(8 * 1024 * 1024)))
+STORAGE_MULTIPART_CHUNKSIZE = int(os.getenv("STORAGE_MULTIPART_CHUNKSIZE", str(8 * 1024 * 1024)))
+STORAGE_MAX_CONCURRENCY = int(os.getenv("STORAGE_MAX_CONCURRENCY", "8"))
+
+# Every transfer thread needs its own connection, so size the shared pool for
+# every storage IO worker running a transfer at full concurrency
+STORAGE_MAX_POOL_CONNECTIONS = int(os.getenv(
+    "STORAGE_MAX_POOL_CONNECTIONS",
+    str(STORAGE_MAX_CONCURRENCY * STORAGE_IO_WORKERS + 2)
+))
+
+def make_transfer_config(max_concurrency: int = STORAGE_MAX_CONCURRENCY,
+                         chunksize: int = STORAGE_MULTIPART_CHUNKSIZE,
+                         threshold: int = STORAGE_MULTIPART_THRESHOLD) -> TransferConfig:
+    return TransferConfig(
+        multipart_threshold=threshold,
+        multipart_chunksize=chunksize,
+        max_concurrency=max_concurrency,
+        use_threads=max_concurrency > 1,
+    )
+
+TRANSFER_CONFIG = make_transfer_config()
+
+def make_client(max_pool_connections: int = STORAGE_MAX_POOL_CONNECTIONS, endpoint_url: str = AWS_S3_ENDPOINT_URL):
+    config = Config(
+        max_pool_connections=max_pool_connections,
+        # Fail fast on an unreachable endpoint; the circuit breaker handles outages
+        connect_timeout=STORAGE_CONNECT_TIMEOUT,
+        read_timeout=STORAGE_READ_TIMEOUT,
+        retries={"max_attempts": STORAGE_MAX_ATTEMPTS, "mode": "standard"},
+        # Stand-ins generally only serve path-style URLs
+        s3={"addressing_style": "path"} if endpoint_url else None,
+    )
+    return boto3.client(
+        "s3",
+        region_name=AWS_REGION,
+        endpoint_url=endpoint_url,
+        config=config,
+    )
 
 def get_client():
+    """Process-wide S3 client; boto3 clients are thread-safe and share one connection pool"""
     global _client
     if _client is None:
-        _client = boto3.client(
-            "s3",
-            region_name=AWS_REGION,
-        )
-        try:
-          _client.head_bucket(Bucket=AWS_S3_BUCKET)
-        except ClientError as e:
-          logger.error(
-          f"S3 bucket '{AWS_S3_BUCKET}' not accessible. "
-          f"Create it manually or fix IAM permissions."
-          )
-          raise
-
+        with _client_lock:
+            if _client is None:
+                _client = make_client()
     return _client
 
+def check_bucket():
+    """Cheap reachability check, used as the storage circuit breaker's recovery probe"""
+    try:
+        get_client().head_bucket(Bucket=AWS_S3_BUCKET)
+    except ClientError:
+        logger.error(
+            f"S3 bucket '{AWS_S3_BUCKET}' not accessible. "
+            f"Create it manually or fix IAM permissions."
+        )
+        raise
+
 def _parse_s3_url(url: str) -> tuple[str, str]:
     if url.startswith("s3://"):
         path = url[len("s3://"):]
@@ -64,14 +123,37 @@ def _parse_s3_url(url: str) -> tuple[str, str]:
 def upload_to_storage(data: bytes, object_name: str, content_type: str = "application/octet-stream") -> str:
     try:
         client = get_client()
-        client.put_object(
-            Bucket=AWS_S3_BUCKET,
-            Key=object_name,
-            Body=data,
-            ContentType=content_type
+        client.upload_fileobj(
+            io.BytesIO(data),
+            AWS_S3_BUCKET,
+            object_name,
+            ExtraArgs={"ContentType": content_type},
+            Config=TRANSFER_CONFIG
+        )
+
+        url = object_url(object_name)
+        
+        logger.info(f"Uploaded {object_name} to storage")
+        
+        return url
+    
+    except Exception as e:
+        logger.error(f"Storage upload error: {str(e)}")
+        raise
+
+def upload_file_to_storage(file_path: str, object_name: str, content_type: str = "application/octet-stream") -> str:
+    """Streams a local file to storage, as a concurrent multipart upload above the threshold"""
+    try:
+        client = get_client()
+        client.upload_file(
+            file_path,
+            AWS_S3_BUCKET,
+            object_name,
+            ExtraArgs={"ContentType": content_type},
+            Config=TRANSFER_CONFIG
         )
 
-        url = f"{AWS_S3_BASE_URL}/{object_name}"
+        url = object_url(object_name)
         
         logger.info(f"Uploaded {object_name} to storage")
         
@@ -79,43 +161,72 @@ def upload_to_storage(data: bytes, object_name: str, content_type: str = "applic
     
     except Exception as e:
         logger.error(f"Storage upload error: {str(e)}")
+        raise
+
+def download_to_file(url: str, dest_path: str) -> str:
+    """Streams an object to dest_path with ranged parallel GETs; nothing is held in memory"""
+    try:
+        bucket, key = _parse_s3_url(url)
+
+        client = get_client()
+        client.download_file(bucket, key, dest_path, Config=TRANSFER_CONFIG)
+        
+        logger.info(f"Downloaded {key} from storage to {dest_path}")
         
-        temp_path = f"./temp_storage/{object_name}"
-        os.makedirs("./temp_storage", exist_ok=True)
-        with open(temp_path, 'wb') as f:
-            f.write(data)
-        logger.warning(f"Saved to local temp storage: {temp_path}")
-        return f"file://{temp_path}"
+        return dest_path
+    
+    except Exception as e:
+        logger.error(f"Storage download error: {str(e)}")
+        raise
 
 def download_from_storage(url: str) -> bytes:
     try:
-        if url.startswith("file://"):
-            file_path = url.replace("file://", "")
-            with open(file_path, 'rb') as f:
-                return f.read()
-
         bucket, key = _parse_s3_url(url)
 
         client = get_client()
-        response = client.get_object(Bucket=bucket, Key=key)
-        data = response["Body"].read()
+        buffer = io.BytesIO()
+        client.download_fileobj(bucket, key, buffer, Config=TRANSFER_CONFIG)
         
         logger.info(f"Downloaded {key} from storage")
         
-        return data
+        return buffer.getvalue()
     
     except Exception as e:
         logger.error(f"Storage download error: {str(e)}")
         raise
 
-def delete_from_storage(url: str) -> bool:
+def object_url(object_name: str) -> str:
+    return f"{AWS_S3_BASE_URL}/{object_name}"
+
+def presign_put(object_name: str, content_type: str, expires_in: int) -> str:
+    """Presigned PUT URL for the client to upload straight to the bucket; signed locally, no request"""
+    return get_client().generate_presigned_url(
+        "put_object",
+        Params={"Bucket": AWS_S3_BUCKET, "Key": object_name, "ContentType": content_type},
+        ExpiresIn=expires_in,
+    )
+
+def stat_object(object_name: str):
+    """Size and content type of an object, or None if it does not exist"""
     try:
-        if url.startswith("file://"):
-            file_path = url.replace("file://", "")
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            return True
+        head = get_client().head_object(Bucket=AWS_S3_BUCKET, Key=object_name)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+    return {
+        "url": object_url(object_name),
+        "size": head["ContentLength"],
+        "content_type": head.get("ContentType"),
+    }
+
+def open_storage_stream(url: str):
+    """Body of a GET on the object, for callers that consume it chunk by chunk"""
+    bucket, key = _parse_s3_url(url)
+    return get_client().get_object(Bucket=bucket, Key=key)["Body"]
 
+def delete_from_storage(url: str) -> bool:
+    try:
         bucket, key = _parse_s3_url(url)
 
         client = get_client()
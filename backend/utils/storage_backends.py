@@ -0,0 +1,431 @@
+import asyncio
+import os
+from abc import ABC, abstractmethod
+from typing import AsyncIterator
+import shutil
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from utils.circuit_breaker import CircuitBreaker, CircuitOpen, CLOSED
+from utils.logger import logger
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "s3")
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", "./temp_storage")
+STORAGE_STREAM_CHUNK_BYTES = int(os.getenv("STORAGE_STREAM_CHUNK_BYTES", str(1024 * 1024)))
+
+# With s3, keep serving from local disk while S3 is unreachable ("none" disables)
+STORAGE_FALLBACK = os.getenv("STORAGE_FALLBACK", "local")
+STORAGE_BREAKER_FAILURES = int(os.getenv("STORAGE_BREAKER_FAILURES", "3"))
+STORAGE_BREAKER_PROBE_SECONDS = float(os.getenv("STORAGE_BREAKER_PROBE_SECONDS", "10"))
+
+
+class StorageBackend(ABC):
+    """
+    Async media storage. upload returns the URL the object is reachable at; download,
+    stream and delete take that URL back. Blocking work never runs on the event loop.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    async def upload(self, file_path: str, key: str, content_type: str = "application/octet-stream") -> str:
+        ...
+
+    @abstractmethod
+    async def upload_bytes(self, data: bytes, key: str, content_type: str = "application/octet-stream") -> str:
+        ...
+
+    @abstractmethod
+    async def download(self, url: str, dest_path: str) -> str:
+        ...
+
+    @abstractmethod
+    def stream(self, url: str, chunk_size: int = STORAGE_STREAM_CHUNK_BYTES) -> AsyncIterator[bytes]:
+        """Chunks of the stored object; implementations are async generators"""
+        ...
+
+    @abstractmethod
+    async def delete(self, url: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def stat(self, key: str):
+        """{"url", "size", "content_type"} for a stored key, or None if nothing is there"""
+        ...
+
+    def presign_upload(self, key: str, content_type: str, expires_in: int):
+        """
+        Upload target the client can PUT to directly, as {"url", "method", "headers"}.
+        None when the backend cannot accept direct uploads and the bytes have to go
+        through the API.
+        """
+        return None
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+
+class LocalStorageBackend(StorageBackend):
+    """Files under a local directory, served by the /uploads static mount"""
+
+    name = "local"
+
+    def __init__(self, root: str = LOCAL_STORAGE_DIR):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"Storage key escapes the storage root: {key}")
+        return path
+
+    def _path_from_url(self, url: str) -> str:
+        if not url.startswith("file://"):
+            raise ValueError(f"Not a local storage URL: {url}")
+        return url[len("file://"):]
+
+    def _url(self, key: str) -> str:
+        return f"file://{self.root}/{key}"
+
+    def _copy(self, src: str, dest: str):
+        os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+        shutil.copyfile(src, dest)
+
+    def _write(self, data: bytes, dest: str):
+        os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+        with open(dest, "wb") as f:
+            f.write(data)
+
+    async def upload(self, file_path: str, key: str, content_type: str = "application/octet-stream") -> str:
+        await asyncio.to_thread(self._copy, file_path, self._path(key))
+        logger.info(f"Stored {key} on local disk")
+        return self._url(key)
+
+    async def upload_bytes(self, data: bytes, key: str, content_type: str = "application/octet-stream") -> str:
+        await asyncio.to_thread(self._write, data, self._path(key))
+        return self._url(key)
+
+    async def download(self, url: str, dest_path: str) -> str:
+        await asyncio.to_thread(self._copy, self._path_from_url(url), dest_path)
+        return dest_path
+
+    async def stream(self, url: str, chunk_size: int = STORAGE_STREAM_CHUNK_BYTES):
+        f = await asyncio.to_thread(open, self._path_from_url(url), "rb")
+        try:
+            while True:
+                chunk = await asyncio.to_thread(f.read, chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            f.close()
+
+    async def delete(self, url: str) -> bool:
+        path = self._path_from_url(url)
+        try:
+            await asyncio.to_thread(os.remove, path)
+        except FileNotFoundError:
+            pass
+        return True
+
+    async def stat(self, key: str):
+        path = self._path(key)
+        try:
+            size = (await asyncio.to_thread(os.stat, path)).st_size
+        except FileNotFoundError:
+            return None
+        return {"url": self._url(key), "size": size, "content_type": None}
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "root": self.root}
+
+
+class MemoryStorageBackend(StorageBackend):
+    """Objects kept in a dict; for tests and benchmarks that should not touch disk or network"""
+
+    name = "memory"
+
+    def __init__(self):
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    def _key_from_url(self, url: str) -> str:
+        if not url.startswith("memory://"):
+            raise ValueError(f"Not a memory storage URL: {url}")
+        return url[len("memory://"):]
+
+    def _get(self, url: str) -> bytes:
+        key = self._key_from_url(url)
+        with self._lock:
+            if key not in self._objects:
+                raise FileNotFoundError(url)
+            return self._objects[key]
+
+    async def upload(self, file_path: str, key: str, content_type: str = "application/octet-stream") -> str:
+        def read():
+            with open(file_path, "rb") as f:
+                return f.read()
+        return await self.upload_bytes(await asyncio.to_thread(read), key, content_type)
+
+    async def upload_bytes(self, data: bytes, key: str, content_type: str = "application/octet-stream") -> str:
+        with self._lock:
+            self._objects[key] = bytes(data)
+        return f"memory://{key}"
+
+    async def download(self, url: str, dest_path: str) -> str:
+        data = self._get(url)
+
+        def write():
+            with open(dest_path, "wb") as f:
+                f.write(data)
+        await asyncio.to_thread(write)
+        return dest_path
+
+    async def stream(self, url: str, chunk_size: int = STORAGE_STREAM_CHUNK_BYTES):
+        data = self._get(url)
+        for offset in range(0, len(data), chunk_size):
+            yield data[offset:offset + chunk_size]
+
+    async def delete(self, url: str) -> bool:
+        with self._lock:
+            return self._objects.pop(self._key_from_url(url), None) is not None
+
+    async def stat(self, key: str):
+        with self._lock:
+            data = self._objects.get(key)
+        if data is None:
+            return None
+        return {"url": f"memory://{key}", "size": len(data), "content_type": None}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": self.name,
+                "objects": len(self._objects),
+                "bytes": sum(len(v) for v in self._objects.values()),
+            }
+
+
+class S3StorageBackend(StorageBackend):
+    """
+    S3 through the multipart transfer manager in utils/storage.py. The blocking
+    boto3 calls run on a dedicated pool so they never hold up the event loop or
+    compete with request handling for the default executor.
+    """
+
+    name = "s3"
+
+    def __init__(self):
+        from utils import storage
+        self._storage = storage
+        self._executor = ThreadPoolExecutor(max_workers=storage.STORAGE_IO_WORKERS, thread_name_prefix="storage-io")
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def upload(self, file_path: str, key: str, content_type: str = "application/octet-stream") -> str:
+        return await self._run(self._storage.upload_file_to_storage, file_path, key, content_type)
+
+    async def upload_bytes(self, data: bytes, key: str, content_type: str = "application/octet-stream") -> str:
+        return await self._run(self._storage.upload_to_storage, data, key, content_type)
+
+    async def download(self, url: str, dest_path: str) -> str:
+        return await self._run(self._storage.download_to_file, url, dest_path)
+
+    async def stream(self, url: str, chunk_size: int = STORAGE_STREAM_CHUNK_BYTES):
+        body = await self._run(self._storage.open_storage_stream, url)
+        try:
+            while True:
+                chunk = await self._run(body.read, chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            body.close()
+
+    async def delete(self, url: str) -> bool:
+        return await self._run(self._storage.delete_from_storage, url)
+
+    async def stat(self, key: str):
+        return await self._run(self._storage.stat_object, key)
+
+    def presign_upload(self, key: str, content_type: str, expires_in: int):
+        return {
+            "url": self._storage.presign_put(key, content_type, expires_in),
+            "method": "PUT",
+            # Part of the signature, the client must send it unchanged
+            "headers": {"Content-Type": content_type},
+        }
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "bucket": self._storage.AWS_S3_BUCKET}
+
+
+class ResilientStorageBackend(StorageBackend):
+    """
+    Primary backend behind a circuit breaker, with uploads rerouted to a fallback.
+    While the breaker is open, uploads go straight to the fallback and reads of
+    primary URLs fail immediately, so an outage costs no timeouts per request.
+    URLs are routed to whichever backend issued them.
+    """
+
+    def __init__(self, primary: StorageBackend, fallback: StorageBackend, breaker: CircuitBreaker):
+        self.primary = primary
+        self.fallback = fallback
+        self.breaker = breaker
+        self.name = f"{primary.name}+{fallback.name}"
+        self.fallback_uploads = 0
+
+    def _is_fallback_url(self, url: str) -> bool:
+        return url.startswith("file://") or url.startswith("memory://")
+
+    async def _upload(self, method: str, source, key: str, content_type: str) -> str:
+        if self.breaker.allow():
+            try:
+                url = await getattr(self.primary, method)(source, key, content_type)
+                self.breaker.record_success()
+                return url
+            except Exception as e:
+                self.breaker.record_failure()
+                logger.warning(f"{self.primary.name} upload of {key} failed, using {self.fallback.name}: {str(e)}")
+            except BaseException:
+                # Cancelled: says nothing about the primary, but must not hold the half-open trial forever
+                self.breaker.release()
+                raise
+
+        self.fallback_uploads += 1
+        return await getattr(self.fallback, method)(source, key, content_type)
+
+    async def upload(self, file_path: str, key: str, content_type: str = "application/octet-stream") -> str:
+        return await self._upload("upload", file_path, key, content_type)
+
+    async def upload_bytes(self, data: bytes, key: str, content_type: str = "application/octet-stream") -> str:
+        return await self._upload("upload_bytes", data, key, content_type)
+
+    def _guard(self, url: str):
+        if not self.breaker.allow():
+            raise CircuitOpen(f"{self.primary.name} storage unavailable, cannot read {url}")
+
+    async def download(self, url: str, dest_path: str) -> str:
+        if self._is_fallback_url(url):
+            return await self.fallback.download(url, dest_path)
+
+        self._guard(url)
+        try:
+            result = await self.primary.download(url, dest_path)
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        self.breaker.record_success()
+        return result
+
+    async def stream(self, url: str, chunk_size: int = STORAGE_STREAM_CHUNK_BYTES):
+        if self._is_fallback_url(url):
+            async for chunk in self.fallback.stream(url, chunk_size):
+                yield chunk
+            return
+
+        self._guard(url)
+        try:
+            async for chunk in self.primary.stream(url, chunk_size):
+                yield chunk
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # GeneratorExit from a consumer that stopped early, or cancellation
+            self.breaker.release()
+            raise
+        self.breaker.record_success()
+
+    async def delete(self, url: str) -> bool:
+        if self._is_fallback_url(url):
+            return await self.fallback.delete(url)
+        if not self.breaker.allow():
+            return False
+        try:
+            deleted = await self.primary.delete(url)
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        # The S3 driver reports errors as False (deleting a missing key still succeeds)
+        if deleted:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+        return deleted
+
+    async def stat(self, key: str):
+        if self.breaker.allow():
+            try:
+                found = await self.primary.stat(key)
+                self.breaker.record_success()
+                if found is not None:
+                    return found
+            except Exception as e:
+                self.breaker.record_failure()
+                logger.warning(f"{self.primary.name} stat of {key} failed: {str(e)}")
+            except BaseException:
+                self.breaker.release()
+                raise
+        # Uploads made while the breaker was open landed on the fallback
+        return await self.fallback.stat(key)
+
+    def presign_upload(self, key: str, content_type: str, expires_in: int):
+        # Signing is local, but a URL into an unreachable bucket is no use to the client
+        if self.breaker.state != CLOSED:
+            return None
+        return self.primary.presign_upload(key, content_type, expires_in)
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "primary": self.primary.stats(),
+            "fallback": self.fallback.stats(),
+            "fallback_uploads": self.fallback_uploads,
+            "circuit": self.breaker.stats(),
+        }
+
+
+def create_storage_backend(kind: str = STORAGE_BACKEND) -> StorageBackend:
+    if kind == "s3":
+        s3 = S3StorageBackend()
+        if STORAGE_FALLBACK == "local":
+            from utils.storage import check_bucket
+            breaker = CircuitBreaker(
+                "s3",
+                probe=check_bucket,
+                failure_threshold=STORAGE_BREAKER_FAILURES,
+                probe_interval=STORAGE_BREAKER_PROBE_SECONDS,
+            )
+            return ResilientStorageBackend(s3, LocalStorageBackend(), breaker)
+        return s3
+    if kind == "local":
+        return LocalStorageBackend()
+    if kind == "memory":
+        return MemoryStorageBackend()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {kind}")
+
+
+storage_backend = create_storage_backend()
+
+
+def archive_file_in_background(file_path: str, key: str, content_type: str = "application/octet-stream") -> Future:
+    """
+    Schedules an upload on the running event loop and returns a thread-safe future
+    resolving to the media URL, so job threads can wait on it. Must be called from
+    the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return asyncio.run_coroutine_threadsafe(storage_backend.upload(file_path, key, content_type), loop)
+
+
+def download_sync(url: str, dest_path: str) -> str:
+    """Blocking download for worker threads that have no event loop of their own"""
+    return asyncio.run(storage_backend.download(url, dest_path))
@@ -0,0 +1,153 @@
+import os
+import threading
+from collections import OrderedDict
+from utils.logger import logger
+
+
+class TieredCache:
+    """
+    Two-tier cache: an in-memory LRU bounded by max_memory (measured by _memory_cost),
+    in front of a directory of files evicted oldest-first once they pass max_disk_bytes.
+    The disk total is kept as a running count, so the directory is only listed at
+    startup and when eviction is due. Subclasses define the file format.
+    """
+
+    label = "Cache"
+    suffix = ""
+
+    def __init__(self, directory: str, max_memory: int, max_disk_bytes: int):
+        self.directory = directory
+        self.max_memory = max_memory
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._memory_used = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+    def _memory_cost(self, value) -> int:
+        return 1
+
+    def _read_file(self, path: str):
+        raise NotImplementedError
+
+    def _write_file(self, f, value):
+        raise NotImplementedError
+
+    def _copy_out(self, value):
+        """What get hands to callers; the cached value itself unless it must not be shared"""
+        return value
+
+    def get(self, key: str):
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._copy_out(value)
+
+        value = self._read_disk(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, value)
+        return self._copy_out(value)
+
+    def put(self, key: str, value):
+        with self._lock:
+            self._remember(key, value)
+        self._write_disk(key, value)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_items": len(self._memory),
+                "disk_bytes": self._disk_bytes,
+            }
+
+    def _remember(self, key: str, value):
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_used -= self._memory_cost(previous)
+        self._memory[key] = value
+        self._memory_used += self._memory_cost(value)
+        # The newest entry stays even if it alone is over budget
+        while self._memory_used > self.max_memory and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= self._memory_cost(evicted)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}{self.suffix}")
+
+    def _read_disk(self, key: str):
+        path = self._path(key)
+        try:
+            value = self._read_file(path)
+            # Touch so eviction treats it as recently used
+            os.utime(path, None)
+            return value
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"{self.label} read error for {key}: {str(e)}")
+            return None
+
+    def _write_disk(self, key: str, value):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                self._write_file(f, value)
+            size = os.path.getsize(tmp_path)
+
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+
+            with self._lock:
+                self._disk_bytes += size - previous
+                over_budget = self._disk_bytes > self.max_disk_bytes
+            if over_budget:
+                self._evict_disk()
+        except Exception as e:
+            logger.error(f"{self.label} write error for {key}: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _disk_entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict_disk(self):
+        entries = sorted(self._disk_entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        # Evict down to 90% of the budget so we don't rescan on every write
+        target = int(self.max_disk_bytes * 0.9)
+
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                continue
+
+        with self._lock:
+            self._disk_bytes = total
+        logger.info(f"{self.label} evicted down to {total} bytes")
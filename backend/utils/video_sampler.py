@@ -0,0 +1,162 @@
+import os
+import subprocess
+import cv2
+import numpy as np
+from utils.logger import logger
+
+# Videos at least this long are sampled from keyframes only (0 disables keyframe mode).
+# Long videos go to chunked analysis first (LONG_VIDEO_MIN_SECONDS), so with the defaults
+# this only applies when chunking is disabled
+KEYFRAME_ONLY_MIN_SECONDS = float(os.getenv("KEYFRAME_ONLY_MIN_SECONDS", "600"))
+
+
+def resize_to_height(frame, max_height: int):
+    """Downscale a frame so it is at most max_height pixels tall, keeping aspect ratio"""
+    if not max_height:
+        return frame
+    height, width = frame.shape[:2]
+    if height <= max_height:
+        return frame
+    scale = max_height / height
+    new_width = int(width * scale)
+    return cv2.resize(frame, (new_width, max_height), interpolation=cv2.INTER_AREA)
+
+
+def use_keyframe_mode(frame_count: int, fps: float) -> bool:
+    """Whether a video is long enough to be sampled from keyframes only"""
+    if KEYFRAME_ONLY_MIN_SECONDS <= 0 or not fps:
+        return False
+    return frame_count / fps >= KEYFRAME_ONLY_MIN_SECONDS
+
+
+def read_frames_seek(video_path: str, indices, max_height: int = None):
+    """
+    Seek-based sampling: cap.set(CAP_PROP_POS_FRAMES) before every frame.
+    Each seek re-decodes from the previous keyframe, so this is only kept
+    as the baseline for benchmarks.
+    """
+    cap = cv2.VideoCapture(video_path)
+    try:
+        for i in indices:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, i)
+            ret, frame = cap.read()
+            if ret:
+                yield i, resize_to_height(frame, max_height)
+    finally:
+        cap.release()
+
+
+def read_frames_sequential(video_path: str, indices, max_height: int = None):
+    """
+    Seek-free sampling: walk forward with grab() and only retrieve() the frames we keep.
+    Skipped frames are never converted to BGR or copied out of the decoder.
+    """
+    wanted = sorted(set(indices))
+    cap = cv2.VideoCapture(video_path)
+    position = 0
+
+    try:
+        for target in wanted:
+            while position < target:
+                if not cap.grab():
+                    return
+                position += 1
+
+            if not cap.grab():
+                return
+            position += 1
+
+            ret, frame = cap.retrieve()
+            if ret:
+                yield target, resize_to_height(frame, max_height)
+    finally:
+        cap.release()
+
+
+def keyframe_times(video_path: str) -> list:
+    """Presentation times (seconds) of the video keyframes, read from packet flags without decoding"""
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0",
+        video_path,
+    ]
+    output = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+
+    times = []
+    for line in output.splitlines():
+        parts = line.strip().split(",")
+        if len(parts) >= 2 and "K" in parts[1] and parts[0] not in ("", "N/A"):
+            times.append(float(parts[0]))
+    return sorted(times)
+
+
+def _evenly_spaced(count: int, max_items: int) -> list:
+    if not max_items or count <= max_items:
+        return list(range(count))
+    return sorted(set(np.linspace(0, count - 1, max_items).round().astype(int).tolist()))
+
+
+def read_keyframes(video_path: str, max_frames: int = None, max_height: int = None):
+    """
+    Keyframe-only sampling for very long uploads.
+    ffmpeg is told to skip every non-key frame at the decoder, so cost scales with
+    the number of keyframes rather than the number of frames. Yields
+    (frame_index, frame) pairs where frame_index is derived from the keyframe time.
+    """
+    times = keyframe_times(video_path)
+    if not times:
+        return
+
+    chosen = _evenly_spaced(len(times), max_frames)
+
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+
+    if width <= 0 or height <= 0:
+        return
+
+    out_height = height
+    out_width = width
+    if max_height and height > max_height:
+        out_height = max_height
+        out_width = int(width * max_height / height)
+    # rawvideo output needs even dimensions for most scalers
+    out_width -= out_width % 2
+    out_height -= out_height % 2
+
+    # With -skip_frame nokey the select filter only ever sees keyframes, so n is the keyframe number
+    select_expr = "+".join(f"eq(n\\,{k})" for k in chosen)
+    cmd = [
+        "ffmpeg", "-v", "error",
+        "-skip_frame", "nokey",
+        "-i", video_path,
+        "-map", "0:v:0",
+        "-vf", f"select={select_expr},scale={out_width}:{out_height}",
+        "-vsync", "0",
+        "-f", "rawvideo",
+        "-pix_fmt", "bgr24",
+        "pipe:1",
+    ]
+
+    frame_size = out_width * out_height * 3
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    try:
+        for k in chosen:
+            buffer = bytearray(frame_size)
+            read = process.stdout.readinto(buffer)
+            if read != frame_size:
+                break
+            frame = np.frombuffer(buffer, dtype=np.uint8).reshape(out_height, out_width, 3)
+            yield int(round(times[k] * fps)), frame
+    except Exception as e:
+        logger.error(f"Keyframe decode error: {str(e)}")
+    finally:
+        process.stdout.close()
+        process.kill()
+        process.wait()
@@ -0,0 +1,55 @@
+import hashlib
+import os
+import numpy as np
+from utils.tiered_cache import TieredCache
+
+VOCALS_CACHE_DIR = os.getenv("VOCALS_CACHE_DIR", "./cache/vocals")
+VOCALS_CACHE_MEMORY_BYTES = int(os.getenv("VOCALS_CACHE_MEMORY_BYTES", str(256 * 1024 * 1024)))
+VOCALS_CACHE_DISK_BYTES = int(os.getenv("VOCALS_CACHE_DISK_BYTES", str(1024 * 1024 * 1024)))
+
+
+def make_vocals_key(waveform: np.ndarray, sample_rate: int, variant: str) -> str:
+    """Content hash of the exact PCM handed to Demucs, plus the model/mode that separated it"""
+    digest = hashlib.sha256(f"{variant}|{sample_rate}|".encode("utf-8"))
+    digest.update(np.ascontiguousarray(waveform, dtype=np.float32).tobytes())
+    return digest.hexdigest()
+
+
+class VocalsCache(TieredCache):
+    """
+    Separated vocal stems keyed by the content hash of their input audio.
+    The in-memory tier is bounded by bytes, the disk tier is .npy files.
+    """
+
+    label = "Vocals cache"
+    suffix = ".npy"
+
+    def __init__(self, directory: str = VOCALS_CACHE_DIR, max_memory_bytes: int = VOCALS_CACHE_MEMORY_BYTES,
+                 max_disk_bytes: int = VOCALS_CACHE_DISK_BYTES):
+        super().__init__(directory, max_memory_bytes, max_disk_bytes)
+
+    def put(self, key: str, vocals: np.ndarray):
+        vocals = np.ascontiguousarray(vocals, dtype=np.float32)
+        # Callers share the cached array; make accidental in-place edits fail loudly
+        vocals.flags.writeable = False
+        super().put(key, vocals)
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        with self._lock:
+            stats["memory_bytes"] = self._memory_used
+        return stats
+
+    def _memory_cost(self, vocals: np.ndarray) -> int:
+        return vocals.nbytes
+
+    def _read_file(self, path: str):
+        vocals = np.load(path)
+        vocals.flags.writeable = False
+        return vocals
+
+    def _write_file(self, f, vocals: np.ndarray):
+        np.save(f, vocals)
+
+
+vocals_cache = VocalsCache()
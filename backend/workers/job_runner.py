@@ -0,0 +1,125 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from utils.logger import logger
+
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+ANALYSIS_QUEUE_SIZE = int(os.getenv("ANALYSIS_QUEUE_SIZE", "16"))
+
+# Stages each media type goes through, used to compute progress
+PIPELINE_STAGES = {
+    "image": ["media", "vision", "fusion", "explainability"],
+    "audio": ["media", "audio", "fusion", "explainability"],
+    "video": ["media", "vision", "audio", "temporal", "lipsync", "fusion", "explainability"],
+}
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobProgress:
+    """Tracks per-stage progress of a job and mirrors it into the job store"""
+
+    def __init__(self, job_id: str, store):
+        self.job_id = job_id
+        self.store = store
+        self.status = "queued"
+        self.stages = {"media": "pending"}
+        self.started_at = None
+        self._lock = threading.Lock()
+        self._save()
+
+    def set_media_type(self, media_type: str):
+        with self._lock:
+            for stage in PIPELINE_STAGES.get(media_type, []):
+                self.stages.setdefault(stage, "pending")
+        self._save()
+
+    @contextmanager
+    def stage(self, name: str):
+        self._mark(name, "running")
+        try:
+            yield
+        except Exception:
+            self._mark(name, "error")
+            raise
+        self._mark(name, "done")
+
+    def start(self):
+        with self._lock:
+            self.status = "running"
+            self.started_at = time.time()
+        self._save()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            done = sum(1 for s in self.stages.values() if s == "done")
+            running = [name for name, s in self.stages.items() if s == "running"]
+            return {
+                "job_id": self.job_id,
+                "status": self.status,
+                "stage": running[0] if running else None,
+                "stages": dict(self.stages),
+                "progress": round(done / len(self.stages), 3) if self.stages else 0.0,
+            }
+
+    def _mark(self, name: str, state: str):
+        with self._lock:
+            self.stages[name] = state
+        self._save()
+
+    def _save(self):
+        if self.store is not None:
+            self.store[self.job_id] = self.snapshot()
+
+
+class JobRunner:
+    """Runs analysis jobs on a bounded thread pool so they never block the event loop"""
+
+    def __init__(self, max_workers: int = ANALYSIS_WORKERS, max_queue: int = ANALYSIS_QUEUE_SIZE):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis")
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedule fn on the pool; raises JobQueueFull when all worker and queue slots are taken"""
+        if not self._slots.acquire(blocking=False):
+            raise JobQueueFull("Analysis queue is full, try again later")
+
+        with self._lock:
+            self._active += 1
+
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._release()
+            raise
+
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def _release(self):
+        with self._lock:
+            self._active -= 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._active,
+            }
+
+    def shutdown(self):
+        logger.info("Shutting down analysis job runner")
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+job_runner = JobRunner()
@@ -1,11 +1,10 @@
 from celery import Celery
+from celery.signals import worker_process_init
 from services.media_processor import MediaProcessor
-from services.vision_detector import VisionDetector
 from services.audio_detector import AudioDetector
-from services.temporal_detector import TemporalDetector
-from services.fusion_engine import FusionEngine
-from services.explainability import ExplainabilityEngine
+from services.registry import detector_registry
 from utils.logger import logger
+from utils.result_store import job_store
 import time
 
 celery_app = Celery(
@@ -22,23 +21,26 @@ celery_app.conf.update(
     enable_utc=True,
 )
 
-job_results = {}
+@worker_process_init.connect
+def warmup_detectors(**kwargs):
+    # Build and warm the detectors once per worker process, not per task
+    detector_registry.warmup()
 
 @celery_app.task(name="analyze_media")
 def analyze_media_task(job_id: str, media_url: str, content_type: str):
     start_time = time.time()
+    processor = MediaProcessor()
     
     try:
         logger.info(f"Starting analysis for job {job_id}")
         
-        processor = MediaProcessor()
         media_data = processor.process(media_url, content_type)
         
         modality_scores = {}
         explainability_data = {}
         
         if media_data["type"] in ["image", "video"]:
-            vision_detector = VisionDetector()
+            vision_detector = detector_registry.vision
             vision_result = vision_detector.detect(media_data)
             modality_scores["vision"] = vision_result["score"]
             explainability_data["heatmap"] = vision_result.get("heatmap")
@@ -51,7 +53,7 @@ def analyze_media_task(job_id: str, media_url: str, content_type: str):
             explainability_data["audio_inconsistencies"] = audio_result.get("inconsistencies")
         
         if media_data["type"] == "video":
-            temporal_detector = TemporalDetector()
+            temporal_detector = detector_registry.temporal
             temporal_result = temporal_detector.detect(media_data)
             modality_scores["temporal"] = temporal_result["score"]
             explainability_data["anomalies_timeline"] = temporal_result.get("timeline")
@@ -59,12 +61,12 @@ def analyze_media_task(job_id: str, media_url: str, content_type: str):
         modality_scores["metadata"] = media_data.get("metadata_score", 0.5)
         explainability_data["metadata_flags"] = media_data.get("metadata_flags", [])
         
-        fusion_engine = FusionEngine()
+        fusion_engine = detector_registry.fusion
         final_score, label = fusion_engine.fuse(modality_scores, media_data["type"])
         
         risk_level = "Low" if final_score < 0.3 else ("Medium" if final_score < 0.7 else "High")
         
-        explainability_engine = ExplainabilityEngine()
+        explainability_engine = detector_registry.explainability
         enhanced_explainability = explainability_engine.enhance(
             explainability_data,
             modality_scores,
@@ -84,7 +86,7 @@ def analyze_media_task(job_id: str, media_url: str, content_type: str):
             "processing_time_ms": processing_time
         }
         
-        job_results[job_id] = result
+        job_store[job_id] = result
         
         logger.info(f"Analysis complete for job {job_id}: {label} ({final_score:.2f})")
         
@@ -92,8 +94,10 @@ def analyze_media_task(job_id: str, media_url: str, content_type: str):
     
     except Exception as e:
         logger.error(f"Error analyzing job {job_id}: {str(e)}")
-        job_results[job_id] = {"status": "error", "error": str(e)}
+        job_store[job_id] = {"status": "error", "error": str(e)}
         raise
+    finally:
+        processor.cleanup()
 
 def get_job_result(job_id: str):
-    return job_results.get(job_id)
+    return job_store.get(job_id)
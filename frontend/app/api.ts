@@ -129,11 +129,57 @@ export function normalizeAnalysisResult(raw: any): AnalysisResult {
   };
 }
 
+// WebCrypto has no incremental digest, so the whole file is read into memory;
+// above this size we skip the lookup and just upload.
+const DIGEST_MAX_BYTES = 512 * 1024 * 1024;
+
+export async function sha256Hex(file: File): Promise<string | null> {
+  if (file.size > DIGEST_MAX_BYTES || typeof crypto === "undefined" || !crypto.subtle) {
+    return null;
+  }
+  try {
+    const digest = await crypto.subtle.digest("SHA-256", await file.arrayBuffer());
+    return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, "0")).join("");
+  } catch {
+    return null;
+  }
+}
+
+export async function lookupAnalysis(
+  sha256: string,
+  contentType: string,
+  mode: "user" | "guest",
+): Promise<AnalysisResult | null> {
+  try {
+    const res = await http.post(
+      `/analyze/lookup${mode === "user" ? "?mode=user" : ""}`,
+      { sha256, content_type: contentType || "application/octet-stream" },
+      { withCredentials: true },
+    );
+    return normalizeAnalysisResult(res.data);
+  } catch (error: any) {
+    // A miss (404) or an older backend without the endpoint: fall back to uploading
+    if (error?.response?.status === 429) throw error;
+    return null;
+  }
+}
+
 export async function analyzeMedia(
   file: File,
   mode: "user" | "guest",
   onProgress?: (progress: number) => void,
+  digest?: Promise<string | null>,
 ): Promise<AnalysisResult> {
+  // Already-analyzed content is answered from the server cache without uploading it
+  const sha256 = digest ? await digest : await sha256Hex(file);
+  if (sha256) {
+    const cached = await lookupAnalysis(sha256, file.type, mode);
+    if (cached) {
+      onProgress?.(100);
+      return cached;
+    }
+  }
+
   const form = new FormData();
   form.append("file", file);
 
@@ -6,7 +6,7 @@ import { useRouter } from "next/navigation";
 import { motion, AnimatePresence } from "framer-motion";
 import { ArrowRight, Eye, FileWarning, X, Trash2 } from "lucide-react";
 
-import { analyzeMedia } from "@/app/api";
+import { analyzeMedia, sha256Hex } from "@/app/api";
 import { UploadDropzone } from "@/components/UploadDropzone";
 import { MediaPreview } from "@/components/MediaPreview";
 import { Button } from "@/components/ui/button";
@@ -31,6 +31,8 @@ export default function UploadPage() {
   const [showPreview, setShowPreview] = React.useState(false);
   const [uploadProgress, setUploadProgress] = React.useState(0);
   const [analysisProgress, setAnalysisProgress] = React.useState(0);
+  // Hashing starts on selection so the cache lookup is ready by the time Analyze is clicked
+  const digestRef = React.useRef<Promise<string | null> | null>(null);
   const { session, refresh } = useSessions();
   console.log({ session });
   // Clean up Object URLs to prevent memory leaks
@@ -45,9 +47,14 @@ export default function UploadPage() {
       const actualSession = await getSession();
 
       setUploadProgress(0);
-      return analyzeMedia(f, actualSession ? "user" : "guest", (progress) => {
-        setUploadProgress(progress);
-      });
+      return analyzeMedia(
+        f,
+        actualSession ? "user" : "guest",
+        (progress) => {
+          setUploadProgress(progress);
+        },
+        digestRef.current ?? undefined,
+      );
     },
     onSuccess: (result) => {
       try {
@@ -89,6 +96,7 @@ export default function UploadPage() {
 
   const handleFileSelected = React.useCallback((f: File) => {
     setFile(f);
+    digestRef.current = sha256Hex(f);
     setMediaUrl((prev) => {
       if (prev) URL.revokeObjectURL(prev);
       return URL.createObjectURL(f);
@@ -196,6 +204,7 @@ export default function UploadPage() {
                             size="icon"
                             onClick={() => {
                               setFile(null);
+                              digestRef.current = null;
                               if (mediaUrl) URL.revokeObjectURL(mediaUrl);
                               setMediaUrl(null);
                             }}